@@ -32,7 +32,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'documents.middleware.StaticFilesMiddleware',  # WhiteNoise, совместимый с ASGI
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -101,16 +101,100 @@ DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY', '')
 DEEPSEEK_API_URL = os.getenv('DEEPSEEK_API_URL', 'https://api.deepseek.com/v1')
 DEEPSEEK_MODEL = os.getenv('DEEPSEEK_MODEL', 'deepseek-chat')
 DEEPSEEK_MAX_RETRIES = int(os.getenv('DEEPSEEK_MAX_RETRIES', 3))
-DEEPSEEK_TIMEOUT = int(os.getenv('DEEPSEEK_TIMEOUT', 30))
+DEEPSEEK_TIMEOUT = int(os.getenv('DEEPSEEK_TIMEOUT', 30))  # Таймаут чтения ответа (сек)
+DEEPSEEK_CONNECT_TIMEOUT = float(os.getenv('DEEPSEEK_CONNECT_TIMEOUT', 5))  # Таймаут подключения (сек)
+DEEPSEEK_POOL_SIZE = int(os.getenv('DEEPSEEK_POOL_SIZE', 10))  # Keep-alive соединений в пуле процесса
+DEEPSEEK_ASYNC_POOL_SIZE = int(os.getenv('DEEPSEEK_ASYNC_POOL_SIZE', 100))  # Соединений асинхронного клиента (ASGI)
+DEEPSEEK_BACKOFF_BASE = float(os.getenv('DEEPSEEK_BACKOFF_BASE', 0.5))  # Базовая задержка повтора (сек)
+DEEPSEEK_BACKOFF_MAX = float(os.getenv('DEEPSEEK_BACKOFF_MAX', 10))  # Макс. задержка повтора, включая Retry-After (сек)
 
 # Настройки ИИ
 AI_CONFIG = {
     'CACHE_TIMEOUT': timedelta(hours=int(os.getenv('AI_CACHE_HOURS', 24))),
-    'MAX_TOKENS': int(os.getenv('AI_MAX_TOKENS', 4000)),
+    'MAX_TOKENS': int(os.getenv('AI_MAX_TOKENS', 4000)),  # Макс. токенов ответа
+    'MAX_INPUT_TOKENS': int(os.getenv('AI_MAX_INPUT_TOKENS', 6000)),  # Бюджет промпта; для шаблона - не больше ai_max_length
     'TEMPERATURE': float(os.getenv('AI_TEMPERATURE', 0.7)),
     'DOCUMENT_TEMPERATURE': float(os.getenv('AI_DOCUMENT_TEMPERATURE', 0.3)),
+    'CACHE_MAX_ENTRIES': int(os.getenv('AI_CACHE_MAX_ENTRIES', 5000)),  # Макс. число ответов в общем кэше
+    # Сколько хранить ответ после CACHE_TIMEOUT: отдается сразу и обновляется в фоне, при сбое API - вместо ошибки
+    'STALE_TIMEOUT': timedelta(hours=int(os.getenv('AI_STALE_HOURS', 168))),
 }
 
+# Общее для всех воркеров хранилище (SQLite): кэш ответов ИИ и др.
+SHARED_STORE_PATH = os.getenv('SHARED_STORE_PATH', str(BASE_DIR / 'shared_store.sqlite3'))
+SHARED_STORE_MAX_ENTRIES = int(os.getenv('SHARED_STORE_MAX_ENTRIES', 10000))  # По умолчанию на пространство имен
+
+# История AI-запросов: запись пачками в фоновом потоке
+AI_HISTORY_BUFFERED = os.getenv('AI_HISTORY_BUFFERED', 'True') == 'True'  # False - писать сразу в запросе
+AI_HISTORY_BATCH_SIZE = int(os.getenv('AI_HISTORY_BATCH_SIZE', 100))
+AI_HISTORY_FLUSH_INTERVAL = float(os.getenv('AI_HISTORY_FLUSH_INTERVAL', 1.0))  # Макс. задержка записи (сек)
+AI_HISTORY_MAX_QUEUE = int(os.getenv('AI_HISTORY_MAX_QUEUE', 10000))  # Сверх лимита записи отбрасываются
+AI_HISTORY_RETENTION_DAYS = int(os.getenv('AI_HISTORY_RETENTION_DAYS', 30))  # Старше - только дневные сводки (rollup_ai_history)
+AI_HISTORY_PRUNE_BATCH_SIZE = int(os.getenv('AI_HISTORY_PRUNE_BATCH_SIZE', 1000))
+
+# Хранилище сгенерированных документов: документы живой сессии, к которым
+# не обращались дольше срока, тоже удаляются (cleanup_generated_documents)
+GENERATED_DOCUMENT_RETENTION_DAYS = int(os.getenv('GENERATED_DOCUMENT_RETENTION_DAYS', 7))
+
+# Объединение одинаковых одновременных запросов к ИИ (в процессе и между воркерами)
+AI_COALESCE_LEASE = float(os.getenv('AI_COALESCE_LEASE', 120))  # Макс. время блокировки запроса воркером (сек)
+AI_COALESCE_POLL_INTERVAL = float(os.getenv('AI_COALESCE_POLL_INTERVAL', 0.05))  # Опрос чужой блокировки (сек)
+AI_COALESCE_WAIT_TIMEOUT = float(os.getenv('AI_COALESCE_WAIT_TIMEOUT', 60))  # Макс. ожидание чужого запроса (сек)
+
+# Ограничение запросов к DeepSeek API на все воркеры хоста (квота сессии - DEFAULT_THROTTLE_RATES['deepseek_api'])
+AI_LIMITER_ENABLED = os.getenv('AI_LIMITER_ENABLED', 'True') == 'True'
+AI_LIMITER_MAX_IN_FLIGHT = int(os.getenv('AI_LIMITER_MAX_IN_FLIGHT', 8))  # Одновременных запросов к API
+AI_LIMITER_RATE = float(os.getenv('AI_LIMITER_RATE', 5))  # Запросов в секунду (token bucket)
+AI_LIMITER_BURST = int(os.getenv('AI_LIMITER_BURST', 10))  # Запас запросов сверх скорости
+AI_LIMITER_MAX_QUEUE = int(os.getenv('AI_LIMITER_MAX_QUEUE', 50))  # Сверх очереди запросы отклоняются сразу (429)
+AI_LIMITER_QUEUE_TIMEOUT = float(os.getenv('AI_LIMITER_QUEUE_TIMEOUT', 10))  # Макс. ожидание в очереди (сек)
+AI_LIMITER_LEASE = float(os.getenv('AI_LIMITER_LEASE', 300))  # Слот упавшего воркера освобождается через (сек)
+
+# Выключатель (circuit breaker) запросов к DeepSeek API, общий для воркеров хоста
+AI_BREAKER_ENABLED = os.getenv('AI_BREAKER_ENABLED', 'True') == 'True'
+AI_BREAKER_FAILURE_THRESHOLD = int(os.getenv('AI_BREAKER_FAILURE_THRESHOLD', 5))  # Сбоев подряд до размыкания
+AI_BREAKER_SLOW_CALL = float(os.getenv('AI_BREAKER_SLOW_CALL', 25))  # Ответ дольше (сек) считается сбоем
+AI_BREAKER_RESET_TIMEOUT = float(os.getenv('AI_BREAKER_RESET_TIMEOUT', 30))  # Пауза до пробного запроса (сек)
+AI_BREAKER_PROBE_TIMEOUT = float(os.getenv('AI_BREAKER_PROBE_TIMEOUT', 60))  # Ожидание исхода пробного запроса (сек)
+
+# Очередь фоновых заданий AI в БД (воркеры: python manage.py ai_worker)
+AI_JOB_PRIORITIES = {  # Больше - раньше; остальные действия - 0
+    'field_help': 10,
+    'optimize_appeal': 5,
+}
+AI_JOB_MAX_ATTEMPTS = int(os.getenv('AI_JOB_MAX_ATTEMPTS', 3))
+AI_JOB_RETRY_DELAY = float(os.getenv('AI_JOB_RETRY_DELAY', 5))  # Задержка первого повтора, далее x2 (сек)
+AI_JOB_RETRY_MAX_DELAY = float(os.getenv('AI_JOB_RETRY_MAX_DELAY', 120))
+AI_JOB_TTL = int(os.getenv('AI_JOB_TTL', 600))  # Не взятое воркером за это время задание просрочено (сек)
+AI_JOB_LEASE = int(os.getenv('AI_JOB_LEASE', 300))  # Задание упавшего воркера вернется в очередь через (сек)
+AI_JOB_RESULT_TTL = int(os.getenv('AI_JOB_RESULT_TTL', 86400))  # Хранение результатов (сек)
+AI_JOB_LONG_POLL = float(os.getenv('AI_JOB_LONG_POLL', 25))  # Макс. ожидание ответа ?wait= (сек)
+AI_JOB_POLL_INTERVAL = float(os.getenv('AI_JOB_POLL_INTERVAL', 0.5))  # Проверка задания при long polling (сек)
+
+# Метрики (/metrics, формат Prometheus): накапливаются в процессе, суммы по воркерам - в SHARED_STORE_PATH
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))  # Выгрузка в общее хранилище (сек)
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]
+
+# Справки по полям шаблона (/api/ai/field-help/<id>/): время кэширования в браузере до проверки ETag (сек)
+FIELD_HELP_CACHE_MAX_AGE = int(os.getenv('FIELD_HELP_CACHE_MAX_AGE', 300))
+
+# Настройки рендеринга документов
+TEMPLATE_CACHE_SIZE = int(os.getenv('TEMPLATE_CACHE_SIZE', 256))  # Макс. число скомпилированных шаблонов в кэше процесса
+TEMPLATE_SPEC_CACHE_SIZE = int(os.getenv('TEMPLATE_SPEC_CACHE_SIZE', 512))  # Макс. число разобранных схем шаблонов
+FORM_CLASS_CACHE_SIZE = int(os.getenv('FORM_CLASS_CACHE_SIZE', 256))  # Макс. число сгенерированных классов форм
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', 256))  # Макс. число готовых страниц каталога (главная, список шаблонов)
+
+# Шрифты TrueType для генерации PDF (должны содержать кириллицу).
+# Пусто - DejaVu Serif из documents/fonts/
+PDF_FONT_REGULAR = os.getenv('PDF_FONT_REGULAR', '')
+PDF_FONT_BOLD = os.getenv('PDF_FONT_BOLD', '')
+PDF_LAYOUT_CACHE_SIZE = int(os.getenv('PDF_LAYOUT_CACHE_SIZE', 4096))  # Макс. число сверстанных блоков в кэше процесса
+
+# Пакетная генерация документов
+BULK_GENERATION_WORKERS = int(os.getenv('BULK_GENERATION_WORKERS', 0))  # 0 - по числу ядер
+BULK_MAX_ROWS = int(os.getenv('BULK_MAX_ROWS', 1000))
+
 # Настройки REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
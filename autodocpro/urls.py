@@ -9,8 +9,13 @@ from documents.views import (
     TemplateListView,
     TemplateDetailView,
     download_document,
+    bulk_generate,
     document_preview,
     AIDocumentView,
+    AsyncAIDocumentView,
+    ai_job,
+    field_help,
+    prometheus_metrics,
     motion_template,
     appeal_template,
     claim_template
@@ -26,6 +31,7 @@ urlpatterns = [
         path('', TemplateListView.as_view(), name='template_list'),
         path('<int:pk>/', TemplateDetailView.as_view(), name='template_detail'),
         path('<int:pk>/preview/', document_preview, name='document_preview'),
+        path('<int:pk>/bulk/', bulk_generate, name='bulk_generate'),
         
         # Популярные шаблоны (можно вынести в отдельный файл при росте количества)
         path('motion/', motion_template, name='motion_template'),
@@ -36,10 +42,19 @@ urlpatterns = [
     # API endpoints
     path('api/', include([
         path('ai/', AIDocumentView.as_view(), name='ai_api'),
+        # Асинхронный вариант для запуска под ASGI (uvicorn autodocpro.asgi:application)
+        path('ai/async/', AsyncAIDocumentView.as_view(), name='ai_api_async'),
+        # Справки по всем полям шаблона одним ответом (ETag, Cache-Control)
+        path('ai/field-help/<int:pk>/', field_help, name='field_help'),
+        # Фоновые задания AI ("background": true): состояние и результат, ?wait=N - long polling
+        path('ai/jobs/<uuid:job_id>/', ai_job, name='ai_job'),
         # Можно добавить другие API endpoints здесь
     ])),
     
     path('download/<int:doc_id>/', download_document, name='download_document'),
+
+    # Метрики для Prometheus (суммы по всем воркерам)
+    path('metrics', prometheus_metrics, name='metrics'),
 ]
 
 # Обслуживание статических файлов в разработке
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DocumentTemplate
+from .models import DocumentTemplate, TemplateVersion
 import json
 
 def prefill_schema(modeladmin, request, queryset):
@@ -9,10 +9,22 @@ def prefill_schema(modeladmin, request, queryset):
             template.save()
 prefill_schema.short_description = "Автозаполнить fields_schema"
 
+class TemplateVersionInline(admin.TabularInline):
+    """История файла шаблона (только просмотр: версии неизменяемы)"""
+    model = TemplateVersion
+    fields = ('number', 'content_hash', 'file', 'created_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 class DocumentTemplateAdmin(admin.ModelAdmin):
     list_display = ('name', 'doc_type', 'is_active')
     list_filter = ('doc_type', 'is_active')
     search_fields = ('name', 'description')
     actions = [prefill_schema]
+    inlines = [TemplateVersionInline]
 
 admin.site.register(DocumentTemplate, DocumentTemplateAdmin)
\ No newline at end of file
@@ -0,0 +1,303 @@
+# documents/breaker.py
+"""
+Автоматический выключатель (circuit breaker) для запросов к DeepSeek API.
+
+Когда API деградирует, каждый запрос ждет полный таймаут и занимает
+воркер. Выключатель считает подряд идущие сбои (ошибки соединения,
+таймауты, 429/5xx) и медленные ответы; после failure_threshold таких
+вызовов он размыкается, и запросы к API сразу отклоняются CircuitOpenError.
+Через reset_timeout пропускается один пробный запрос (half-open):
+успех замыкает выключатель, сбой снова размыкает.
+
+Состояние хранится в файле SQLite общего хранилища, поэтому сбой,
+замеченный одним воркером, защищает все воркеры хоста. Переходы
+пишутся в журнал и в метрики, текущее состояние отдает /metrics.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .metrics import metrics
+from .sharedstore import SQLiteConnection
+
+logger = logging.getLogger('deepseek')
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS breaker_state (
+    name TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    opened_at REAL,
+    probe_until REAL
+);
+CREATE TABLE IF NOT EXISTS breaker_stats (
+    name TEXT NOT NULL,
+    stat TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, stat)
+);
+"""
+
+
+class CircuitOpenError(Exception):
+    """API недоступен: выключатель разомкнут; retry_after — когда будет пробный запрос"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(error):
+    """Сбой на стороне API (а не ошибка запроса): соединение, таймаут, 429 и 5xx"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and (
+            error.response.status_code == 429 or error.response.status_code >= 500
+        )
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class CircuitBreaker:
+    """
+    Выключатель с общим для процессов состоянием.
+    Ошибки SQLite не пробрасываются: недоступное хранилище
+    считается замкнутым выключателем.
+    """
+
+    def __init__(self, path, name='deepseek', failure_threshold=5, slow_call=25.0,
+                 reset_timeout=30.0, probe_timeout=60.0):
+        self.path = str(path)
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self._connect = SQLiteConnection(self.path, _SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _read(self, conn):
+        row = conn.execute(
+            'SELECT state, failures, opened_at, probe_until FROM breaker_state WHERE name = ?', (self.name,)
+        ).fetchone()
+        return row or (CLOSED, 0, None, None)
+
+    def _write(self, conn, state, failures, opened_at=None, probe_until=None):
+        conn.execute(
+            'INSERT OR REPLACE INTO breaker_state (name, state, failures, opened_at, probe_until) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (self.name, state, failures, opened_at, probe_until)
+        )
+
+    def _count(self, conn, stat):
+        conn.execute(
+            'INSERT INTO breaker_stats (name, stat, value) VALUES (?, ?, 1) '
+            'ON CONFLICT (name, stat) DO UPDATE SET value = value + 1',
+            (self.name, stat)
+        )
+
+    def _transition(self, conn, old, new, reason):
+        self._count(conn, f"to_{new}")
+        metrics.inc('ai_breaker_transitions_total', **{'from': old, 'to': new})
+        log = logger.info if new == CLOSED else logger.warning
+        log(f"Выключатель DeepSeek API: {old} -> {new} ({reason})")
+
+    def allow(self):
+        """
+        Можно ли обращаться к API. В разомкнутом состоянии по истечении
+        reset_timeout разрешает один пробный запрос (на все воркеры)
+        """
+        try:
+            # Замкнутое состояние (обычный случай) — без транзакции записи
+            if self._read(self._connect())[0] == CLOSED:
+                return True
+            now = time.time()
+            with self._transaction() as conn:
+                # Пробный запрос мог уже забрать другой воркер
+                state, failures, opened_at, probe_until = self._read(conn)
+                if state == CLOSED:
+                    return True
+                if (state == OPEN and now < opened_at + self.reset_timeout) or \
+                        (state == HALF_OPEN and probe_until > now):
+                    self._count(conn, 'rejected')
+                    metrics.inc('ai_breaker_rejected_total')
+                    return False
+                if state == OPEN:
+                    self._transition(conn, OPEN, HALF_OPEN, "пробный запрос")
+                self._write(conn, HALF_OPEN, failures, opened_at, now + self.probe_timeout)
+                return True
+        except sqlite3.Error as e:
+            logger.warning(f"Состояние выключателя недоступно: {str(e)}")
+            return True
+
+    def check(self):
+        """Как allow(), но при разомкнутом выключателе бросает CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(
+                "Сервис AI временно недоступен, повторите запрос позже",
+                retry_after=self.reset_timeout
+            )
+
+    @contextmanager
+    def track(self):
+        """Учитывает исход вызова API внутри блока: сбой, медленный ответ или успех"""
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.record(time.monotonic() - started, e)
+            raise
+        self.record(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def atrack(self):
+        """Асинхронный вариант track(): запись состояния не держит событийное кольцо"""
+        record = sync_to_async(self.record, thread_sensitive=False)
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            await record(time.monotonic() - started, e)
+            raise
+        await record(time.monotonic() - started)
+
+    def record(self, elapsed, error=None):
+        """Исход вызова API длительностью elapsed секунд"""
+        if error is not None:
+            if is_upstream_failure(error):
+                self.record_failure(repr(error))
+        elif elapsed > self.slow_call:
+            self.record_failure(f"медленный ответ: {elapsed:.1f} с")
+        else:
+            self.record_success()
+
+    def record_success(self):
+        try:
+            conn = self._connect()
+            state, failures, _, _ = self._read(conn)
+            if state == CLOSED and not failures:
+                return
+            with self._transaction() as conn:
+                state, failures, _, _ = self._read(conn)
+                if state != CLOSED:
+                    self._transition(conn, state, CLOSED, "API ответил")
+                self._write(conn, CLOSED, 0)
+        except sqlite3.Error as e:
+            logger.warning(f"Состояние выключателя недоступно: {str(e)}")
+
+    def record_failure(self, reason):
+        try:
+            with self._transaction() as conn:
+                state, failures, opened_at, probe_until = self._read(conn)
+                failures += 1
+                self._count(conn, 'failures')
+                if state == HALF_OPEN or (state == CLOSED and failures >= self.failure_threshold):
+                    self._transition(conn, state, OPEN, f"сбоев подряд: {failures}, последний: {reason}")
+                    self._write(conn, OPEN, failures, time.time())
+                elif state == OPEN:
+                    # Ответ запроса, начатого до размыкания
+                    self._write(conn, OPEN, failures, opened_at, probe_until)
+                else:
+                    self._write(conn, CLOSED, failures)
+        except sqlite3.Error as e:
+            logger.warning(f"Состояние выключателя недоступно: {str(e)}")
+
+    def stats(self):
+        """Состояние и счетчики переходов по всем процессам"""
+        conn = self._connect()
+        state, failures, opened_at, _ = self._read(conn)
+        counters = dict(conn.execute(
+            'SELECT stat, value FROM breaker_stats WHERE name = ?', (self.name,)
+        ).fetchall())
+        return {
+            'state': state,
+            'failures': failures,
+            'opened_at': opened_at,
+            'failures_total': counters.get('failures', 0),
+            'rejected': counters.get('rejected', 0),
+            'opened': counters.get(f"to_{OPEN}", 0),
+            'half_opened': counters.get(f"to_{HALF_OPEN}", 0),
+            'closed': counters.get(f"to_{CLOSED}", 0),
+        }
+
+    def reset(self):
+        """Замыкает выключатель и сбрасывает счетчики"""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM breaker_state WHERE name = ?', (self.name,))
+            conn.execute('DELETE FROM breaker_stats WHERE name = ?', (self.name,))
+
+
+class _NoBreaker:
+    """Заглушка при AI_BREAKER_ENABLED = False"""
+
+    def allow(self):
+        return True
+
+    def check(self):
+        pass
+
+    @contextmanager
+    def track(self):
+        yield
+
+    @asynccontextmanager
+    async def atrack(self):
+        yield
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker():
+    """Выключатель запросов к DeepSeek API (один объект на процесс, состояние — общее)"""
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            if not settings.AI_BREAKER_ENABLED:
+                _breaker = _NoBreaker()
+            else:
+                _breaker = CircuitBreaker(
+                    settings.SHARED_STORE_PATH,
+                    failure_threshold=settings.AI_BREAKER_FAILURE_THRESHOLD,
+                    slow_call=settings.AI_BREAKER_SLOW_CALL,
+                    reset_timeout=settings.AI_BREAKER_RESET_TIMEOUT,
+                    probe_timeout=settings.AI_BREAKER_PROBE_TIMEOUT,
+                )
+        return _breaker
+
+
+def _state_gauge():
+    """Состояние выключателя для /metrics: 1 у текущего, 0 у остальных"""
+    breaker = get_breaker()
+    if not isinstance(breaker, CircuitBreaker):
+        return []
+    state = breaker.stats()['state']
+    return [({'state': name}, int(name == state)) for name in (CLOSED, OPEN, HALF_OPEN)]
+
+
+metrics.gauge('ai_breaker_state', _state_gauge)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    global _breaker
+    if setting.startswith(('AI_BREAKER_', 'SHARED_STORE_')):
+        with _breaker_lock:
+            _breaker = None
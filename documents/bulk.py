@@ -0,0 +1,323 @@
+# documents/bulk.py
+"""
+Пакетная генерация документов по одному шаблону из CSV/JSONL.
+
+Строки читаются потоково, проверяются формой DynamicDocumentForm и рендерятся
+параллельно в пуле процессов. Результат отдается как ZIP-поток: в памяти
+одновременно находится только ограниченное окно документов. Кодировка и
+заголовок проверяются до начала ответа, ошибки по строкам записываются
+в manifest.json внутри архива.
+"""
+import codecs
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from .forms import DynamicDocumentForm
+from .rendering import build_form_context, build_render_context, render_document
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ('pdf', 'html')
+INPUT_FORMATS = ('csv', 'jsonl')
+
+
+class BulkInputError(ValueError):
+    """Ошибка разбора входных данных пакетной генерации"""
+
+
+def read_rows(stream, input_format):
+    """
+    Построчное чтение входных данных. Кодировка первой строки и заголовок CSV
+    проверяются сразу — до начала ответа; ошибки отдельных строк (не UTF-8,
+    неверный CSV или JSON) возвращаются вместо строки и попадают в manifest.json
+    :param stream: бинарный файловый объект
+    :param input_format: 'csv' или 'jsonl'
+    :return: генератор (номер строки, dict или BulkInputError)
+    :raises BulkInputError: неподдерживаемый формат, пустой файл, файл не
+        в UTF-8 или неверный заголовок CSV
+    """
+    if input_format not in INPUT_FORMATS:
+        raise BulkInputError(f"Неподдерживаемый формат входных данных: {input_format}")
+
+    lines = _decode_lines(stream)
+    first = next((line for line in lines if not isinstance(line, str) or line.strip()), None)
+    if first is None:
+        raise BulkInputError("Файл с данными пуст")
+    if isinstance(first, BulkInputError):
+        raise BulkInputError(f"Файл с данными должен быть в кодировке UTF-8: {first}")
+
+    if input_format == 'csv':
+        try:
+            fieldnames = next(csv.reader([first]))
+        except csv.Error as e:
+            raise BulkInputError(f"Неверная строка заголовков CSV: {e}")
+        if not any(name.strip() for name in fieldnames):
+            raise BulkInputError("В строке заголовков CSV нет названий полей")
+        return _csv_rows(lines, fieldnames)
+    return _jsonl_rows(itertools.chain([first], lines))
+
+
+def _decode_lines(stream):
+    """Строки бинарного потока в UTF-8 (без BOM); строка не в UTF-8 — BulkInputError"""
+    for number, line in enumerate(stream, start=1):
+        if number == 1:
+            line = line.removeprefix(codecs.BOM_UTF8)
+        try:
+            yield line.decode('utf-8')
+        except UnicodeDecodeError as e:
+            yield BulkInputError(f"Строка не в кодировке UTF-8 (байт {e.start + 1}): {line[:40]!r}")
+
+
+def _csv_rows(lines, fieldnames):
+    bad_lines = []
+
+    def text():
+        # Вместо строки не в UTF-8 — пустая строка, ошибка отдается вместо записи CSV
+        for line in lines:
+            if isinstance(line, BulkInputError):
+                bad_lines.append(line)
+                line = '\n'
+            yield line
+
+    reader = csv.reader(text())
+    index = 0
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            bad_lines.clear()
+            index += 1
+            yield index, BulkInputError(f"Неверная строка CSV: {e}")
+            continue
+        if bad_lines:
+            error = bad_lines[0]
+            bad_lines.clear()
+            index += 1
+            yield index, error
+            continue
+        if not row:
+            continue
+        index += 1
+        yield index, {key: value for key, value in zip(fieldnames, row) if key}
+
+
+def _jsonl_rows(lines):
+    index = 0
+    for line in lines:
+        if isinstance(line, BulkInputError):
+            index += 1
+            yield index, line
+            continue
+        if not line.strip():
+            continue
+        index += 1
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield index, BulkInputError(f"Неверный JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield index, BulkInputError("Строка JSONL должна быть объектом")
+            continue
+        yield index, row
+
+
+def get_bulk_workers(workers=None):
+    """Число процессов для рендеринга (по умолчанию - число ядер)"""
+    workers = workers or getattr(settings, 'BULK_GENERATION_WORKERS', 0)
+    return workers or os.cpu_count() or 1
+
+
+# --- Рендеринг в процессах пула -------------------------------------------
+
+_worker_state = {}
+
+
+def _init_worker(source, doc_type, name):
+    """Инициализация процесса пула: настройка Django и компиляция шаблона один раз"""
+    import django
+    django.setup()
+    from django.template import Template
+    _worker_state.update(template=Template(source), doc_type=doc_type, name=name)
+
+
+def _render_in_worker(context_data, output_format):
+    from django.template import Context
+    html = _worker_state['template'].render(
+        Context(build_render_context(_worker_state['doc_type'], context_data))
+    )
+    return _encode_output(html, output_format, _worker_state['name'])
+
+
+def _encode_output(html, output_format, name):
+    if output_format == 'pdf':
+        from .utils import render_document_to_pdf
+        return render_document_to_pdf(html, name)
+    return html.encode('utf-8')
+
+
+class _InlineFuture:
+    """Результат рендеринга без пула процессов (workers=1)"""
+
+    def __init__(self, fn, *args):
+        try:
+            self._result, self._error = fn(*args), None
+        except Exception as e:
+            self._result, self._error = None, e
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+# --- ZIP-поток --------------------------------------------------------------
+
+class _ZipStream:
+    """
+    Файловый объект без seek/tell: zipfile пишет записи с дескрипторами данных,
+    а накопленные байты забираются после каждого документа
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def generate_zip(template, rows, output_format='pdf', workers=None, max_rows=None):
+    """
+    Пакетная генерация документов в ZIP-поток
+    :param template: Объект DocumentTemplate
+    :param rows: итерируемое (номер строки, dict или исключение), см. read_rows
+    :param output_format: 'pdf' или 'html'
+    :param workers: число процессов рендеринга (при workers > 1 запрос платит
+        за запуск пула, см. _generate_zip_chunks)
+    :param max_rows: ограничение на число строк
+    :return: генератор байтовых фрагментов ZIP-архива
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise BulkInputError(f"Неподдерживаемый формат вывода: {output_format}")
+
+    workers = get_bulk_workers(workers)
+    max_rows = max_rows or getattr(settings, 'BULK_MAX_ROWS', 1000)
+
+    # Исходник шаблона читаем сразу, чтобы ошибка возникла до начала ответа
+    source = None
+    if workers > 1:
+        with open(template.template_file.path, 'r', encoding='utf-8') as f:
+            source = f.read()
+    return _generate_zip_chunks(template, rows, output_format, workers, max_rows, source)
+
+
+def _generate_zip_chunks(template, rows, output_format, workers, max_rows, source):
+    compression = zipfile.ZIP_STORED if output_format == 'pdf' else zipfile.ZIP_DEFLATED
+
+    manifest = {
+        'template_id': template.pk,
+        'template_name': template.name,
+        'format': output_format,
+        'total_rows': 0,
+        'generated': 0,
+        'errors': [],
+        'truncated': False,
+    }
+
+    executor = None
+    if source is not None:
+        # Пул создается на запрос: процесс spawn запускает интерпретатор и django.setup()
+        # (порядка секунды на процесс), зато каждый процесс компилирует только этот
+        # шаблон и не наследует соединения родителя. Для пакетов из нескольких строк
+        # стоит ограничить BULK_GENERATION_WORKERS или передать workers=1
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(source, template.doc_type, template.name),
+        )
+
+    def submit(context):
+        if executor is not None:
+            return executor.submit(_render_in_worker, context, output_format)
+        return _InlineFuture(
+            lambda: _encode_output(render_document(template, context), output_format, template.name)
+        )
+
+    stream = _ZipStream()
+    pending = deque()
+    # Окно документов в работе: память не растет с числом строк
+    window = workers * 2
+
+    def write_result(index, future, archive):
+        filename = f"{index:05d}_{template.doc_type}.{output_format}"
+        try:
+            content = future.result()
+        except Exception as e:
+            logger.error(f"Ошибка рендеринга строки {index}: {str(e)}")
+            manifest['errors'].append({'row': index, 'errors': {'__all__': [str(e)]}})
+            return
+        archive.writestr(filename, content, compress_type=compression)
+        manifest['generated'] += 1
+
+    try:
+        with zipfile.ZipFile(stream, 'w') as archive:
+            for index, row in rows:
+                if manifest['total_rows'] >= max_rows:
+                    manifest['truncated'] = True
+                    break
+                manifest['total_rows'] += 1
+
+                if isinstance(row, Exception):
+                    manifest['errors'].append({'row': index, 'errors': {'__all__': [str(row)]}})
+                    continue
+
+                form = DynamicDocumentForm(row, template=template)
+                if not form.is_valid():
+                    manifest['errors'].append({'row': index, 'errors': form.errors.get_json_data()})
+                    continue
+
+                pending.append((index, submit(build_form_context(template, form.cleaned_data))))
+                while len(pending) >= window:
+                    write_result(*pending.popleft(), archive)
+                    chunk = stream.drain()
+                    if chunk:
+                        yield chunk
+
+            while pending:
+                write_result(*pending.popleft(), archive)
+                chunk = stream.drain()
+                if chunk:
+                    yield chunk
+
+            archive.writestr(
+                'manifest.json',
+                json.dumps(manifest, ensure_ascii=False, indent=2, default=str),
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+        yield stream.drain()
+        logger.info(
+            f"Пакетная генерация по шаблону {template.pk}: "
+            f"{manifest['generated']} из {manifest['total_rows']}, ошибок {len(manifest['errors'])}"
+        )
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,81 @@
+# documents/catalogue.py
+"""
+Версия каталога шаблонов, общая для всех воркеров хоста.
+
+Увеличивается после фиксации транзакции, в которой шаблон сохранен или
+удален (documents/signals.py). Данные процесса, построенные по всему
+каталогу (поисковый индекс, готовые страницы списка шаблонов), сравнивают
+с ней свою версию: чтение — один SELECT по первичному ключу в файле SQLite
+общего хранилища.
+"""
+import logging
+import sqlite3
+import threading
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .sharedstore import SQLiteConnection
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalogue_version (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+class CatalogueVersion:
+    """
+    Счетчик изменений каталога в SQLite.
+    Ошибки SQLite не пробрасываются: get() возвращает None, и данные
+    процесса проверяются по БД при каждом обращении
+    """
+
+    def __init__(self, path, name='templates'):
+        self.path = str(path)
+        self.name = name
+        self._connect = SQLiteConnection(self.path, _SCHEMA)
+
+    def get(self):
+        """Текущая версия (0 — каталог не менялся с создания хранилища) или None"""
+        try:
+            row = self._connect().execute(
+                'SELECT version FROM catalogue_version WHERE name = ?', (self.name,)
+            ).fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error as e:
+            logger.warning(f"Версия каталога недоступна: {str(e)}")
+            return None
+
+    def bump(self):
+        try:
+            self._connect().execute(
+                'INSERT INTO catalogue_version (name, version) VALUES (?, 1) '
+                'ON CONFLICT (name) DO UPDATE SET version = version + 1',
+                (self.name,)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось обновить версию каталога: {str(e)}")
+
+
+_catalogue = None
+_catalogue_lock = threading.Lock()
+
+
+def get_catalogue_version():
+    """Версия каталога шаблонов (один объект на процесс, значение — общее)"""
+    global _catalogue
+    with _catalogue_lock:
+        if _catalogue is None:
+            _catalogue = CatalogueVersion(settings.SHARED_STORE_PATH)
+        return _catalogue
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    global _catalogue
+    if setting.startswith('SHARED_STORE_'):
+        with _catalogue_lock:
+            _catalogue = None
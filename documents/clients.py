@@ -0,0 +1,364 @@
+# documents/clients.py
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger('deepseek')
+
+
+class _RetryPolicy:
+    """
+    Повторы запросов к DeepSeek API с экспоненциальной задержкой и джиттером.
+
+    Повторяются ошибки подключения и ответы 408/429/5xx. Таймаут чтения
+    не повторяется: запрос уже мог быть обработан, а повтор удвоил бы ожидание.
+    """
+    RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+    def __init__(self, base_url, max_retries=3, backoff_base=0.5, backoff_max=10):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def _retry_delay(self, response, attempt):
+        """
+        Задержка перед повтором после ответа с кодом из RETRY_STATUSES
+        или None, если повторять не нужно
+        """
+        if attempt == self.max_retries:
+            return None
+        retry_after = self._retry_after(response)
+        if retry_after is not None and retry_after > self.backoff_max:
+            # Сервер просит ждать дольше допустимого — не занимаем воркер
+            return None
+        delay = retry_after if retry_after is not None else self._backoff(attempt)
+        logger.warning(
+            f"DeepSeek API ответил {response.status_code}, "
+            f"попытка {attempt + 1}/{self.max_retries}, повтор через {delay:.2f} с"
+        )
+        return delay
+
+    def _backoff(self, attempt):
+        """Экспоненциальная задержка с полным джиттером"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(response):
+        """Значение заголовка Retry-After в секундах (число или HTTP-дата)"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class DeepSeekClient(_RetryPolicy):
+    """
+    HTTP-клиент DeepSeek API: пул keep-alive соединений, раздельные таймауты
+    на подключение и чтение, повторы по _RetryPolicy
+    """
+
+    def __init__(self, base_url, api_key='', pool_size=10, max_retries=3,
+                 connect_timeout=5, read_timeout=30, backoff_base=0.5, backoff_max=10):
+        super().__init__(base_url, max_retries, backoff_base, backoff_max)
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def post(self, endpoint, payload, timeout=None, stream=False):
+        """
+        POST-запрос к API с повторами
+        Args:
+            endpoint (str): Конечная точка API (например, 'chat/completions')
+            payload (dict): Тело запроса
+            timeout (tuple, optional): (таймаут подключения, таймаут чтения) в секундах
+            stream (bool): Не читать тело ответа сразу (для потоковых ответов)
+        Returns:
+            requests.Response: успешный ответ
+        Raises:
+            requests.exceptions.RequestException: если попытки исчерпаны
+        """
+        url = f"{self.base_url}/{endpoint}"
+        timeout = timeout or self.timeout
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout, stream=stream)
+            except requests.exceptions.ConnectionError as e:
+                # ConnectTimeout — подкласс ConnectionError, ReadTimeout — нет
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Ошибка соединения с DeepSeek API ({e}), повтор через {delay:.2f} с")
+                time.sleep(delay)
+                continue
+
+            if response.status_code in self.RETRY_STATUSES:
+                delay = self._retry_delay(response, attempt)
+                if delay is not None:
+                    response.close()
+                    time.sleep(delay)
+                    continue
+
+            if stream and response.status_code >= 400:
+                # Тело ошибки читается сразу (оно нужно обработчикам HTTPError),
+                # и соединение потокового ответа возвращается в пул
+                response.content
+                response.close()
+            response.raise_for_status()
+            return response
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncResponse:
+    """
+    Ответ асинхронного клиента с интерфейсом requests.Response, нужным сервисам.
+    У потокового ответа (stream=True) тело читается через aiter_lines()
+    """
+
+    def __init__(self, response, read_timeout, content=None):
+        self._response = response
+        self.read_timeout = read_timeout
+        self.url = str(response.url)
+        self.status_code = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.content = content
+
+    async def aiter_lines(self):
+        """Строки тела потокового ответа по мере поступления"""
+        try:
+            with _translate_errors(self.read_timeout):
+                async for line in self._response.content:
+                    yield line.rstrip(b'\r\n').decode('utf-8')
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        """Освобождает соединение потокового ответа (дочитанное возвращается в пул)"""
+        self._response.release()
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            kind = 'Client' if self.status_code < 500 else 'Server'
+            raise requests.exceptions.HTTPError(
+                f"{self.status_code} {kind} Error: {self.reason} for url: {self.url}",
+                response=self
+            )
+
+
+@contextmanager
+def _translate_errors(read_timeout):
+    """Ошибки aiohttp как исключения requests, которые обрабатывают сервисы"""
+    try:
+        yield
+    except aiohttp.ConnectionTimeoutError as e:
+        raise requests.exceptions.ConnectTimeout(f"Таймаут подключения: {e}") from e
+    except (aiohttp.SocketTimeoutError, asyncio.TimeoutError) as e:
+        raise requests.exceptions.ReadTimeout(f"Таймаут чтения ответа ({read_timeout} с)") from e
+    except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as e:
+        # Ошибки подключения, обрыв соединения и неполное тело ответа
+        raise requests.exceptions.ConnectionError(f"Ошибка соединения: {e!r}") from e
+
+
+class AsyncDeepSeekClient(_RetryPolicy):
+    """
+    Асинхронный клиент DeepSeek API на aiohttp: одно событийное кольцо
+    обслуживает сотни запросов в ожидании ответа без занятых потоков,
+    соединения keep-alive берутся из пула aiohttp (не больше pool_size).
+    Ошибки те же, что у DeepSeekClient (исключения requests).
+    Сессия aiohttp создается при первом запросе — в событийном кольце клиента.
+    """
+
+    def __init__(self, base_url, api_key='', pool_size=100, max_retries=3,
+                 connect_timeout=5, read_timeout=30, backoff_base=0.5, backoff_max=10):
+        super().__init__(base_url, max_retries, backoff_base, backoff_max)
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                # Таймаут чтения — на каждое чтение из сокета, как у requests
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout,
+                                              sock_read=self.read_timeout),
+            )
+        return self._session
+
+    async def post(self, endpoint, payload, timeout=None, stream=False):
+        """
+        POST-запрос к API с повторами
+        Args:
+            timeout (tuple, optional): (таймаут подключения, таймаут чтения) в секундах,
+                по умолчанию — таймауты клиента
+            stream (bool): Не читать тело успешного ответа сразу (для потоковых ответов)
+        Returns:
+            AsyncResponse: успешный ответ
+        Raises:
+            requests.exceptions.RequestException: если попытки исчерпаны
+        """
+        url = f"{self.base_url}/{endpoint}"
+        body = json.dumps(payload).encode('utf-8')
+        connect_timeout, read_timeout = timeout or (self.connect_timeout, self.read_timeout)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._send(url, body, stream, connect_timeout, read_timeout)
+            except requests.exceptions.ConnectionError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Ошибка соединения с DeepSeek API ({e}), повтор через {delay:.2f} с")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code in self.RETRY_STATUSES:
+                delay = self._retry_delay(response, attempt)
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                    continue
+
+            response.raise_for_status()
+            return response
+
+    async def _send(self, url, body, stream, connect_timeout, read_timeout):
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=read_timeout)
+        with _translate_errors(read_timeout):
+            response = await self.session.post(url, data=body, timeout=timeout)
+            if stream and response.status < 400:
+                # Соединение теперь принадлежит ответу
+                return AsyncResponse(response, read_timeout)
+            # Тело читается сразу: соединение возвращается в пул
+            try:
+                content = await response.read()
+            finally:
+                response.release()
+        return AsyncResponse(response, read_timeout, content)
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Общий для процесса клиент DeepSeek API"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DeepSeekClient(
+                    base_url=settings.DEEPSEEK_API_URL,
+                    api_key=settings.DEEPSEEK_API_KEY,
+                    pool_size=settings.DEEPSEEK_POOL_SIZE,
+                    max_retries=settings.DEEPSEEK_MAX_RETRIES,
+                    connect_timeout=settings.DEEPSEEK_CONNECT_TIMEOUT,
+                    read_timeout=settings.DEEPSEEK_TIMEOUT,
+                    backoff_base=settings.DEEPSEEK_BACKOFF_BASE,
+                    backoff_max=settings.DEEPSEEK_BACKOFF_MAX,
+                )
+    return _client
+
+
+# Асинхронные клиенты привязаны к событийному кольцу, в котором созданы
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """Асинхронный клиент DeepSeek API для текущего событийного кольца"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncDeepSeekClient(
+            base_url=settings.DEEPSEEK_API_URL,
+            api_key=settings.DEEPSEEK_API_KEY,
+            pool_size=settings.DEEPSEEK_ASYNC_POOL_SIZE,
+            max_retries=settings.DEEPSEEK_MAX_RETRIES,
+            connect_timeout=settings.DEEPSEEK_CONNECT_TIMEOUT,
+            read_timeout=settings.DEEPSEEK_TIMEOUT,
+            backoff_base=settings.DEEPSEEK_BACKOFF_BASE,
+            backoff_max=settings.DEEPSEEK_BACKOFF_MAX,
+        )
+    return client
+
+
+async def aclose_async_client():
+    """Закрывает асинхронный клиент текущего событийного кольца (перед остановкой кольца)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def reset_client():
+    """
+    Закрывает клиент процесса; следующий вызов get_client() создаст новый.
+    Асинхронные клиенты закрываются в своих событийных кольцах и пересоздаются
+    при следующем обращении
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        for loop, client in list(_async_clients.items()):
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        _async_clients.clear()
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    # Позволяет направить клиент на локальный stub-сервер через override_settings
+    if setting.startswith('DEEPSEEK_'):
+        reset_client()
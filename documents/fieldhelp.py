@@ -0,0 +1,82 @@
+# documents/fieldhelp.py
+"""
+Индекс справок по полям шаблонов (FieldHelp).
+
+Справка по полю зависит только от шаблона и описания поля в fields_schema,
+поэтому генерируется заранее командой build_field_help, а запрос справки
+обслуживается выборкой по уникальному индексу (template, field_name).
+"""
+import hashlib
+import json
+from django.conf import settings
+from django.db.models import Count, Max
+from .models import FieldHelp
+from .specs import get_template_spec
+
+
+def field_schema_hash(template, field_meta):
+    """Хэш данных, от которых зависит справка: тип и категория документа, название шаблона, описание поля"""
+    canonical = json.dumps(
+        {
+            'doc_type': template.doc_type,
+            'category': template.category,
+            'template': template.name,
+            'field': field_meta,
+        },
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def get_stored_field_help(template, field_meta):
+    """Справка из индекса или None, если ее нет или описание поля с тех пор изменилось"""
+    stored = FieldHelp.objects.filter(
+        template=template,
+        field_name=field_meta['name'],
+        schema_hash=field_schema_hash(template, field_meta)
+    ).first()
+    return stored.as_dict() if stored is not None else None
+
+
+def store_field_help(template, field_meta, help_data):
+    """Сохраняет справку в индекс, заменяя прежнюю запись поля"""
+    FieldHelp.objects.update_or_create(
+        template=template,
+        field_name=field_meta['name'],
+        defaults={
+            'schema_hash': field_schema_hash(template, field_meta),
+            'model_used': settings.DEEPSEEK_MODEL,
+            **help_data,
+        }
+    )
+
+
+def get_template_field_help(template, names=None):
+    """
+    Справки по всем полям шаблона (или по полям из names) одним запросом к БД.
+    Returns:
+        tuple: ({поле: справка с подписью поля}, [поля без актуальной справки])
+    """
+    fields = [
+        field for field in get_template_spec(template).fields
+        if field.get('name') and (names is None or field['name'] in names)
+    ]
+    stored = {
+        row.field_name: row
+        for row in FieldHelp.objects.filter(template=template, field_name__in=[field['name'] for field in fields])
+    }
+    help_by_field, missing = {}, []
+    for field in fields:
+        row = stored.get(field['name'])
+        if row is None or row.schema_hash != field_schema_hash(template, field):
+            missing.append(field['name'])
+            continue
+        help_by_field[field['name']] = {'label': field.get('label', field['name']), **row.as_dict()}
+    return help_by_field, missing
+
+
+def field_help_version(template):
+    """Версия справок шаблона: меняется при сохранении шаблона и при перегенерации справок"""
+    stats = FieldHelp.objects.filter(template=template).aggregate(count=Count('id'), updated=Max('updated_at'))
+    updated = stats['updated'].timestamp() if stats['updated'] else 0
+    return f"{template.pk}.{template.revision}.{stats['count']}.{updated:.6f}"
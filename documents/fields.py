@@ -0,0 +1,60 @@
+# documents/fields.py
+"""
+JSON в сжатом виде для больших и редко читаемых данных (история AI-запросов).
+
+Значение хранится в текстовой колонке: короткий JSON — как есть (сжатие не
+окупается), длинный — 'z' + base64 от zlib. JSON не начинается с 'z', поэтому
+форматы не путаются, а строки, записанные до перевода поля с JSONField,
+читаются как обычный JSON. Колонка текстовая, а не двоичная: перевод
+существующей колонки JSONField выполняется обычным AlterField (в PostgreSQL
+jsonb приводится к text, к bytea — нет).
+"""
+import base64
+import json
+import zlib
+from django.db import models
+
+_ZLIB = 'z'
+
+
+class CompressedJSONField(models.TextField):
+    """JSON-значение, сжатое zlib; в Python — те же dict/list, что у JSONField"""
+
+    def __init__(self, *args, encoder=None, min_length=256, level=6, **kwargs):
+        self.encoder = encoder
+        self.min_length = min_length
+        self.level = level
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.encoder is not None:
+            kwargs['encoder'] = self.encoder
+        if self.min_length != 256:
+            kwargs['min_length'] = self.min_length
+        if self.level != 6:
+            kwargs['level'] = self.level
+        return name, path, args, kwargs
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        raw = json.dumps(value, cls=self.encoder, ensure_ascii=False, separators=(',', ':'))
+        if len(raw) < self.min_length:
+            return raw
+        return _ZLIB + base64.b64encode(zlib.compress(raw.encode('utf-8'), self.level)).decode('ascii')
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, (dict, list)):
+            return value
+        if value[:1] == _ZLIB:
+            return json.loads(zlib.decompress(base64.b64decode(value[1:])))
+        # Короткое значение или запись JSONField до перевода поля на сжатое хранение
+        return json.loads(value)
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj), cls=self.encoder, ensure_ascii=False)
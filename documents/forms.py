@@ -1,52 +1,49 @@
 # documents/forms.py
 from django import forms
+from django.conf import settings
 from django.utils.safestring import mark_safe
-import json
+from .caching import LRUCache
+from .metrics import metrics
+from .specs import get_template_spec
+
+# Классы форм шаблонов, ключ: (id шаблона, ревизия)
+form_class_cache = LRUCache(maxsize=getattr(settings, 'FORM_CLASS_CACHE_SIZE', 256))
+
 
 class DynamicDocumentForm(forms.Form):
+    """
+    Форма документа по схеме шаблона.
+
+    DynamicDocumentForm(data, template=template) возвращает экземпляр класса формы,
+    сгенерированного для этой ревизии шаблона: поля объявлены в классе один раз,
+    и при создании экземпляра выполняется только привязка данных.
+    """
+
+    def __new__(cls, *args, **kwargs):
+        if cls is DynamicDocumentForm:
+            cls = get_form_class(kwargs['template'])
+        return super().__new__(cls)
+
     def __init__(self, *args, **kwargs):
-        self.template = kwargs.pop('template')
+        self.template = kwargs.pop('template', None)
         super().__init__(*args, **kwargs)
-        self._build_form_fields()
-
-    def _build_form_fields(self):
-        """Создает поля формы на основе схемы шаблона"""
-        # Обработка fields_schema (может быть строкой или словарем)
-        if isinstance(self.template.fields_schema, str):
-            try:
-                fields_schema = json.loads(self.template.fields_schema)
-            except json.JSONDecodeError:
-                fields_schema = {'fields': []}
-        else:
-            fields_schema = self.template.fields_schema
-            
-        # Обычные поля
-        for field in fields_schema.get('fields', []):
-            self._add_form_field(field)
-        
-        # Динамические блоки
-        if hasattr(self.template, 'dynamic_blocks'):
-            dynamic_blocks = self.template.dynamic_blocks
-            if isinstance(dynamic_blocks, str):
-                try:
-                    dynamic_blocks = json.loads(dynamic_blocks)
-                except json.JSONDecodeError:
-                    dynamic_blocks = []
-            
-            for block in dynamic_blocks:
-                for field in block.get('fields', []):
-                    field_name = f"dynamic_{block['id']}_{field['name']}"
-                    self._add_form_field({
-                        **field,
-                        'name': field_name,
-                        'label': f"{block['title']} - {field['label']}"
-                    })
-
-    def _add_form_field(self, field_config):
-        """Добавляет одно поле в форму"""
+
+    @classmethod
+    def build_fields(cls, template):
+        """Создает поля формы на основе разобранной схемы шаблона"""
+        ai_enhancement = getattr(template, 'ai_enhancement', False)
+        # Обычные поля, затем поля динамических блоков
+        return {
+            field['name']: cls._build_field(field, ai_enhancement)
+            for field in get_template_spec(template).form_fields
+        }
+
+    @staticmethod
+    def _build_field(field_config, ai_enhancement=False):
+        """Создает одно поле формы"""
         field_name = field_config['name']
         field_type = field_config.get('type', 'text')
-        
+
         field_params = {
             'label': field_config.get('label', field_name),
             'required': field_config.get('required', True),
@@ -62,15 +59,15 @@ class DynamicDocumentForm(forms.Form):
             field_params['widget'] = forms.Select(choices=choices, attrs={'class': 'form-select'})
         else:
             field_params['widget'] = forms.TextInput(attrs={'class': 'form-control'})
-        
-        self.fields[field_name] = forms.CharField(**field_params)
-        
-        if hasattr(self.template, 'ai_enhancement') and self.template.ai_enhancement:
-            self._add_ai_button(field_name)
-
-    def _add_ai_button(self, field_name):
-        """Добавляет кнопку AI-помощи к полю"""
-        help_text = self.fields[field_name].help_text or ''
+
+        if ai_enhancement:
+            field_params['help_text'] = DynamicDocumentForm._ai_help_text(field_name, field_params['help_text'])
+
+        return forms.CharField(**field_params)
+
+    @staticmethod
+    def _ai_help_text(field_name, help_text):
+        """Добавляет кнопку AI-помощи к подсказке поля"""
         ai_button = (
             '<div class="mt-2">'
             '<button type="button" class="btn btn-sm btn-outline-primary btn-ai-help" '
@@ -79,4 +76,50 @@ class DynamicDocumentForm(forms.Form):
             '</button>'
             '</div>'
         )
-        self.fields[field_name].help_text = mark_safe(f"{help_text}{ai_button}")
\ No newline at end of file
+        return mark_safe(f"{help_text or ''}{ai_button}")
+
+
+class _SharedFields(dict):
+    """
+    Поля класса формы, общие для всех экземпляров.
+    BaseForm копирует base_fields через deepcopy при каждом создании формы;
+    поля шаблонов не изменяются после построения класса, поэтому достаточно
+    поверхностной копии словаря.
+    """
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+
+def build_form_class(template):
+    """Генерирует подкласс DynamicDocumentForm с объявленными полями шаблона"""
+    with metrics.timer('form_build_seconds'):
+        attrs = {
+            '__module__': __name__,
+            'template_id': template.pk,
+            'revision': getattr(template, 'revision', 0),
+            **DynamicDocumentForm.build_fields(template),
+        }
+        form_class = type(DynamicDocumentForm)(f'DocumentTemplate{template.pk}Form', (DynamicDocumentForm,), attrs)
+        form_class.base_fields = _SharedFields(form_class.base_fields)
+        return form_class
+
+
+def get_form_class(template):
+    """Класс формы для ревизии шаблона из кэша процесса"""
+    if template.pk is None:
+        return build_form_class(template)
+
+    key = (template.pk, getattr(template, 'revision', 0))
+    form_class = form_class_cache.get(key)
+    metrics.inc('form_class_cache_total', result='miss' if form_class is None else 'hit')
+    if form_class is None:
+        form_class = build_form_class(template)
+        invalidate_form_class(template.pk)
+        form_class_cache.set(key, form_class)
+    return form_class
+
+
+def invalidate_form_class(template_id):
+    """Удаляет из кэша классы форм всех ревизий шаблона"""
+    return form_class_cache.invalidate(lambda key: key[0] == template_id)
@@ -0,0 +1,231 @@
+# documents/generated.py
+"""
+Хранилище сгенерированных документов с адресацией по содержимому.
+
+Документ определяется хэшем версии шаблона и канонического JSON контекста
+(ключи по порядку, без пробелов): одинаково заполненная форма дает тот же
+хэш, и повторный запрос отдается из хранилища без рендеринга. HTML хранится
+в GeneratedDocument.document_content, PDF — файлом generated/<хэш>.pdf,
+общим для всех сессий с этим хэшем. Одинаковые рендеры, выполняемые
+одновременно (двойной клик, несколько воркеров), объединяются через
+single flight.
+
+Запись GeneratedDocument — документ сессии: очистка (cleanup_documents,
+команда cleanup_generated_documents) удаляет документы истекших сессий и
+давно не запрашиваемые, вычисляет хэш документов, сохраненных до хранения
+по хэшу, затем удаляет PDF, на которые не осталось записей.
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .metrics import metrics
+from .models import GeneratedDocument
+from .rendering import get_example_version, render_document
+from .singleflight import get_single_flight
+from .utils import render_document_to_pdf
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DIR = 'generated'
+
+# Движки сессий с таблицей django_session: по ней видно, жива ли сессия
+DB_SESSION_ENGINES = ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db')
+
+
+def canonical_context(context):
+    """Контекст документа в каноническом JSON: одинаковые данные — одинаковая строка"""
+    return json.dumps(context or {}, cls=DjangoJSONEncoder, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+def template_version(template):
+    """
+    Версия шаблона для хэша документа: тип документа, версия файла шаблона
+    и название (заголовок PDF)
+    """
+    return f"{get_example_version(template)}:{template.name}"
+
+
+def document_hash(template, canonical):
+    return hashlib.sha256(f"{template_version(template)}\n{canonical}".encode('utf-8')).hexdigest()
+
+
+def pdf_name(digest):
+    return f"{STORAGE_DIR}/{digest[:2]}/{digest}.pdf"
+
+
+def get_document(template, context, session_key, format='html'):
+    """
+    Документ по шаблону и контексту из хранилища или после рендеринга
+    (с сохранением в хранилище и привязкой к сессии session_key)
+    :return: str (HTML) или bytes (PDF)
+    """
+    canonical = canonical_context(context)
+    digest = document_hash(template, canonical)
+    document, _ = GeneratedDocument.objects.get_or_create(
+        session_key=session_key,
+        content_hash=digest,
+        defaults={'template': template, 'content': json.loads(canonical)},
+    )
+    html = _get_html(document, template, context)
+    if format == 'pdf':
+        return _get_pdf(document, template, html)
+    return html
+
+
+def _stored_html(digest):
+    """HTML документа, сохраненный любой сессией, или None"""
+    return GeneratedDocument.objects.filter(
+        content_hash=digest, document_content__isnull=False
+    ).values_list('document_content', flat=True).first()
+
+
+def _get_html(document, template, context):
+    updates = {'accessed_at': timezone.now()}
+    html = document.document_content
+    if html is None:
+        digest = document.content_hash
+        html = _stored_html(digest)
+        if html is None:
+            metrics.inc('generated_documents_total', format='html', result='miss')
+            html = get_single_flight('documents').do(
+                f"{digest}:html",
+                lambda: _render_html(document, template, context),
+                lambda: _stored_html(digest)
+            )
+        else:
+            metrics.inc('generated_documents_total', format='html', result='hit')
+        document.document_content = updates['document_content'] = html
+    else:
+        metrics.inc('generated_documents_total', format='html', result='hit')
+    GeneratedDocument.objects.filter(pk=document.pk).update(**updates)
+    return html
+
+
+def _render_html(document, template, context):
+    html = render_document(template, context)
+    # Сразу в БД: ожидающие этот рендер воркеры находят HTML по хэшу
+    GeneratedDocument.objects.filter(pk=document.pk).update(document_content=html)
+    return html
+
+
+def _get_pdf(document, template, html):
+    name = pdf_name(document.content_hash)
+    if default_storage.exists(name):
+        metrics.inc('generated_documents_total', format='pdf', result='hit')
+    else:
+        metrics.inc('generated_documents_total', format='pdf', result='miss')
+        get_single_flight('documents').do(
+            f"{document.content_hash}:pdf",
+            lambda: _render_pdf(name, template, html),
+            lambda: name if default_storage.exists(name) else None
+        )
+    if document.file.name != name:
+        document.file.name = name
+        GeneratedDocument.objects.filter(pk=document.pk).update(file=name)
+    with default_storage.open(name, 'rb') as f:
+        return f.read()
+
+
+def _render_pdf(name, template, html):
+    content = render_document_to_pdf(html, template.name)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(content))
+        if saved != name:
+            # Файл успел записать другой процесс: его содержимое то же
+            default_storage.delete(saved)
+    return name
+
+
+def cleanup_documents(retention_days=None, dry_run=False):
+    """
+    Удаляет документы истекших или удаленных сессий и документы, к которым
+    не обращались retention_days дней, затем PDF без записей.
+    Документы живых сессий моложе retention_days не трогаются.
+    Returns:
+        dict: удалено записей и файлов
+    """
+    if retention_days is None:
+        retention_days = settings.GENERATED_DOCUMENT_RETENTION_DAYS
+    stale = GeneratedDocument.objects.filter(accessed_at__lt=timezone.now() - timedelta(days=retention_days))
+    if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        live = Session.objects.filter(expire_date__gt=timezone.now()).values('session_key')
+        stale = stale | GeneratedDocument.objects.exclude(session_key__in=live)
+    else:
+        logger.info(f"Движок сессий {settings.SESSION_ENGINE} не хранит срок сессий в БД: "
+                    f"документы удаляются только по давности")
+
+    documents = stale.count()
+    if not dry_run:
+        stale.delete()
+    hashed, duplicates = backfill_document_hashes(dry_run)
+    documents += duplicates
+    files = _remove_orphan_files(dry_run)
+    logger.info(f"Очистка документов: записей {documents}, вычислено хэшей {hashed}, файлов PDF {files}")
+    return {'documents': documents, 'hashed': hashed, 'files': files}
+
+
+def backfill_document_hashes(dry_run=False):
+    """
+    Вычисляет хэш документов, сохраненных до хранения по хэшу (content_hash
+    пустой). Документ, хэш которого уже есть у документа той же сессии,
+    удаляется как дубликат (остается последний запрошенный). Документы
+    шаблонов без файла пропускаются: их удалит очистка по давности.
+    Returns:
+        tuple: (документов с вычисленным хэшем, удалено дубликатов)
+    """
+    legacy = GeneratedDocument.objects.filter(content_hash='').select_related('template').order_by('-accessed_at')
+    seen = set()
+    hashed = duplicates = 0
+    for document in legacy.iterator():
+        try:
+            digest = document_hash(document.template, canonical_context(document.content))
+        except FileNotFoundError:
+            continue
+        key = (document.session_key, digest)
+        duplicate = key in seen or GeneratedDocument.objects.filter(
+            session_key=document.session_key, content_hash=digest
+        ).exists()
+        if not duplicate:
+            seen.add(key)
+            if not dry_run:
+                try:
+                    with transaction.atomic():
+                        GeneratedDocument.objects.filter(pk=document.pk).update(content_hash=digest)
+                except IntegrityError:
+                    # Тот же документ успела запросить сессия
+                    duplicate = True
+        if duplicate:
+            duplicates += 1
+            if not dry_run:
+                document.delete()
+        else:
+            hashed += 1
+    return hashed, duplicates
+
+
+def _remove_orphan_files(dry_run):
+    """Удаляет файлы PDF, хэша которых нет ни у одной записи"""
+    if not default_storage.exists(STORAGE_DIR):
+        return 0
+    referenced = set(GeneratedDocument.objects.values_list('content_hash', flat=True).distinct())
+    removed = 0
+    shards, _ = default_storage.listdir(STORAGE_DIR)
+    for shard in shards:
+        _, names = default_storage.listdir(f"{STORAGE_DIR}/{shard}")
+        for filename in names:
+            digest, ext = os.path.splitext(filename)
+            if ext != '.pdf' or digest in referenced:
+                continue
+            removed += 1
+            if not dry_run:
+                default_storage.delete(f"{STORAGE_DIR}/{shard}/{filename}")
+    return removed
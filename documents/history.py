@@ -0,0 +1,250 @@
+# documents/history.py
+"""
+Отложенная запись истории запросов к AI (AIRequestHistory).
+
+Записи складываются в ограниченную очередь в памяти и сохраняются
+фоновым потоком пачками через bulk_create — по размеру пачки или по
+таймеру. Запрос к API не ждет записи в БД. При медленной БД очередь
+не растет бесконечно: сверх лимита записи отбрасываются и считаются.
+
+Старые записи сворачиваются в дневные сводки AIRequestDailyStats
+(rollup_history) и удаляются пачками (prune_history) — команда
+rollup_ai_history.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .metrics import metrics
+from .models import AIRequestDailyStats, AIRequestHistory
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryRecorder:
+    """Буфер записей AIRequestHistory с фоновым сохранением"""
+
+    def __init__(self, batch_size=100, flush_interval=1.0, max_queue=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def record(self, **fields):
+        """Ставит запись в очередь; не блокирует и безопасен в асинхронном коде"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc('history_records_total', result='dropped')
+            if self.dropped % 100 == 1:
+                logger.warning(f"Очередь истории AI-запросов заполнена, отброшено записей: {self.dropped}")
+
+    def flush(self, timeout=10):
+        """Дожидается сохранения всех записей, поставленных в очередь до вызова"""
+        if self._thread is None or self._pid != os.getpid():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+    def _ensure_started(self):
+        # После fork (gunicorn --preload) поток родителя в процессе отсутствует
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(target=self._run, name='ai-history-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch, waiters = self._collect()
+            if batch:
+                self._write(batch)
+            for done in waiters:
+                done.set()
+
+    def _collect(self):
+        """Пачка записей: ждем первую, затем добираем до batch_size или до конца интервала"""
+        batch, waiters = [], []
+        item = self._queue.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if isinstance(item, threading.Event):
+                # Запрос flush: сохраняем накопленное без ожидания
+                waiters.append(item)
+                return batch, waiters
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, waiters
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return batch, waiters
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, waiters
+
+    def _write(self, batch):
+        close_old_connections()
+        try:
+            with metrics.timer('history_write_seconds', mode='batch'):
+                AIRequestHistory.objects.bulk_create([AIRequestHistory(**fields) for fields in batch])
+            self.written += len(batch)
+            metrics.inc('history_records_total', len(batch), result='written')
+        except Exception as e:
+            self.failed += len(batch)
+            metrics.inc('history_records_total', len(batch), result='failed')
+            logger.error(f"Не удалось сохранить историю AI-запросов ({len(batch)} записей): {str(e)}")
+
+
+recorder = HistoryRecorder(
+    batch_size=getattr(settings, 'AI_HISTORY_BATCH_SIZE', 100),
+    flush_interval=getattr(settings, 'AI_HISTORY_FLUSH_INTERVAL', 1.0),
+    max_queue=getattr(settings, 'AI_HISTORY_MAX_QUEUE', 10000),
+)
+
+
+def record_history(**fields):
+    """Сохраняет запись AIRequestHistory: через буфер или сразу, если буфер выключен"""
+    if getattr(settings, 'AI_HISTORY_BUFFERED', True):
+        recorder.record(**fields)
+        return
+    with metrics.timer('history_write_seconds', mode='direct'):
+        AIRequestHistory.objects.create(**fields)
+    metrics.inc('history_records_total', result='written')
+
+
+async def arecord_history(**fields):
+    """Вариант record_history для асинхронного кода"""
+    if getattr(settings, 'AI_HISTORY_BUFFERED', True):
+        recorder.record(**fields)
+        return
+    with metrics.timer('history_write_seconds', mode='direct'):
+        await AIRequestHistory.objects.acreate(**fields)
+    metrics.inc('history_records_total', result='written')
+
+
+@atexit.register
+def _flush_on_exit():
+    recorder.flush(timeout=5)
+
+
+def _day_start(day):
+    """Начало дня day в текущем часовом поясе"""
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def _percentile(values, q):
+    """Перцентиль q (0..100) отсортированного списка по ближайшему рангу"""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+
+def rollup_history(rebuild=False):
+    """
+    Сворачивает записи завершившихся дней в AIRequestDailyStats.
+    Дни, сводка по которым уже есть, не пересчитываются (их записи
+    могли быть частично удалены), если не задан rebuild.
+    Returns:
+        int: число созданных или обновленных сводок
+    """
+    today = timezone.localdate()
+    rows = AIRequestHistory.objects.filter(created_at__lt=_day_start(today))
+    done = set()
+    if not rebuild:
+        last_day = AIRequestDailyStats.objects.aggregate(last=Max('day'))['last']
+        if last_day is not None:
+            rows = rows.filter(created_at__gte=_day_start(last_day + timedelta(days=1)))
+        done = set(AIRequestDailyStats.objects.values_list('day', 'request_type'))
+
+    groups = rows.annotate(day=TruncDate('created_at')).values('day', 'request_type').annotate(
+        requests=Count('pk'),
+        errors=Count('pk', filter=Q(is_error=True)),
+        latency_avg=Avg('processing_time'),
+        input_tokens=Sum('input_tokens', default=0),
+        output_tokens=Sum('output_tokens', default=0),
+    ).order_by('day', 'request_type')
+
+    updated = 0
+    for group in groups:
+        day, request_type = group.pop('day'), group.pop('request_type')
+        if (day, request_type) in done:
+            continue
+        latencies = list(
+            AIRequestHistory.objects.filter(
+                request_type=request_type,
+                created_at__gte=_day_start(day),
+                created_at__lt=_day_start(day + timedelta(days=1)),
+                processing_time__isnull=False,
+            ).order_by('processing_time').values_list('processing_time', flat=True)
+        )
+        AIRequestDailyStats.objects.update_or_create(
+            day=day,
+            request_type=request_type,
+            defaults={
+                **group,
+                'latency_p50': _percentile(latencies, 50),
+                'latency_p95': _percentile(latencies, 95),
+                'latency_p99': _percentile(latencies, 99),
+            }
+        )
+        updated += 1
+    return updated
+
+
+def prune_history(retention_days, batch_size=1000, pause=0.0):
+    """
+    Удаляет записи старше retention_days полных дней пачками по batch_size:
+    каждая пачка — отдельная короткая транзакция, между пачками — пауза pause,
+    чтобы удаление не блокировало запись новой истории.
+    Returns:
+        int: число удаленных записей
+    """
+    cutoff = _day_start(timezone.localdate() - timedelta(days=retention_days))
+    # Удаляются только дни со сводкой: несвернутые записи сохраняются
+    rolled_until = AIRequestDailyStats.objects.aggregate(last=Max('day'))['last']
+    if rolled_until is None:
+        return 0
+    cutoff = min(cutoff, _day_start(rolled_until + timedelta(days=1)))
+    old = AIRequestHistory.objects.filter(created_at__lt=cutoff).order_by('created_at')
+    deleted = 0
+    while True:
+        batch = list(old.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += AIRequestHistory.objects.filter(pk__in=batch).delete()[0]
+        if pause:
+            time.sleep(pause)
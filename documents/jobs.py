@@ -0,0 +1,190 @@
+# documents/jobs.py
+"""
+Очередь фоновых заданий AI в БД (модель AIJob).
+
+Долгие действия /api/ai/ с "background": true не выполняются в запросе:
+запрос ставит задание и сразу возвращает его id, задания выполняют
+процессы команды ai_worker, а клиент опрашивает /api/ai/jobs/<id>/
+(с ?wait=N — long polling). Внешний брокер не нужен: очередь работает
+везде, где работает Django.
+
+Задание берется воркером условным UPDATE (state = queued), поэтому
+одно задание не выполнят два воркера. Порядок — по приоритету, затем
+по времени постановки. Ошибки API повторяются с экспоненциальной
+задержкой до max_attempts; задание, не взятое воркером до expires_at
+(в том числе ожидающее повтора), просрочено.
+Задания упавшего воркера возвращаются в очередь по истечении аренды.
+"""
+import json
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import DatabaseError
+from django.db.models import Count, F
+from django.utils import timezone
+from .breaker import CircuitOpenError, is_upstream_failure
+from .limiter import RateLimitExceeded, limiter_session
+from .metrics import metrics
+from .models import AIJob
+from .singleflight import SingleFlightTimeout
+
+logger = logging.getLogger(__name__)
+
+
+def submit_job(action, data, client_key=''):
+    """Ставит действие в очередь; приоритет — AI_JOB_PRIORITIES[action]"""
+    now = timezone.now()
+    return AIJob.objects.create(
+        action=action,
+        payload=data,
+        priority=settings.AI_JOB_PRIORITIES.get(action, 0),
+        max_attempts=settings.AI_JOB_MAX_ATTEMPTS,
+        client_key=client_key or '',
+        run_after=now,
+        expires_at=now + timedelta(seconds=settings.AI_JOB_TTL),
+    )
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_job(worker):
+    """Следующее готовое задание, закрепленное за worker, или None"""
+    now = timezone.now()
+    candidates = AIJob.objects.filter(
+        state=AIJob.QUEUED, run_after__lte=now, expires_at__gt=now
+    ).order_by('-priority', 'created_at').values_list('pk', flat=True)[:10]
+    for job_id in candidates:
+        claimed = AIJob.objects.filter(pk=job_id, state=AIJob.QUEUED).update(
+            state=AIJob.RUNNING,
+            worker=worker,
+            started_at=now,
+            lease_until=now + timedelta(seconds=settings.AI_JOB_LEASE),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return AIJob.objects.get(pk=job_id)
+    return None
+
+
+def execute_job(job, view):
+    """
+    Выполняет задание обработчиком действия view (AIDocumentView) и
+    сохраняет ответ того же вида, что вернул бы синхронный запрос
+    """
+    started = time.perf_counter()
+    try:
+        call = view.get_handlers()[job.action](job.payload)._replace(action=job.action)
+    except (ValidationError, KeyError) as e:
+        _finish(job, AIJob.FAILED, {'status': 'error', 'message': str(e)}, 400)
+        return
+    except ObjectDoesNotExist as e:
+        # Шаблон удален после постановки задания — повтор не поможет
+        _finish(job, AIJob.FAILED, {'status': 'error', 'message': str(e)}, 404)
+        return
+
+    try:
+        with limiter_session(job.client_key or None):
+            result = getattr(view.integration, call.method)(**call.kwargs)
+    except Exception as e:
+        retryable = isinstance(e, (RateLimitExceeded, CircuitOpenError, SingleFlightTimeout)) or is_upstream_failure(e)
+        if retryable and job.attempts < job.max_attempts:
+            _retry(job, e)
+            return
+        # Тот же ответ об ошибке, что при выполнении в запросе
+        response = view._call_error_response(call, e)
+        _finish(job, AIJob.FAILED, json.loads(response.content), response.status_code)
+        view._observe(call, 'job', response.status_code, started)
+        return
+    _finish(job, AIJob.DONE, call.respond(result), 200)
+    view._observe(call, 'job', 200, started)
+
+
+def _retry(job, error):
+    delay = min(settings.AI_JOB_RETRY_DELAY * 2 ** (job.attempts - 1), settings.AI_JOB_RETRY_MAX_DELAY)
+    delay = max(delay, getattr(error, 'retry_after', None) or 0)
+    logger.warning(f"Задание {job.pk} ({job.action}), попытка {job.attempts}/{job.max_attempts}: "
+                   f"{error!r}, повтор через {delay:.0f} с")
+    requeued = AIJob.objects.filter(pk=job.pk, state=AIJob.RUNNING, worker=job.worker).update(
+        state=AIJob.QUEUED,
+        worker='',
+        lease_until=None,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    if not requeued:
+        _log_lost_lease(job)
+
+
+def _finish(job, state, result, http_status):
+    # Задание, которое дольше аренды, могли вернуть в очередь и отдать другому
+    # воркеру: его состояние и ответ не перезаписываются
+    finished = AIJob.objects.filter(pk=job.pk, state=AIJob.RUNNING, worker=job.worker).update(
+        state=state,
+        result=result,
+        http_status=http_status,
+        lease_until=None,
+        finished_at=timezone.now(),
+    )
+    if not finished:
+        _log_lost_lease(job)
+        return
+    logger.info(f"Задание {job.pk} ({job.action}): {state}, попыток {job.attempts}")
+
+
+def fail_job(job, error):
+    """
+    Завершает с ошибкой задание, выполнение которого прервало неожиданное
+    исключение (ошибка обработчика или БД). Если БД недоступна и теперь,
+    задание вернется в очередь по истечении аренды
+    """
+    logger.error(f"Задание {job.pk} ({job.action}) прервано ошибкой: {error!r}", exc_info=error)
+    try:
+        _finish(job, AIJob.FAILED, {'status': 'error', 'message': 'Внутренняя ошибка при выполнении задания'}, 500)
+    except DatabaseError as e:
+        logger.warning(f"Не удалось завершить задание {job.pk}: {str(e)}")
+
+
+def _log_lost_lease(job):
+    logger.warning(f"Задание {job.pk} ({job.action}) больше не закреплено за воркером {job.worker} "
+                   f"(истекла аренда AI_JOB_LEASE), результат попытки {job.attempts} отброшен")
+
+
+def maintain_queue():
+    """
+    Обслуживание очереди: просроченные задания, задания упавших воркеров
+    (аренда истекла), удаление старых результатов.
+    Returns:
+        dict: просрочено, возвращено в очередь, не завершено воркером, удалено
+    """
+    now = timezone.now()
+    expired = AIJob.objects.filter(state=AIJob.QUEUED, expires_at__lte=now).update(
+        state=AIJob.EXPIRED, finished_at=now
+    )
+    abandoned = AIJob.objects.filter(state=AIJob.RUNNING, lease_until__lte=now)
+    failed = abandoned.filter(attempts__gte=F('max_attempts')).update(
+        state=AIJob.FAILED,
+        result={'status': 'error', 'message': 'Воркер не завершил задание'},
+        http_status=500,
+        finished_at=now,
+    )
+    requeued = abandoned.update(state=AIJob.QUEUED, worker='', lease_until=None, run_after=now)
+    purged = AIJob.objects.filter(
+        finished_at__lte=now - timedelta(seconds=settings.AI_JOB_RESULT_TTL)
+    ).delete()[0]
+    if expired or failed or requeued:
+        logger.warning(f"Очередь заданий AI: просрочено {expired}, возвращено в очередь {requeued}, "
+                       f"не завершено воркером {failed}")
+    return {'expired': expired, 'requeued': requeued, 'failed': failed, 'purged': purged}
+
+
+def queue_stats():
+    """Число заданий по состояниям"""
+    counts = dict.fromkeys((state for state, _ in AIJob.STATES), 0)
+    for row in AIJob.objects.values('state').annotate(count=Count('pk')):
+        counts[row['state']] = row['count']
+    return counts
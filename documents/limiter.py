@@ -0,0 +1,421 @@
+# documents/limiter.py
+"""
+Ограничение запросов к DeepSeek API, общее для всех воркеров хоста.
+
+Каждый gunicorn-воркер иначе отправляет запросы независимо, и при
+нагрузке API отвечает 429, а запросы ждут до таймаута. Ограничитель
+хранит состояние в файле SQLite общего хранилища (SHARED_STORE_PATH):
+- не больше max_in_flight одновременных запросов на все воркеры
+  (слот с арендой: слоты упавшего воркера освобождаются по ее истечении);
+- скорость запросов — token bucket (rate в секунду, запас burst);
+- квота сессии — REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']['deepseek_api'];
+- запросы сверх лимита ждут в очереди (FIFO) не дольше queue_timeout,
+  при заполненной очереди и исчерпанной квоте отклоняются сразу.
+
+Ограничиваются только обращения к API: ответы из кэша и запросы,
+объединенные с уже выполняемым, слотов не занимают.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .metrics import metrics
+from .sharedstore import SQLiteConnection
+
+logger = logging.getLogger('deepseek')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS limiter_slots (
+    name TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    session TEXT,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (name, slot)
+);
+CREATE TABLE IF NOT EXISTS limiter_queue (
+    ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS limiter_queue_name ON limiter_queue (name, ticket);
+CREATE TABLE IF NOT EXISTS limiter_buckets (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (name, key)
+);
+CREATE TABLE IF NOT EXISTS limiter_stats (
+    name TEXT NOT NULL,
+    stat TEXT NOT NULL,
+    value REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, stat)
+);
+"""
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Сессия пользователя, от имени которого выполняется запрос к API
+_current_session = ContextVar('deepseek_session', default=None)
+
+
+class RateLimitExceeded(Exception):
+    """Запрос к API отклонен ограничителем; retry_after — через сколько секунд повторить"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_rate(rate):
+    """Лимит вида '5/minute' (как в DRF) -> (число запросов, период в секундах) или None"""
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    return int(count), _PERIODS[period[0]]
+
+
+@contextmanager
+def limiter_session(session):
+    """Запросы к API внутри блока учитываются в квоте сессии session"""
+    token = _current_session.set(session)
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+
+class ConcurrencyLimiter:
+    """
+    Ограничитель запросов на SQLite: слоты, token bucket, квоты сессий и очередь.
+    Каждый шаг — короткая транзакция BEGIN IMMEDIATE, поэтому решения
+    согласованы между процессами. Ошибки SQLite не пробрасываются:
+    недоступный ограничитель пропускает запросы, а не ломает их.
+    """
+
+    def __init__(self, path, name='deepseek', max_in_flight=8, rate=5.0, burst=10,
+                 session_rate=None, max_queue=50, queue_timeout=10.0, lease=300,
+                 poll_interval=0.05):
+        self.path = str(path)
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = burst
+        self.session_rate = session_rate
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._connect = SQLiteConnection(self.path, _SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @contextmanager
+    def slot(self):
+        """Слот для запроса к API; ждет в очереди или бросает RateLimitExceeded"""
+        slot = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(slot)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Асинхронный вариант slot(): ожидание в очереди не держит событийное кольцо"""
+        slot = await self.aacquire()
+        try:
+            yield
+        finally:
+            await sync_to_async(self.release, thread_sensitive=False)(slot)
+
+    def acquire(self):
+        """
+        Занимает слот: сразу или дождавшись очереди.
+        Returns:
+            str | None: идентификатор слота для release() (None — ограничитель недоступен)
+        Raises:
+            RateLimitExceeded: квота сессии исчерпана, очередь заполнена или ожидание истекло
+        """
+        session = _current_session.get()
+        ticket, deadline = self._enqueue(session)
+        if ticket is None:
+            return None
+        started = time.monotonic()
+        while True:
+            slot, wait = self._try_acquire(ticket, session, started)
+            if wait is None:
+                metrics.observe('ai_limiter_wait_seconds', time.monotonic() - started)
+                return slot
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._abandon(ticket)
+            time.sleep(min(wait, remaining))
+
+    async def aacquire(self):
+        """Асинхронный вариант acquire()"""
+        session = _current_session.get()
+        ticket, deadline = await sync_to_async(self._enqueue, thread_sensitive=False)(session)
+        if ticket is None:
+            return None
+        started = time.monotonic()
+        try_acquire = sync_to_async(self._try_acquire, thread_sensitive=False)
+        try:
+            while True:
+                slot, wait = await try_acquire(ticket, session, started)
+                if wait is None:
+                    metrics.observe('ai_limiter_wait_seconds', time.monotonic() - started)
+                    return slot
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    await sync_to_async(self._abandon, thread_sensitive=False)(ticket)
+                await asyncio.sleep(min(wait, remaining))
+        except asyncio.CancelledError:
+            # Клиент ушел, не дождавшись очереди: освобождаем место
+            await sync_to_async(self._leave, thread_sensitive=False)(ticket)
+            raise
+
+    def release(self, slot):
+        """Освобождает слот, занятый acquire()"""
+        if slot is None:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.execute('DELETE FROM limiter_slots WHERE name = ? AND slot = ?', (self.name, slot))
+        except sqlite3.Error as e:
+            logger.warning(f"Ограничитель запросов недоступен: {str(e)}")
+
+    def _enqueue(self, session):
+        """Проверка квоты сессии и постановка в очередь: (билет, срок ожидания)"""
+        now = time.time()
+        ticket = rejection = None
+        try:
+            with self._transaction() as conn:
+                self._purge(conn, now)
+                wait = 0
+                if session is not None and self.session_rate is not None:
+                    count, period = self.session_rate
+                    wait = self._take(conn, f"session:{session}", count, count / period, now)
+                queued = conn.execute(
+                    'SELECT COUNT(*) FROM limiter_queue WHERE name = ?', (self.name,)
+                ).fetchone()[0]
+                if wait:
+                    reason = 'quota'
+                    rejection = RateLimitExceeded("Превышена квота запросов к AI для сессии", retry_after=wait)
+                elif queued >= self.max_queue:
+                    reason = 'queue_full'
+                    rejection = RateLimitExceeded("Очередь запросов к AI заполнена", retry_after=self.queue_timeout)
+                else:
+                    # Билет ожидавшего воркера, который упал, удаляется вскоре после срока ожидания
+                    ticket = conn.execute(
+                        'INSERT INTO limiter_queue (name, expires_at) VALUES (?, ?)',
+                        (self.name, now + self.queue_timeout + 1)
+                    ).lastrowid
+                if rejection is not None:
+                    self._count(conn, f"rejected_{reason}")
+        except sqlite3.Error as e:
+            logger.warning(f"Ограничитель запросов недоступен, запрос не ограничивается: {str(e)}")
+            return None, None
+        if rejection is not None:
+            metrics.inc('ai_limiter_rejected_total', reason=reason)
+            raise rejection
+        return ticket, time.monotonic() + self.queue_timeout
+
+    def _try_acquire(self, ticket, session, started):
+        """
+        Выдает слот, если он свободен, впереди в очереди достаточно мест
+        и в bucket есть токен. Returns: (слот или None, пауза до следующей попытки)
+        """
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                self._purge(conn, now)
+                in_flight = conn.execute(
+                    'SELECT COUNT(*) FROM limiter_slots WHERE name = ?', (self.name,)
+                ).fetchone()[0]
+                ahead = conn.execute(
+                    'SELECT COUNT(*) FROM limiter_queue WHERE name = ? AND ticket < ?', (self.name, ticket)
+                ).fetchone()[0]
+                if in_flight + ahead >= self.max_in_flight:
+                    return None, self.poll_interval
+                wait = self._take(conn, 'rate', self.burst, self.rate, now)
+                if wait:
+                    return None, max(wait, self.poll_interval)
+                slot = uuid.uuid4().hex
+                conn.execute('DELETE FROM limiter_queue WHERE ticket = ?', (ticket,))
+                conn.execute(
+                    'INSERT INTO limiter_slots (name, slot, session, expires_at) VALUES (?, ?, ?, ?)',
+                    (self.name, slot, session, now + self.lease)
+                )
+                waited = time.monotonic() - started
+                self._count(conn, 'admitted')
+                self._count(conn, 'wait_seconds', waited)
+                conn.execute(
+                    'INSERT INTO limiter_stats (name, stat, value) VALUES (?, ?, ?) '
+                    'ON CONFLICT (name, stat) DO UPDATE SET value = MAX(value, excluded.value)',
+                    (self.name, 'wait_seconds_max', waited)
+                )
+                return slot, None
+        except sqlite3.Error as e:
+            logger.warning(f"Ограничитель запросов недоступен, запрос не ограничивается: {str(e)}")
+            return None, None
+
+    def _abandon(self, ticket):
+        """Истек срок ожидания в очереди"""
+        self._leave(ticket, 'timeouts')
+        metrics.inc('ai_limiter_rejected_total', reason='timeout')
+        raise RateLimitExceeded("Превышено время ожидания очереди запросов к AI", retry_after=self.queue_timeout)
+
+    def _leave(self, ticket, stat=None):
+        try:
+            with self._transaction() as conn:
+                conn.execute('DELETE FROM limiter_queue WHERE ticket = ?', (ticket,))
+                if stat:
+                    self._count(conn, stat)
+        except sqlite3.Error as e:
+            logger.warning(f"Ограничитель запросов недоступен: {str(e)}")
+
+    def _take(self, conn, key, capacity, refill, now):
+        """
+        Берет токен из bucket key (нет записи — bucket полон).
+        Returns: 0, если токен взят, иначе секунды до появления токена
+        """
+        row = conn.execute(
+            'SELECT tokens, updated_at FROM limiter_buckets WHERE name = ? AND key = ?', (self.name, key)
+        ).fetchone()
+        tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * refill)
+        if tokens < 1:
+            return (1 - tokens) / refill
+        conn.execute(
+            'INSERT OR REPLACE INTO limiter_buckets (name, key, tokens, updated_at) VALUES (?, ?, ?, ?)',
+            (self.name, key, tokens - 1, now)
+        )
+        return 0
+
+    def _purge(self, conn, now):
+        """Удаляет слоты и билеты с истекшей арендой и полные bucket'ы сессий"""
+        conn.execute('DELETE FROM limiter_slots WHERE name = ? AND expires_at <= ?', (self.name, now))
+        conn.execute('DELETE FROM limiter_queue WHERE name = ? AND expires_at <= ?', (self.name, now))
+        if self.session_rate is not None:
+            conn.execute(
+                "DELETE FROM limiter_buckets WHERE name = ? AND key LIKE 'session:%' AND updated_at <= ?",
+                (self.name, now - self.session_rate[1])
+            )
+
+    def _count(self, conn, stat, delta=1):
+        conn.execute(
+            'INSERT INTO limiter_stats (name, stat, value) VALUES (?, ?, ?) '
+            'ON CONFLICT (name, stat) DO UPDATE SET value = value + excluded.value',
+            (self.name, stat, delta)
+        )
+
+    def stats(self):
+        """Состояние и счетчики по всем процессам: занято слотов, длина очереди, ожидание"""
+        now = time.time()
+        conn = self._connect()
+        in_flight = conn.execute(
+            'SELECT COUNT(*) FROM limiter_slots WHERE name = ? AND expires_at > ?', (self.name, now)
+        ).fetchone()[0]
+        queue_depth = conn.execute(
+            'SELECT COUNT(*) FROM limiter_queue WHERE name = ? AND expires_at > ?', (self.name, now)
+        ).fetchone()[0]
+        counters = dict(conn.execute(
+            'SELECT stat, value FROM limiter_stats WHERE name = ?', (self.name,)
+        ).fetchall())
+        admitted = int(counters.get('admitted', 0))
+        return {
+            'in_flight': in_flight,
+            'max_in_flight': self.max_in_flight,
+            'queue_depth': queue_depth,
+            'max_queue': self.max_queue,
+            'admitted': admitted,
+            'rejected_quota': int(counters.get('rejected_quota', 0)),
+            'rejected_queue_full': int(counters.get('rejected_queue_full', 0)),
+            'timeouts': int(counters.get('timeouts', 0)),
+            'wait_seconds_total': counters.get('wait_seconds', 0.0),
+            'wait_seconds_avg': counters.get('wait_seconds', 0.0) / admitted if admitted else 0.0,
+            'wait_seconds_max': counters.get('wait_seconds_max', 0.0),
+        }
+
+    def reset(self):
+        """Освобождает все слоты, очищает очередь, bucket'ы и счетчики"""
+        with self._transaction() as conn:
+            for table in ('limiter_slots', 'limiter_queue', 'limiter_buckets', 'limiter_stats'):
+                conn.execute(f'DELETE FROM {table} WHERE name = ?', (self.name,))
+
+
+class _NoLimit:
+    """Заглушка при AI_LIMITER_ENABLED = False"""
+
+    @contextmanager
+    def slot(self):
+        yield
+
+    @asynccontextmanager
+    async def aslot(self):
+        yield
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Ограничитель запросов к DeepSeek API (один объект на процесс, состояние — общее)"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            if not settings.AI_LIMITER_ENABLED:
+                _limiter = _NoLimit()
+            else:
+                _limiter = ConcurrencyLimiter(
+                    settings.SHARED_STORE_PATH,
+                    max_in_flight=settings.AI_LIMITER_MAX_IN_FLIGHT,
+                    rate=settings.AI_LIMITER_RATE,
+                    burst=settings.AI_LIMITER_BURST,
+                    session_rate=parse_rate(
+                        settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {}).get('deepseek_api')
+                    ),
+                    max_queue=settings.AI_LIMITER_MAX_QUEUE,
+                    queue_timeout=settings.AI_LIMITER_QUEUE_TIMEOUT,
+                    lease=settings.AI_LIMITER_LEASE,
+                )
+        return _limiter
+
+
+def _gauge(stat):
+    """Показатель /metrics из stats() ограничителя (отключенный ограничитель — без значений)"""
+    def read():
+        limiter = get_limiter()
+        if not isinstance(limiter, ConcurrencyLimiter):
+            return []
+        return [({}, limiter.stats()[stat])]
+    return read
+
+
+metrics.gauge('ai_limiter_queue_depth', _gauge('queue_depth'))
+metrics.gauge('ai_limiter_in_flight', _gauge('in_flight'))
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    global _limiter
+    if setting.startswith(('AI_LIMITER_', 'SHARED_STORE_')) or setting == 'REST_FRAMEWORK':
+        with _limiter_lock:
+            _limiter = None
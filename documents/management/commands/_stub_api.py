@@ -0,0 +1,178 @@
+# documents/management/commands/_stub_api.py
+"""
+Локальная заглушка DeepSeek API для нагрузочных тестов и бенчмарков.
+Отвечает на POST /chat/completions с заданной задержкой (при stream=true —
+потоком SSE по словам), поддерживает keep-alive и считает соединения
+и одновременные запросы.
+"""
+import asyncio
+import json
+import threading
+
+
+class StubDeepSeekServer:
+    """Заглушка API в отдельном потоке со своим событийным кольцом"""
+
+    def __init__(self, latency=0.2, host='127.0.0.1', port=0, token_delay=0.02):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._writers = set()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+
+    async def _shutdown(self):
+        # Закрываем keep-alive соединения, чтобы кольцо остановилось без висящих задач
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=self.latency + 1)
+
+    def reset_stats(self):
+        self.requests = self.connections = self.max_in_flight = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                self.requests += 1
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                try:
+                    await asyncio.sleep(self.latency)
+                    payload = self._parse(body)
+                    if payload.get('stream'):
+                        await self._stream(writer, payload)
+                    else:
+                        writer.write(self._response(payload))
+                        await writer.drain()
+                finally:
+                    self.in_flight -= 1
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _parse(body):
+        try:
+            payload = json.loads(body or b'{}')
+            payload['prompt'] = payload.get('messages', [{}])[-1].get('content', '')
+        except (ValueError, AttributeError, IndexError, TypeError):
+            payload = {'prompt': ''}
+        return payload
+
+    @staticmethod
+    def _content(payload):
+        if (payload.get('response_format') or {}).get('type') == 'json_object':
+            return json.dumps({
+                'help_text': f"Справка заглушки: {payload['prompt'][:80]}",
+                'examples': ["Пример заглушки"],
+                'common_mistakes': [],
+                'legal_references': [],
+            }, ensure_ascii=False)
+        return f"Ответ заглушки: {payload['prompt'][:80]}"
+
+    @staticmethod
+    def _usage(payload):
+        return {'prompt_tokens': len(payload['prompt']) // 4, 'completion_tokens': 16}
+
+    async def _stream(self, writer, payload):
+        """Ответ потоком SSE в chunked-кодировке: слово за словом с паузой token_delay"""
+        writer.write(
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: text/event-stream\r\n'
+            b'Transfer-Encoding: chunked\r\n'
+            b'\r\n'
+        )
+        words = self._content(payload).split(' ')
+        events = [
+            {'choices': [{'index': 0, 'delta': {'content': word if i == 0 else f" {word}"}, 'finish_reason': None}]}
+            for i, word in enumerate(words)
+        ]
+        events.append({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': self._usage(payload)})
+        for i, event in enumerate(events):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            self._write_chunk(writer, f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+            await writer.drain()
+        self._write_chunk(writer, "data: [DONE]\n\n")
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer, text):
+        data = text.encode('utf-8')
+        writer.write(f"{len(data):x}\r\n".encode() + data + b'\r\n')
+
+    def _response(self, payload):
+        data = json.dumps({
+            'choices': [{'message': {'role': 'assistant', 'content': self._content(payload)}}],
+            'usage': self._usage(payload),
+        }, ensure_ascii=False).encode('utf-8')
+        return (
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: application/json\r\n'
+            b'Content-Length: ' + str(len(data)).encode() + b'\r\n'
+            b'\r\n' + data
+        )
@@ -0,0 +1,31 @@
+# documents/management/commands/ai_breaker.py
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from documents.breaker import CircuitBreaker, get_breaker
+
+
+class Command(BaseCommand):
+    help = "Состояние выключателя запросов к DeepSeek API (по всем воркерам)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help="Замкнуть выключатель и сбросить счетчики")
+
+    def handle(self, *args, **options):
+        breaker = get_breaker()
+        if not isinstance(breaker, CircuitBreaker):
+            self.stdout.write("Выключатель отключен (AI_BREAKER_ENABLED = False)")
+            return
+        if options['reset']:
+            breaker.reset()
+            self.stdout.write(self.style.SUCCESS("Выключатель замкнут"))
+            return
+
+        stats = breaker.stats()
+        style = self.style.SUCCESS if stats['state'] == 'closed' else self.style.WARNING
+        self.stdout.write(style(f"Состояние: {stats['state']}, сбоев подряд: {stats['failures']}"))
+        if stats['opened_at'] and stats['state'] != 'closed':
+            self.stdout.write(f"Разомкнут: {datetime.fromtimestamp(stats['opened_at']):%Y-%m-%d %H:%M:%S}")
+        self.stdout.write(f"Переходов: в open {stats['opened']}, в half_open {stats['half_opened']}, "
+                          f"в closed {stats['closed']}")
+        self.stdout.write(f"Сбоев всего: {stats['failures_total']}, отклонено запросов: {stats['rejected']}")
@@ -0,0 +1,26 @@
+# documents/management/commands/ai_cache.py
+from django.core.management.base import BaseCommand
+from documents.services import get_response_cache
+
+
+class Command(BaseCommand):
+    help = "Статистика общего кэша ответов DeepSeek API (по всем воркерам)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true',
+                            help="Очистить кэш и сбросить счетчики")
+
+    def handle(self, *args, **options):
+        response_cache = get_response_cache()
+        if options['clear']:
+            response_cache.clear()
+            self.stdout.write(self.style.SUCCESS("Кэш ответов очищен"))
+            return
+
+        stats = response_cache.stats()
+        self.stdout.write(f"Файл: {response_cache.path}")
+        self.stdout.write(f"Записей: {stats['size']} из {stats['maxsize']}")
+        self.stdout.write(f"Попаданий: {stats['hits']}, промахов: {stats['misses']}, "
+                          f"доля попаданий: {stats['hit_rate']:.1%}")
+        self.stdout.write(f"Вытеснено: {stats['evictions']}")
+        self.stdout.write(f"Отдано устаревших ответов: {stats['stale_hits']}")
@@ -0,0 +1,30 @@
+# documents/management/commands/ai_limiter.py
+from django.core.management.base import BaseCommand
+from documents.limiter import ConcurrencyLimiter, get_limiter
+
+
+class Command(BaseCommand):
+    help = "Состояние ограничителя запросов к DeepSeek API (по всем воркерам)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help="Освободить слоты, очистить очередь и сбросить счетчики")
+
+    def handle(self, *args, **options):
+        limiter = get_limiter()
+        if not isinstance(limiter, ConcurrencyLimiter):
+            self.stdout.write("Ограничитель отключен (AI_LIMITER_ENABLED = False)")
+            return
+        if options['reset']:
+            limiter.reset()
+            self.stdout.write(self.style.SUCCESS("Ограничитель сброшен"))
+            return
+
+        stats = limiter.stats()
+        self.stdout.write(f"Запросов к API: {stats['in_flight']} из {stats['max_in_flight']}")
+        self.stdout.write(f"Очередь: {stats['queue_depth']} из {stats['max_queue']}")
+        self.stdout.write(f"Пропущено: {stats['admitted']}, ожидание в очереди: "
+                          f"в среднем {stats['wait_seconds_avg']:.3f} с, макс. {stats['wait_seconds_max']:.3f} с")
+        self.stdout.write(f"Отклонено: по квоте сессии {stats['rejected_quota']}, "
+                          f"очередь заполнена {stats['rejected_queue_full']}, "
+                          f"истекло ожидание {stats['timeouts']}")
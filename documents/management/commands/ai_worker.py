@@ -0,0 +1,83 @@
+# documents/management/commands/ai_worker.py
+import logging
+import multiprocessing
+import signal
+import time
+import django
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connections
+
+logger = logging.getLogger('documents.jobs')
+
+
+def run_worker(poll_interval, once):
+    """Цикл процесса-воркера: берет задания из очереди, пока не получит SIGTERM/SIGINT"""
+    django.setup()
+    from documents.history import recorder
+    from documents.jobs import claim_job, execute_job, fail_job, maintain_queue, worker_name
+    from documents.views import AIDocumentView
+
+    stopping = []
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stopping.append(True))
+
+    name = worker_name()
+    view = AIDocumentView()
+    maintained = 0.0
+    while not stopping:
+        close_old_connections()
+        try:
+            if time.monotonic() - maintained > 60:
+                maintain_queue()
+                maintained = time.monotonic()
+            job = claim_job(name)
+        except OperationalError as e:
+            # SQLite занята другим процессом
+            logger.warning(f"Очередь заданий AI недоступна: {str(e)}")
+            time.sleep(poll_interval)
+            continue
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        try:
+            execute_job(job, view)
+        except Exception as e:
+            # Ошибка одного задания не должна останавливать процесс: родитель его не перезапускает
+            fail_job(job, e)
+    # Дочерний процесс завершается без atexit: дописываем историю запросов сами
+    recorder.flush()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Процессы-воркеры очереди фоновых заданий AI (модель AIJob)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help="Число процессов-воркеров")
+        parser.add_argument('--poll-interval', type=float, default=0.5,
+                            help="Пауза при пустой очереди (сек)")
+        parser.add_argument('--once', action='store_true',
+                            help="Выполнить готовые задания и завершиться")
+
+    def handle(self, *args, **options):
+        processes = max(options['processes'], 1)
+        # Соединения с БД не передаются дочерним процессам
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=run_worker, args=(options['poll_interval'], options['once']),
+                                    name=f"ai-worker-{index}")
+            for index in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Запущено воркеров: {processes}")
+
+        # Ctrl+C получает вся группа процессов; SIGTERM передаем воркерам сами
+        signal.signal(signal.SIGTERM, lambda *args: [worker.terminate() for worker in workers])
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for worker in workers:
+            worker.join()
+        self.stdout.write(self.style.SUCCESS("Воркеры остановлены"))
@@ -0,0 +1,120 @@
+# documents/management/commands/benchmark_ai_async.py
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from documents.clients import aclose_async_client
+from documents.history import recorder
+from documents.models import AIRequestHistory
+from ._stub_api import StubDeepSeekServer
+
+STUB_MODEL = 'benchmark-stub'
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный тест AI API на локальной заглушке DeepSeek: "
+            "синхронные воркеры (/api/ai/) против асинхронного пути (/api/ai/async/)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 100, 500],
+                            help="Число одновременных клиентов")
+        parser.add_argument('--rounds', type=int, default=2,
+                            help="Запросов на одного клиента")
+        parser.add_argument('--latency', type=float, default=0.2,
+                            help="Задержка ответа заглушки (сек)")
+        parser.add_argument('--sync-workers', type=int, default=4,
+                            help="Число синхронных воркеров (как у gunicorn)")
+        parser.add_argument('--pool', type=int, default=500,
+                            help="Размер пула соединений асинхронного клиента")
+
+    def handle(self, *args, **options):
+        self._counter = 0
+        with StubDeepSeekServer(latency=options['latency']) as stub, \
+                tempfile.TemporaryDirectory() as tmp, \
+                override_settings(
+                    DEEPSEEK_API_URL=stub.url,
+                    DEEPSEEK_API_KEY='stub',
+                    DEEPSEEK_MODEL=STUB_MODEL,
+                    DEEPSEEK_ASYNC_POOL_SIZE=options['pool'],
+                    SHARED_STORE_PATH=f"{tmp}/store.sqlite3",
+                    # Измеряется клиент: слоты и квоты ограничителя скрыли бы разницу
+                    AI_LIMITER_ENABLED=False,
+                ):
+            try:
+                self._run(stub, options)
+            finally:
+                recorder.flush()
+                AIRequestHistory.objects.filter(model_used=STUB_MODEL).delete()
+
+    def _run(self, stub, options):
+        workers = options['sync_workers']
+        self.stdout.write(
+            f"Задержка API {options['latency'] * 1000:.0f} мс, синхронных воркеров: {workers}. "
+            f"Все запросы уровня поступают сразу; p95 - от поступления до ответа\n"
+        )
+        self.stdout.write(
+            f"{'клиентов':>9} {'запросов':>9} | {'sync, rps':>10} {'p95, мс':>9} | "
+            f"{'async, rps':>10} {'p95, мс':>9} {'в полете':>9}"
+        )
+        for concurrency in options['concurrency']:
+            total = concurrency * options['rounds']
+
+            sync_rps, sync_p95 = self._run_sync(total, min(concurrency, workers))
+            stub.reset_stats()
+            async_rps, async_p95 = asyncio.run(self._run_async(total, concurrency))
+
+            self.stdout.write(
+                f"{concurrency:>9} {total:>9} | {sync_rps:>10.1f} {sync_p95:>9.0f} | "
+                f"{async_rps:>10.1f} {async_p95:>9.0f} {stub.max_in_flight:>9}"
+            )
+
+    def _payload(self):
+        # Уникальный текст: каждый запрос проходит мимо кэша до заглушки
+        self._counter += 1
+        return json.dumps({
+            'action': 'generate_grounds',
+            'decision_text': f"Решение суда № {self._counter}",
+            'case_details': "Нагрузочный тест",
+        })
+
+    def _run_sync(self, total, workers):
+        payloads = [self._payload() for _ in range(total)]
+        client = Client()
+
+        started = time.perf_counter()
+
+        def send(payload):
+            response = client.post('/api/ai/', payload, content_type='application/json')
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            latencies = list(executor.map(send, payloads))
+        return total / (time.perf_counter() - started), self._p95(latencies)
+
+    async def _run_async(self, total, concurrency):
+        payloads = [self._payload() for _ in range(total)]
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        started = time.perf_counter()
+
+        async def send(payload):
+            async with semaphore:
+                response = await client.post('/api/ai/async/', payload, content_type='application/json')
+                assert response.status_code == 200, response.content
+                return time.perf_counter() - started
+
+        latencies = await asyncio.gather(*(send(payload) for payload in payloads))
+        await aclose_async_client()
+        return total / (time.perf_counter() - started), self._p95(latencies)
+
+    @staticmethod
+    def _p95(latencies):
+        if len(latencies) < 2:
+            return latencies[0] * 1000
+        return statistics.quantiles(latencies, n=20)[-1] * 1000
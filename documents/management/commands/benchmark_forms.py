@@ -0,0 +1,69 @@
+# documents/management/commands/benchmark_forms.py
+import time
+from django import forms
+from django.core.management.base import BaseCommand
+from documents.forms import DynamicDocumentForm, form_class_cache
+from documents.models import DocumentTemplate
+
+
+class Command(BaseCommand):
+    help = "Сравнение стоимости создания DynamicDocumentForm: построение полей на экземпляр и кэш классов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fields', type=int, nargs='+', default=[10, 100, 500],
+                            help="Число полей в схеме шаблона")
+        parser.add_argument('--iterations', type=int, default=200,
+                            help="Число создаваемых форм для каждого размера")
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        self.stdout.write(f"{'полей':>6} {'до, мс':>10} {'после, мс':>10} {'ускорение':>10}")
+        for count in options['fields']:
+            template = self._make_template(count)
+            data = {f'field_{i}': f'значение {i}' for i in range(count)}
+
+            before = self._measure(lambda: self._build_per_instance(template, data), iterations)
+            form_class_cache.clear()
+            DynamicDocumentForm(data, template=template)  # заполняем кэш
+            after = self._measure(lambda: DynamicDocumentForm(data, template=template), iterations)
+
+            self.stdout.write(
+                f"{count:>6} {before * 1000:>10.3f} {after * 1000:>10.3f} {before / after:>9.1f}x"
+            )
+
+    @staticmethod
+    def _make_template(count):
+        """Несохраняемый шаблон с заданным числом полей (pk задан для кэширования)"""
+        half = count // 2
+        return DocumentTemplate(
+            pk=10_000_000 + count,
+            name=f'Бенчмарк {count}',
+            doc_type='claim',
+            ai_enhancement=True,
+            fields_schema={'fields': [
+                {'name': f'field_{i}', 'label': f'Поле {i}', 'type': 'textarea' if i % 3 == 0 else 'text'}
+                for i in range(half)
+            ]},
+            dynamic_blocks=[{
+                'id': 'block',
+                'title': 'Блок',
+                'fields': [
+                    {'name': f'field_{i}', 'label': f'Поле {i}', 'type': 'text', 'required': False}
+                    for i in range(half, count)
+                ],
+            }],
+        )
+
+    @staticmethod
+    def _build_per_instance(template, data):
+        """Прежнее поведение: поля, виджеты и help_text создаются при каждом создании формы"""
+        form = forms.Form(data)
+        form.fields.update(DynamicDocumentForm.build_fields(template))
+        return form
+
+    @staticmethod
+    def _measure(factory, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            factory()
+        return (time.perf_counter() - started) / iterations
@@ -0,0 +1,90 @@
+# documents/management/commands/benchmark_listing.py
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from documents.models import DocumentTemplate
+from documents.pagination import NEXT, KeysetPaginator, encode_cursor
+
+PER_PAGE = 12
+
+
+class Command(BaseCommand):
+    help = ("Время открытия страниц списка шаблонов: OFFSET и курсор на первой и глубокой странице "
+            "(шаблоны создаются во временной транзакции и удаляются)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--templates', type=int, default=50_000,
+                            help="Число шаблонов в каталоге")
+        parser.add_argument('--page', type=int, default=500,
+                            help="Номер глубокой страницы")
+        parser.add_argument('--iterations', type=int, default=50,
+                            help="Повторов каждого запроса")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._populate(options['templates'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            listings = [
+                ("все активные", DocumentTemplate.objects.filter(is_active=True)),
+                ("категория", DocumentTemplate.objects.filter(is_active=True, category='civil')),
+                ("категория и тип", DocumentTemplate.objects.filter(is_active=True, category='civil', doc_type='claim')),
+            ]
+            self.stdout.write(f"{'выборка':<18} {'страница':>8} {'OFFSET, мс':>11} {'курсор, мс':>11}")
+            for title, queryset in listings:
+                queryset = queryset.order_by('name', 'pk')
+                for page in (1, options['page']):
+                    offset = (page - 1) * PER_PAGE
+                    if queryset[offset:offset + 1].count() == 0:
+                        self.stdout.write(f"{title:<18} {page:>8} {'нет страницы':>23}")
+                        continue
+                    cursor = self._cursor(queryset, offset)
+                    paginator = KeysetPaginator(queryset, PER_PAGE)
+                    by_offset = self._measure(lambda: list(queryset[offset:offset + PER_PAGE]), options['iterations'])
+                    by_cursor = self._measure(lambda: paginator.page(cursor).object_list, options['iterations'])
+                    self.stdout.write(f"{title:<18} {page:>8} {by_offset * 1000:>11.2f} {by_cursor * 1000:>11.2f}")
+            self._explain(listings[-1][1])
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _populate(count):
+        rng = random.Random(0)
+        categories = [code for code, _ in DocumentTemplate.LEGAL_CATEGORIES]
+        doc_types = DocumentTemplate.DOC_TYPES
+        DocumentTemplate.objects.bulk_create([
+            DocumentTemplate(
+                name=f"{label} №{rng.randrange(10 ** 6):06d}",
+                doc_type=doc_type,
+                category=rng.choice(categories),
+                description='',
+                is_active=rng.random() < 0.9,
+                template_file=f'templates/benchmark_{i}.html',
+            )
+            for i, (doc_type, label) in ((i, rng.choice(doc_types)) for i in range(count))
+        ], batch_size=1000)
+
+    @staticmethod
+    def _cursor(queryset, offset):
+        """Курсор, который ведет на страницу, начинающуюся со строки offset"""
+        if not offset:
+            return None
+        name, pk = queryset.values_list('name', 'pk')[offset - 1]
+        return encode_cursor(NEXT, [name, pk])
+
+    def _explain(self, queryset):
+        """План запроса страницы по курсору: диапазон по составному индексу без сортировки"""
+        first = KeysetPaginator(queryset, PER_PAGE).page()
+        if not first.has_next():
+            return
+        filtered = KeysetPaginator(queryset, PER_PAGE)
+        values = filtered._key(first.object_list[-1])
+        plan = filtered._bounded(values, 'gt').order_by('name', 'pk')[:PER_PAGE + 1].explain()
+        self.stdout.write(f"План запроса по курсору:\n{plan}")
+
+    @staticmethod
+    def _measure(fetch, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fetch()
+        return (time.perf_counter() - started) / iterations
@@ -0,0 +1,72 @@
+# documents/management/commands/benchmark_pdf.py
+import time
+from django.core.management.base import BaseCommand, CommandError
+from documents.models import DocumentTemplate
+from documents.pdf import get_layout_cache_stats, layout_cache, render_pdf
+from documents.rendering import get_example
+
+
+class Command(BaseCommand):
+    help = "Замер пропускной способности генерации PDF (страниц в секунду)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', type=int, action='append', dest='template_ids',
+                            help="ID шаблона (можно указать несколько раз, по умолчанию все активные)")
+        parser.add_argument('--file', action='append', dest='files',
+                            help="HTML-файл документа вместо шаблона из базы")
+        parser.add_argument('--iterations', type=int, default=100,
+                            help="Число рендерингов каждого документа")
+        parser.add_argument('--cold', action='store_true',
+                            help="Очищать кэш раскладки перед каждым рендерингом")
+
+    def handle(self, *args, **options):
+        documents = self._load_documents(options)
+        if not documents:
+            raise CommandError("Нет документов для замера: добавьте шаблоны или укажите --file")
+
+        iterations = options['iterations']
+        for name, html in documents:
+            render_pdf(html, name)  # прогрев шрифтов
+
+            pages = 0
+            total_bytes = 0
+            started = time.perf_counter()
+            for _ in range(iterations):
+                if options['cold']:
+                    layout_cache.clear()
+                pdf, page_count = render_pdf(html, name)
+                pages += page_count
+                total_bytes += len(pdf)
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(
+                f"{name}: {iterations} док., {pages} стр. за {elapsed:.2f} с — "
+                f"{pages / elapsed:.1f} стр/с, {iterations / elapsed:.1f} док/с, "
+                f"средний размер {total_bytes // iterations} байт"
+            )
+
+        stats = get_layout_cache_stats()
+        self.stdout.write(
+            f"Кэш раскладки: {stats['size']} блоков, попаданий {stats['hits']}, "
+            f"промахов {stats['misses']} ({stats['hit_rate']:.1%})"
+        )
+
+    def _load_documents(self, options):
+        documents = []
+        for path in options['files'] or []:
+            with open(path, 'r', encoding='utf-8') as f:
+                documents.append((path, f.read()))
+        if documents and not options['template_ids']:
+            return documents
+
+        templates = DocumentTemplate.objects.filter(is_active=True)
+        if options['template_ids']:
+            templates = DocumentTemplate.objects.filter(pk__in=options['template_ids'])
+        for template in templates:
+            try:
+                html, _ = get_example(template)
+            except Exception as e:
+                self.stderr.write(f"Шаблон {template.pk} пропущен: {e}")
+                continue
+            documents.append((template.name, html))
+        return documents
@@ -0,0 +1,87 @@
+# documents/management/commands/benchmark_search.py
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from documents.models import DocumentTemplate
+from documents.search import search_index, search_templates
+
+SUBJECTS = [
+    'о взыскании алиментов', 'о расторжении брака', 'о возмещении ущерба', 'о взыскании долга по договору займа',
+    'о восстановлении на работе', 'об оспаривании решения налогового органа', 'о признании права собственности',
+    'о защите прав потребителей', 'об отложении судебного заседания', 'о назначении экспертизы',
+    'об истребовании доказательств', 'о разделе совместно нажитого имущества', 'о взыскании неустойки',
+    'об обжаловании постановления', 'о признании сделки недействительной', 'о взыскании заработной платы',
+]
+DESCRIPTIONS = [
+    'Шаблон для подачи в суд общей юрисдикции', 'Подходит для арбитражного суда', 'Составлен по нормам ГПК РФ',
+    'С расчетом суммы требований', 'Для обжалования решения суда первой инстанции', 'С перечнем приложений',
+    'Исковое заявление с требованием компенсации морального вреда', 'Для трудовых и налоговых споров',
+]
+QUERIES = ['иск', 'апелляционная жалоба', 'взыскание алиментов', 'трудовой спор', 'ходатайства экспертиза', 'налоговые']
+
+
+class Command(BaseCommand):
+    help = ("Сравнение поиска шаблонов: name__icontains и поисковый индекс с учетом словоформ "
+            "(шаблоны создаются во временной транзакции и удаляются)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--templates', type=int, default=10_000,
+                            help="Число шаблонов в каталоге")
+        parser.add_argument('--iterations', type=int, default=50,
+                            help="Повторов каждого запроса")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._populate(options['templates'])
+            search_index.reset()
+            started = time.perf_counter()
+            search_templates('шаблон')
+            stats = search_index.stats()
+            self.stdout.write(f"Шаблонов: {stats['templates']}, основ: {stats['terms']}, "
+                              f"индекс построен за {time.perf_counter() - started:.2f} с")
+            self._run(options['iterations'])
+            transaction.set_rollback(True)
+        # В индексе остались шаблоны отмененной транзакции
+        search_index.reset()
+
+    @staticmethod
+    def _populate(count):
+        rng = random.Random(0)
+        doc_types = DocumentTemplate.DOC_TYPES
+        categories = [code for code, _ in DocumentTemplate.LEGAL_CATEGORIES]
+        DocumentTemplate.objects.bulk_create([
+            DocumentTemplate(
+                name=f"{label} {rng.choice(SUBJECTS)} №{i}",
+                doc_type=doc_type,
+                category=rng.choice(categories),
+                description='. '.join(rng.sample(DESCRIPTIONS, 2)),
+                template_file=f'templates/benchmark_{i}.html',
+            )
+            for i, (doc_type, label) in ((i, rng.choice(doc_types)) for i in range(count))
+        ], batch_size=1000)
+
+    def _run(self, iterations):
+        active = DocumentTemplate.objects.filter(is_active=True)
+        self.stdout.write(f"{'запрос':<26} {'icontains, мс':>14} {'найдено':>8} {'индекс, мс':>11} {'найдено':>8}")
+        for query in QUERIES:
+            before, found_before = self._measure(
+                lambda: list(active.filter(name__icontains=query).order_by('name')[:12]),
+                lambda: active.filter(name__icontains=query).count(),
+                iterations
+            )
+            after, found_after = self._measure(
+                lambda: search_templates(query, is_active=True)[:12],
+                lambda: len(search_templates(query, is_active=True)),
+                iterations
+            )
+            self.stdout.write(f"{query:<26} {before * 1000:>14.2f} {found_before:>8} "
+                              f"{after * 1000:>11.2f} {found_after:>8}")
+
+    @staticmethod
+    def _measure(first_page, total, iterations):
+        """Среднее время первой страницы результатов (12 шаблонов) и общее число найденных"""
+        started = time.perf_counter()
+        for _ in range(iterations):
+            first_page()
+        return (time.perf_counter() - started) / iterations, total()
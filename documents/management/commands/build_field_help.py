@@ -0,0 +1,98 @@
+# documents/management/commands/build_field_help.py
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from documents.breaker import CircuitOpenError
+from documents.fieldhelp import field_schema_hash, store_field_help
+from documents.limiter import RateLimitExceeded
+from documents.models import DocumentTemplate, FieldHelp
+from documents.services import DeepSeekIntegration
+from documents.singleflight import SingleFlightTimeout
+from documents.specs import get_template_spec
+
+# Повторы запроса, отклоненного ограничителем или не дождавшегося другого
+# воркера, и пауза, если срок повтора не назван
+RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_DELAY = 1.0
+
+
+class Command(BaseCommand):
+    help = ("Заранее генерирует справки по полям активных шаблонов (индекс FieldHelp): "
+            "запрос справки обслуживается из индекса без обращения к API")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', type=int, nargs='+',
+                            help="ID шаблонов (по умолчанию все активные)")
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help="Число одновременных запросов к API "
+                                 "(не больше AI_LIMITER_MAX_IN_FLIGHT при включенном ограничителе)")
+
+    def handle(self, *args, **options):
+        templates = DocumentTemplate.objects.filter(is_active=True)
+        if options['template']:
+            templates = templates.filter(pk__in=options['template'])
+
+        jobs, total, pruned = [], 0, 0
+        for template in templates:
+            fields = [field for field in get_template_spec(template).fields if field.get('name')]
+            index = FieldHelp.objects.filter(template=template)
+            # Справки удаленных из схемы полей
+            pruned += index.exclude(field_name__in=[field['name'] for field in fields]).delete()[0]
+            current = set(index.values_list('field_name', 'schema_hash'))
+            total += len(fields)
+            jobs.extend(
+                (template, field) for field in fields
+                if (field['name'], field_schema_hash(template, field)) not in current
+            )
+
+        self.stdout.write(f"Полей: {total}, актуальных справок: {total - len(jobs)}, "
+                          f"к генерации: {len(jobs)}, удалено устаревших: {pruned}")
+        started = time.perf_counter()
+        generated = failed = 0
+        concurrency = options['concurrency']
+        if settings.AI_LIMITER_ENABLED:
+            # Потоки сверх слотов ограничителя только ждали бы в общей очереди
+            concurrency = min(concurrency, settings.AI_LIMITER_MAX_IN_FLIGHT)
+        # Запросы к API - в потоках, запись в БД - в основном потоке
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            futures = {
+                executor.submit(self._generate, template, field): (template, field)
+                for template, field in jobs
+            }
+            for future in as_completed(futures):
+                template, field = futures[future]
+                try:
+                    help_data = future.result()
+                except (requests.exceptions.RequestException, RateLimitExceeded, SingleFlightTimeout,
+                        CircuitOpenError, ValueError) as e:
+                    # При разомкнутом выключателе остальные поля тоже быстро получают отказ:
+                    # справки без ошибок сохранены, повторный запуск сгенерирует недостающие
+                    failed += 1
+                    self.stderr.write(f"Шаблон {template.pk}, поле {field['name']}: {str(e)}")
+                    continue
+                store_field_help(template, field, help_data)
+                generated += 1
+
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(
+            f"Сгенерировано справок: {generated}, ошибок: {failed} "
+            f"за {time.perf_counter() - started:.1f} с"
+        ))
+
+    @staticmethod
+    def _generate(template, field):
+        """
+        Справка по полю; запрос, отклоненный ограничителем (очередь заполнена
+        запросами пользователей) или не дождавшийся того же запроса другого
+        воркера, повторяется через указанный срок. Отказ разомкнутого
+        выключателя не повторяется: API недоступен дольше, чем стоит ждать
+        """
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            try:
+                return DeepSeekIntegration.generate_field_help(template, field)
+            except (RateLimitExceeded, SingleFlightTimeout) as e:
+                if attempt == RATE_LIMIT_RETRIES:
+                    raise
+                time.sleep(e.retry_after or RATE_LIMIT_DELAY)
@@ -0,0 +1,25 @@
+# documents/management/commands/cleanup_generated_documents.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from documents.generated import cleanup_documents
+
+
+class Command(BaseCommand):
+    help = ("Удаляет сгенерированные документы истекших сессий и давно не запрашиваемые, "
+            "вычисляет хэш документов, сохраненных до хранения по хэшу, затем удаляет "
+            "файлы PDF без документов (запускать раз в сутки после clearsessions)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=settings.GENERATED_DOCUMENT_RETENTION_DAYS,
+                            help="Сколько дней хранить документы живых сессий без обращений "
+                                 "(по умолчанию GENERATED_DOCUMENT_RETENTION_DAYS)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Только посчитать, ничего не удалять")
+
+    def handle(self, *args, **options):
+        removed = cleanup_documents(options['retention_days'], dry_run=options['dry_run'])
+        verb = "Будет удалено" if options['dry_run'] else "Удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} документов: {removed['documents']}, файлов PDF: {removed['files']}; "
+            f"вычислен хэш документов, сохраненных до хранения по хэшу: {removed['hashed']}"
+        ))
@@ -0,0 +1,66 @@
+# documents/management/commands/dedupe_template_files.py
+import posixpath
+from django.core.management.base import BaseCommand
+from documents.models import DocumentTemplate, TemplateVersion
+from documents.storage import hash_from_name, template_storage
+
+TEMPLATES_DIR = 'templates'
+
+
+class Command(BaseCommand):
+    help = ("Переносит файлы шаблонов, загруженные до хранения по хэшу, в хранилище по содержимому "
+            "(одинаковые файлы становятся одним) и находит файлы, на которые не ссылается ни один "
+            "шаблон и ни одна версия")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Только показать, что будет сделано")
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help="Удалить файлы без шаблонов и версий (по умолчанию только список)")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = 0
+        for template in DocumentTemplate.objects.exclude(template_file='').order_by('pk'):
+            name = template.template_file.name
+            if hash_from_name(name) and template.content_hash:
+                continue
+            if not template_storage.exists(name):
+                self.stderr.write(f"Шаблон {template.pk}: файл {name} не найден, пропущен")
+                continue
+            if not hash_from_name(name):
+                with template_storage.open(name, 'rb') as f:
+                    new_name = name if dry_run else template_storage.save(name, f)
+                self.stdout.write(f"Шаблон {template.pk}: {name} -> {new_name}")
+                template.template_file.name = new_name
+            moved += 1
+            if not dry_run:
+                # Сохранение запишет хэш и первую версию шаблона
+                template.save()
+
+        orphans = sorted(self._files() - self._referenced())
+        for name in orphans:
+            self.stdout.write(f"Файл без шаблона: {name}")
+            if options['delete_orphans'] and not dry_run:
+                template_storage.delete(name)
+        verb = "удалено" if options['delete_orphans'] and not dry_run else "найдено"
+        self.stdout.write(self.style.SUCCESS(
+            f"Шаблонов переведено на хранение по хэшу: {moved}, файлов без шаблона {verb}: {len(orphans)}"
+        ))
+
+    @staticmethod
+    def _files():
+        """Все файлы каталога шаблонов: прежние имена и файлы по хэшу"""
+        if not template_storage.exists(TEMPLATES_DIR):
+            return set()
+        shards, names = template_storage.listdir(TEMPLATES_DIR)
+        files = {posixpath.join(TEMPLATES_DIR, name) for name in names}
+        for shard in shards:
+            _, names = template_storage.listdir(posixpath.join(TEMPLATES_DIR, shard))
+            files.update(posixpath.join(TEMPLATES_DIR, shard, name) for name in names)
+        return files
+
+    @staticmethod
+    def _referenced():
+        return (set(DocumentTemplate.objects.values_list('template_file', flat=True))
+                | set(TemplateVersion.objects.values_list('file', flat=True)))
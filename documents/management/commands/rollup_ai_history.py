@@ -0,0 +1,35 @@
+# documents/management/commands/rollup_ai_history.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from documents.history import prune_history, rollup_history
+
+
+class Command(BaseCommand):
+    help = ("Сворачивает историю AI-запросов в дневные сводки и удаляет записи "
+            "старше срока хранения (запускать раз в сутки, например из cron)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=settings.AI_HISTORY_RETENTION_DAYS,
+                            help="Сколько дней хранить исходные записи (по умолчанию AI_HISTORY_RETENTION_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=settings.AI_HISTORY_PRUNE_BATCH_SIZE,
+                            help="Записей, удаляемых одной транзакцией")
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help="Пауза между пачками удаления (сек)")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Пересчитать сводки по всем дням, записи которых еще хранятся")
+        parser.add_argument('--no-prune', action='store_true',
+                            help="Только свернуть, ничего не удалять")
+
+    def handle(self, *args, **options):
+        updated = rollup_history(rebuild=options['rebuild'])
+        self.stdout.write(f"Дневных сводок создано или обновлено: {updated}")
+        if options['no_prune']:
+            return
+        deleted = prune_history(
+            options['retention_days'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено записей старше {options['retention_days']} дн.: {deleted}"
+        ))
@@ -0,0 +1,293 @@
+# documents/metrics.py
+"""
+Метрики времени и числа операций: действия AI, рендеринг шаблонов,
+генерация PDF, построение форм, запись истории AI-запросов.
+
+Счетчики и гистограммы копятся в памяти процесса (запись метрики —
+несколько операций со словарем под блокировкой), фоновый поток раз
+в flush_interval секунд прибавляет накопленное к суммам в файле SQLite
+общего хранилища. Поэтому /metrics отдает суммы по всем воркерам хоста
+в текстовом формате Prometheus. Суммы переживают перезапуск воркеров:
+для Prometheus это монотонные счетчики.
+
+Показатели текущего состояния (gauge: очередь ограничителя, состояние
+выключателя) не копятся: их модули регистрируют функцию, которая читает
+общее для воркеров состояние при каждом запросе /metrics.
+"""
+import atexit
+import bisect
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .sharedstore import SQLiteConnection
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'autodocpro_'
+
+# Границы корзин гистограмм (сек): от попадания в кэш до ответа DeepSeek
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+COUNTER, HISTOGRAM, GAUGE = 'counter', 'histogram', 'gauge'
+
+# Имя -> (тип, описание)
+METRICS = {
+    'ai_requests_total': (COUNTER, "Запросы к действиям AI по действию, режиму и статусу ответа"),
+    'ai_request_seconds': (HISTOGRAM, "Время обработки действия AI (для потока — до первого фрагмента)"),
+    'template_cache_total': (COUNTER, "Обращения к кэшу скомпилированных шаблонов (hit/miss)"),
+    'render_seconds': (HISTOGRAM, "Время рендеринга документа по шаблону"),
+    'pdf_seconds': (HISTOGRAM, "Время генерации PDF"),
+    'form_class_cache_total': (COUNTER, "Обращения к кэшу классов форм (hit/miss)"),
+    'form_build_seconds': (HISTOGRAM, "Время построения класса формы шаблона"),
+    'history_records_total': (COUNTER, "Записи истории AI-запросов: сохранено, ошибка, отброшено"),
+    'history_write_seconds': (HISTOGRAM, "Время записи истории AI-запросов в БД (пачкой или по одной)"),
+    'page_cache_total': (COUNTER, "Обращения к кэшу страниц каталога (hit/miss)"),
+    'generated_documents_total': (COUNTER, "Документы из хранилища (hit) и отрендеренные заново (miss) по формату"),
+    'ai_limiter_wait_seconds': (HISTOGRAM, "Ожидание слота ограничителя запросов к DeepSeek API"),
+    'ai_limiter_rejected_total': (COUNTER, "Запросы, отклоненные ограничителем, по причине"),
+    'ai_limiter_queue_depth': (GAUGE, "Запросы в очереди ограничителя (все воркеры)"),
+    'ai_limiter_in_flight': (GAUGE, "Запросы к DeepSeek API в работе (все воркеры)"),
+    'ai_breaker_transitions_total': (COUNTER, "Переходы выключателя DeepSeek API между состояниями"),
+    'ai_breaker_rejected_total': (COUNTER, "Запросы, отклоненные разомкнутым выключателем"),
+    'ai_breaker_state': (GAUGE, "Состояние выключателя DeepSeek API (1 — текущее)"),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics_samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, labels)
+);
+"""
+
+
+def _format_labels(labels):
+    """Метки в синтаксисе Prometheus: a="1",b="2" (в порядке имен)"""
+    return ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса с периодической выгрузкой в общее хранилище.
+    Ошибки SQLite не пробрасываются: невыгруженные значения остаются
+    в памяти до следующей попытки.
+    """
+
+    def __init__(self, path, enabled=True, flush_interval=5.0, buckets=BUCKETS):
+        self.path = str(path)
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._connect = SQLiteConnection(self.path, _SCHEMA)
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._gauges = {}
+        self._pid = None
+        self._thread = None
+
+    def inc(self, name, value=1, **labels):
+        """Увеличивает счетчик name с метками labels"""
+        if not self.enabled:
+            return
+        self._ensure_started()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, value, **labels):
+        """Добавляет значение value (сек) в гистограмму name"""
+        if not self.enabled:
+            return
+        self._ensure_started()
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                # Число значений по корзинам (последняя — +Inf) и сумма
+                series = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def gauge(self, name, callback):
+        """
+        Регистрирует показатель name: callback() возвращает пары (метки, значение)
+        текущего состояния и вызывается при каждом render()
+        """
+        self._gauges[name] = callback
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Время выполнения блока в гистограмму name. Блок получает словарь
+        меток и может дополнить его (например, статусом ответа)
+        """
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def _ensure_started(self):
+        # После fork (gunicorn --preload) поток родителя в процессе отсутствует,
+        # а накопленные им значения уже выгружены или будут выгружены родителем
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._counters = defaultdict(float)
+            self._histograms = {}
+            self._thread = threading.Thread(target=self._run, name='metrics-flusher', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _samples(self, counters, histograms):
+        """Строки (имя, метки, прирост) для таблицы metrics_samples"""
+        for (name, labels), value in counters.items():
+            yield name, _format_labels(labels), value
+        for (name, labels), (counts, total) in histograms.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{name}_bucket", _format_labels(labels + (('le', _format_value(bound)),)), cumulative
+            yield f"{name}_sum", _format_labels(labels), total
+            yield f"{name}_count", _format_labels(labels), cumulative
+
+    def flush(self):
+        """Прибавляет накопленные процессом значения к общим суммам"""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            counters, histograms = self._counters, self._histograms
+            self._counters, self._histograms = defaultdict(float), {}
+        if not counters and not histograms:
+            return
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    'INSERT INTO metrics_samples (name, labels, value) VALUES (?, ?, ?) '
+                    'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                    list(self._samples(counters, histograms))
+                )
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось выгрузить метрики: {str(e)}")
+            self._restore(counters, histograms)
+
+    def _restore(self, counters, histograms):
+        """Возвращает невыгруженные значения в память процесса"""
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] += value
+            for key, (counts, total) in histograms.items():
+                series = self._histograms.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+
+    def render(self):
+        """Суммы по всем процессам в текстовом формате Prometheus"""
+        self.flush()
+        rows = defaultdict(list)
+        for name, labels, value in self._connect().execute('SELECT name, labels, value FROM metrics_samples'):
+            rows[name].append((labels, value))
+        if self.enabled:
+            for name, callback in self._gauges.items():
+                try:
+                    rows[name] = [(_format_labels(sorted(labels.items())), value) for labels, value in callback()]
+                except sqlite3.Error as e:
+                    logger.warning(f"Не удалось прочитать показатель {name}: {str(e)}")
+
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            series = [f"{name}_bucket", f"{name}_sum", f"{name}_count"] if kind == HISTOGRAM else [name]
+            if not any(rows.get(sample) for sample in series):
+                continue
+            lines.append(f"# HELP {PREFIX}{name} {description}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for sample in series:
+                for labels, value in sorted(rows[sample], key=_sample_order):
+                    lines.append(f"{PREFIX}{sample}{{{labels}}} {_format_value(value)}" if labels
+                                 else f"{PREFIX}{sample} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def configure(self, path, enabled=True, flush_interval=5.0):
+        """
+        Новый файл общего хранилища и параметры (при изменении настроек).
+        Накопленное процессом выгружается в прежний файл
+        """
+        self.flush()
+        with self._lock:
+            self.path = str(path)
+            self.enabled = enabled
+            self.flush_interval = flush_interval
+            self._connect = SQLiteConnection(self.path, _SCHEMA)
+
+    def reset(self):
+        """Обнуляет общие суммы (и невыгруженные значения процесса)"""
+        with self._lock:
+            self._counters, self._histograms = defaultdict(float), {}
+        conn = self._connect()
+        conn.execute('DELETE FROM metrics_samples')
+
+
+def _sample_order(row):
+    """Порядок строк: по меткам, корзины гистограммы — по возрастанию границы"""
+    labels, _ = row
+    head, sep, le = labels.rpartition('le="')
+    if not sep:
+        return labels, 0.0
+    bound = le.rstrip('"')
+    return head, math.inf if bound == '+Inf' else float(bound)
+
+
+metrics = MetricsRegistry(
+    getattr(settings, 'SHARED_STORE_PATH', 'shared_store.sqlite3'),
+    enabled=getattr(settings, 'METRICS_ENABLED', True),
+    flush_interval=getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0),
+)
+
+
+@atexit.register
+def _flush_on_exit():
+    metrics.flush()
+
+
+@receiver(setting_changed)
+def _reconfigure_on_setting_change(setting, **kwargs):
+    # Модули держат ссылку на объект metrics, поэтому он перенастраивается, а не создается заново
+    if setting == 'SHARED_STORE_PATH' or setting.startswith('METRICS_'):
+        metrics.configure(
+            getattr(settings, 'SHARED_STORE_PATH', 'shared_store.sqlite3'),
+            enabled=getattr(settings, 'METRICS_ENABLED', True),
+            flush_interval=getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0),
+        )
@@ -1,9 +1,13 @@
 import json
 import os
+import uuid
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 import jsonschema
+from .fields import CompressedJSONField
+from .storage import file_hash, get_template_storage, hash_from_name
 
 User = get_user_model()
 
@@ -30,11 +34,12 @@ class AIRequestHistory(models.Model):
         choices=REQUEST_TYPES,
         verbose_name='Тип запроса'
     )
-    request_data = models.JSONField(
+    # Промпты и ответы занимают основной объем таблицы и читаются редко — храним сжатыми
+    request_data = CompressedJSONField(
         encoder=json.JSONEncoder,
         verbose_name='Данные запроса'
     )
-    response_data = models.JSONField(
+    response_data = CompressedJSONField(
         encoder=json.JSONEncoder,
         verbose_name='Данные ответа'
     )
@@ -62,16 +67,94 @@ class AIRequestHistory(models.Model):
         null=True,
         verbose_name='Использованная модель'
     )
+    input_tokens = models.PositiveIntegerField(
+        null=True,
+        verbose_name='Токенов на входе'
+    )
+    output_tokens = models.PositiveIntegerField(
+        null=True,
+        verbose_name='Токенов на выходе'
+    )
     
     class Meta:
         verbose_name = 'История запроса AI'
         verbose_name_plural = 'История запросов AI'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='aihistory_created'),
+            models.Index(fields=['request_type', 'created_at'], name='aihistory_type_created'),
+            models.Index(fields=['is_error', 'created_at'], name='aihistory_error_created'),
+        ]
     
     def __str__(self):
         return f"{self.get_request_type_display()} - {self.created_at}"
 
 
+class AIRequestDailyStats(models.Model):
+    """
+    Сводка истории AI-запросов за день по типу запроса (команда rollup_ai_history).
+    Сводки хранятся бессрочно, исходные записи AIRequestHistory — AI_HISTORY_RETENTION_DAYS
+    """
+    day = models.DateField(
+        verbose_name='День'
+    )
+    request_type = models.CharField(
+        max_length=20,
+        verbose_name='Тип запроса'
+    )
+    requests = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Запросов'
+    )
+    errors = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ошибок'
+    )
+    latency_avg = models.FloatField(
+        null=True,
+        verbose_name='Среднее время (сек)'
+    )
+    latency_p50 = models.FloatField(
+        null=True,
+        verbose_name='Время p50 (сек)'
+    )
+    latency_p95 = models.FloatField(
+        null=True,
+        verbose_name='Время p95 (сек)'
+    )
+    latency_p99 = models.FloatField(
+        null=True,
+        verbose_name='Время p99 (сек)'
+    )
+    input_tokens = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Токенов на входе'
+    )
+    output_tokens = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Токенов на выходе'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+
+    class Meta:
+        verbose_name = 'Сводка AI-запросов за день'
+        verbose_name_plural = 'Сводки AI-запросов по дням'
+        ordering = ['-day', 'request_type']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'request_type'], name='unique_ai_daily_stats')
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.request_type}"
+
+    @property
+    def error_rate(self):
+        return self.errors / self.requests if self.requests else 0.0
+
+
 # Схема для валидации dynamic_blocks
 DYNAMIC_BLOCKS_SCHEMA = {
     "type": "array",
@@ -152,8 +235,16 @@ class DocumentTemplate(models.Model):
     )
     template_file = models.FileField(
         upload_to='templates/', 
+        storage=get_template_storage,
         verbose_name="Файл шаблона"
     )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name="Хэш файла шаблона"
+    )
     fields_schema = models.JSONField(
         default=dict,
         encoder=json.JSONEncoder,
@@ -178,15 +269,61 @@ class DocumentTemplate(models.Model):
         default=2000, 
         verbose_name="Макс. длина AI"
     )
+    revision = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Ревизия"
+    )
+    example_html = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name="Пример документа (HTML)"
+    )
+    example_context_json = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name="Контекст примера (JSON)"
+    )
+    example_version = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name="Версия примера"
+    )
 
     class Meta:
         verbose_name = "Шаблон документа"
         verbose_name_plural = "Шаблоны документов"
         ordering = ['name']
+        # Под выборки списка шаблонов и главной: активные шаблоны с фильтром
+        # по категории и/или типу в порядке названия (id - для курсора).
+        # Частичные: Django пишет is_active=True как голое условие "is_active",
+        # и SQLite не берет его как равенство для первого столбца индекса
+        indexes = [
+            models.Index(fields=['name', 'id'], condition=models.Q(is_active=True), name='template_active_name'),
+            models.Index(fields=['category', 'name', 'id'], condition=models.Q(is_active=True),
+                         name='template_category_name'),
+            models.Index(fields=['doc_type', 'name', 'id'], condition=models.Q(is_active=True),
+                         name='template_type_name'),
+            models.Index(fields=['category', 'doc_type', 'name', 'id'], condition=models.Q(is_active=True),
+                         name='template_cat_type_name'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Каждое сохранение - новая ревизия: по ней кэши процессов
+        # (разобранные схемы, формы) узнают об изменении шаблона
+        self.revision = (self.revision or 0) + 1
+        self.content_hash = file_hash(self.template_file) if self.template_file else ''
+        super().save(*args, **kwargs)
+        if self.content_hash:
+            TemplateVersion.record(self)
+
     def clean(self):
         """Валидация JSON данных в fields_schema и dynamic_blocks"""
         if isinstance(self.fields_schema, str):
@@ -207,6 +344,75 @@ class DocumentTemplate(models.Model):
             return os.path.abspath(self.template_file.path)
         return None
 
+    def get_file_version(self):
+        """
+        Версия содержимого файла шаблона для ключей кэшей: хэш содержимого.
+        Файл с прежним именем (загружен до хранения по хэшу) могут изменить
+        на месте, поэтому для него - имя, mtime и размер файла
+        :raises FileNotFoundError: если файл шаблона отсутствует
+        """
+        if self.content_hash and hash_from_name(self.template_file.name) == self.content_hash:
+            return self.content_hash
+        stat = os.stat(self.template_file.path)
+        return f"{self.template_file.name}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class TemplateVersion(models.Model):
+    """
+    Неизменяемая версия файла шаблона: новая запись при каждом изменении
+    содержимого. Файл версии хранится по хэшу и не перезаписывается
+    """
+    template = models.ForeignKey(
+        DocumentTemplate,
+        on_delete=models.CASCADE,
+        related_name='versions',
+        verbose_name="Шаблон"
+    )
+    number = models.PositiveIntegerField(
+        verbose_name="Номер версии"
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        verbose_name="Хэш файла"
+    )
+    file = models.FileField(
+        storage=get_template_storage,
+        verbose_name="Файл"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата создания"
+    )
+
+    class Meta:
+        verbose_name = "Версия шаблона"
+        verbose_name_plural = "Версии шаблонов"
+        ordering = ['template', '-number']
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'number'], name='unique_template_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.template.name} v{self.number}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Версия шаблона неизменяема")
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def record(cls, template):
+        """Новая версия, если содержимое файла отличается от последней версии шаблона"""
+        latest = cls.objects.filter(template=template).order_by('-number').first()
+        if latest is not None and latest.content_hash == template.content_hash:
+            return latest
+        return cls.objects.create(
+            template=template,
+            number=latest.number + 1 if latest else 1,
+            content_hash=template.content_hash,
+            file=template.template_file.name,
+        )
+
 
 class GeneratedDocument(models.Model):
     """
@@ -239,11 +445,37 @@ class GeneratedDocument(models.Model):
         max_length=40, 
         verbose_name="Ключ сессии"
     )
+    content_hash = models.CharField(
+        max_length=64,
+        default='',
+        editable=False,
+        verbose_name="Хэш документа",
+        help_text="SHA-256 версии шаблона и канонического JSON контекста "
+                  "(пустой у документов, сохраненных до хранения по хэшу)"
+    )
+    accessed_at = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        verbose_name="Последнее обращение"
+    )
 
     class Meta:
         verbose_name = "Сгенерированный документ"
         verbose_name_plural = "Сгенерированные документы"
         ordering = ['-created_at']
+        # Один документ на сессию; HTML и PDF одного хэша общие для всех сессий.
+        # Документы без хэша не ограничиваются: их хэш вычисляет очистка
+        constraints = [
+            models.UniqueConstraint(
+                fields=['session_key', 'content_hash'],
+                condition=~models.Q(content_hash=''),
+                name='unique_generated_document'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['content_hash'], name='generated_hash'),
+            models.Index(fields=['accessed_at'], name='generated_accessed'),
+        ]
 
     def __str__(self):
         return f"{self.template.name} - {self.created_at}"
@@ -252,4 +484,197 @@ class GeneratedDocument(models.Model):
         """Возвращает абсолютный путь к сгенерированному файлу"""
         if self.file:
             return os.path.abspath(self.file.path)
-        return None
\ No newline at end of file
+        return None
+
+
+class FieldHelp(models.Model):
+    """
+    Заранее сгенерированная справка по полю шаблона (команда build_field_help).
+    Справка зависит только от шаблона и описания поля: schema_hash - хэш
+    этих данных, при изменении поля запись считается устаревшей
+    """
+    template = models.ForeignKey(
+        DocumentTemplate,
+        on_delete=models.CASCADE,
+        related_name='field_help',
+        verbose_name="Шаблон"
+    )
+    field_name = models.CharField(
+        max_length=100,
+        verbose_name="Поле"
+    )
+    schema_hash = models.CharField(
+        max_length=64,
+        verbose_name="Хэш описания поля"
+    )
+    help_text = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Справка"
+    )
+    examples = models.JSONField(
+        default=list,
+        verbose_name="Примеры"
+    )
+    common_mistakes = models.JSONField(
+        default=list,
+        verbose_name="Типичные ошибки"
+    )
+    legal_references = models.JSONField(
+        default=list,
+        verbose_name="Ссылки на нормы права"
+    )
+    model_used = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name="Использованная модель"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата обновления"
+    )
+
+    class Meta:
+        verbose_name = "Справка по полю"
+        verbose_name_plural = "Справки по полям"
+        ordering = ['template', 'field_name']
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'field_name'], name='unique_field_help')
+        ]
+
+    def __str__(self):
+        return f"{self.template} - {self.field_name}"
+
+    def as_dict(self):
+        return {
+            'help_text': self.help_text,
+            'examples': self.examples,
+            'common_mistakes': self.common_mistakes,
+            'legal_references': self.legal_references,
+        }
+
+
+class AIJob(models.Model):
+    """
+    Фоновое задание AI (очередь в БД без внешнего брокера).
+    Задание хранит действие и данные запроса к /api/ai/ и выполняется
+    воркером (команда ai_worker); клиент опрашивает результат по id
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    EXPIRED = 'expired'
+    STATES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнено'),
+        (FAILED, 'Ошибка'),
+        (EXPIRED, 'Просрочено'),
+    ]
+    FINISHED_STATES = (DONE, FAILED, EXPIRED)
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    action = models.CharField(
+        max_length=50,
+        verbose_name='Действие'
+    )
+    payload = models.JSONField(
+        encoder=json.JSONEncoder,
+        verbose_name='Данные запроса'
+    )
+    state = models.CharField(
+        max_length=10,
+        choices=STATES,
+        default=QUEUED,
+        verbose_name='Состояние'
+    )
+    priority = models.SmallIntegerField(
+        default=0,
+        verbose_name='Приоритет'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток'
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3,
+        verbose_name='Макс. попыток'
+    )
+    result = models.JSONField(
+        null=True,
+        encoder=json.JSONEncoder,
+        verbose_name='Ответ'
+    )
+    http_status = models.PositiveSmallIntegerField(
+        null=True,
+        verbose_name='HTTP-статус ответа'
+    )
+    client_key = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Клиент (квота запросов)'
+    )
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Воркер'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+    run_after = models.DateTimeField(
+        verbose_name='Не раньше'
+    )
+    expires_at = models.DateTimeField(
+        verbose_name='Срок начала выполнения'
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        verbose_name='Начато'
+    )
+    lease_until = models.DateTimeField(
+        null=True,
+        verbose_name='Аренда воркера до'
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        verbose_name='Завершено'
+    )
+
+    class Meta:
+        verbose_name = 'Задание AI'
+        verbose_name_plural = 'Задания AI'
+        ordering = ['-created_at']
+        indexes = [
+            # Выбор следующего задания воркером: порядок индекса - порядок выборки
+            # в claim_job, run_after и expires_at проверяются по строкам индекса
+            models.Index(fields=['state', '-priority', 'created_at'], name='aijob_claim'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} ({self.get_state_display()})"
+
+    @property
+    def is_finished(self):
+        return self.state in self.FINISHED_STATES
+
+    def as_dict(self):
+        return {
+            'id': str(self.id),
+            'action': self.action,
+            'state': self.state,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'http_status': self.http_status,
+            'result': self.result,
+        }
@@ -0,0 +1,136 @@
+# documents/pagination.py
+"""
+Постраничный вывод по курсору (keyset pagination).
+
+Страница N через OFFSET заставляет БД пройти и отбросить все строки
+предыдущих страниц, поэтому глубокие страницы открываются тем дольше, чем
+дальше от начала. Курсор хранит ключ сортировки последней (или первой)
+строки показанной страницы, и следующая страница выбирается условием
+"ключ больше курсора" — диапазоном по индексу, время не зависит от номера
+страницы.
+
+Курсор — base64 от JSON: направление и значения полей сортировки, поэтому
+поля сортировки должны сериализоваться в JSON (строки, числа).
+"""
+import base64
+import binascii
+import json
+from django.db.models import Q
+
+NEXT, PREVIOUS = 'n', 'p'
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или не соответствует полям сортировки"""
+
+
+def encode_cursor(direction, values):
+    raw = json.dumps([direction, list(values)], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """(направление, значения) из курсора с size полями сортировки"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor(f"Неверный курсор: {cursor!r}")
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(f"Неверный курсор: {cursor!r}")
+    return direction, values
+
+
+def _beyond(fields, values, lookup):
+    """
+    Строки, ключ которых (fields) строго больше (gt) или меньше (lt) values.
+    Первое поле дополнительно ограничено нестрого, чтобы БД выбрала
+    диапазон по индексу, а не проверяла условие для каждой строки
+    """
+    field, value = fields[0], values[0]
+    condition = Q(**{f'{field}__{lookup}': value})
+    if len(fields) > 1:
+        condition |= Q(**{field: value}) & _beyond(fields[1:], values[1:], lookup)
+    return condition
+
+
+class KeysetPage:
+    """Страница выборки по курсору; для шаблонов — как Page из Paginator"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __repr__(self):
+        return f"<KeysetPage: {len(self)} объектов>"
+
+
+class KeysetPaginator:
+    """
+    Разбивка queryset на страницы по курсору. ordering — поля сортировки
+    по возрастанию; последним должно идти уникальное поле (pk), иначе
+    строки с одинаковым ключом на границе страниц потеряются
+    """
+
+    def __init__(self, queryset, per_page, ordering=('name', 'pk')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+
+    def page(self, cursor=None):
+        """Первая страница (cursor=None) или соседняя с курсором. Raises: InvalidCursor"""
+        if not cursor:
+            return self._page_after(None)
+        direction, values = decode_cursor(cursor, len(self.ordering))
+        if direction == NEXT:
+            return self._page_after(values)
+        return self._page_before(values)
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.ordering]
+
+    def _bounded(self, values, lookup):
+        first = self.ordering[0]
+        return self.queryset.filter(
+            Q(**{f'{first}__{lookup}e': values[0]}) & _beyond(self.ordering, values, lookup)
+        )
+
+    def _page_after(self, values):
+        queryset = self.queryset if values is None else self._bounded(values, 'gt')
+        rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(NEXT, self._key(rows[-1])) if has_next else None,
+            previous_cursor=encode_cursor(PREVIOUS, self._key(rows[0])) if values is not None and rows else None,
+        )
+
+    def _page_before(self, values):
+        descending = [f'-{field}' for field in self.ordering]
+        rows = list(self._bounded(values, 'lt').order_by(*descending)[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        if not rows:
+            return self._page_after(None)
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(NEXT, self._key(rows[-1])),
+            previous_cursor=encode_cursor(PREVIOUS, self._key(rows[0])) if has_previous else None,
+        )
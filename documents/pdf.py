@@ -0,0 +1,756 @@
+# documents/pdf.py
+"""
+Рендеринг HTML-документов в PDF на чистом Python.
+
+Поддерживается подмножество разметки, которое используют шаблоны документов:
+заголовки, абзацы, списки, переносы строк, жирный текст и секции lawsuit-*.
+Шрифт TrueType встраивается в PDF в виде подмножества использованных глифов,
+поэтому кириллица отображается без системных библиотек.
+"""
+import hashlib
+import logging
+import math
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import namedtuple
+from functools import lru_cache
+from html.parser import HTMLParser
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .caching import LRUCache
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Размеры страницы A4 и поля (в пунктах), поля по ГОСТ Р 7.0.97
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+MARGIN_LEFT = 85.04    # 30 мм
+MARGIN_RIGHT = 42.52   # 15 мм
+MARGIN_TOP = 56.69     # 20 мм
+MARGIN_BOTTOM = 56.69  # 20 мм
+CONTENT_WIDTH = PAGE_WIDTH - MARGIN_LEFT - MARGIN_RIGHT
+
+LINE_SPACING = 1.4
+LIST_INDENT = 24.0
+
+# Шрифты с кириллицей в составе приложения (DejaVu Serif, лицензия в fonts/LICENSE):
+# PDF генерируется и на хосте без системных шрифтов
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+DEFAULT_FONTS = {
+    'regular': os.path.join(FONTS_DIR, 'DejaVuSerif.ttf'),
+    'bold': os.path.join(FONTS_DIR, 'DejaVuSerif-Bold.ttf'),
+}
+
+
+# --- Шрифты -----------------------------------------------------------------
+
+class TrueTypeFont:
+    """Метрики и подмножества глифов шрифта TrueType"""
+
+    # Таблицы, необходимые для встраивания шрифта в PDF (FontFile2)
+    SUBSET_TABLES = (b'head', b'hhea', b'hmtx', b'loca', b'glyf', b'maxp', b'cvt ', b'fpgm', b'prep')
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = f.read()
+
+        num_tables = struct.unpack_from('>H', self.data, 4)[0]
+        self.tables = {}
+        for i in range(num_tables):
+            tag, _, offset, length = struct.unpack_from('>4sIII', self.data, 12 + 16 * i)
+            self.tables[tag] = (offset, length)
+
+        head = self._table(b'head')
+        self.units_per_em = struct.unpack_from('>H', head, 18)[0]
+        self.bbox = struct.unpack_from('>hhhh', head, 36)
+        self.index_to_loc_format = struct.unpack_from('>h', head, 50)[0]
+
+        hhea = self._table(b'hhea')
+        self.ascent, self.descent = struct.unpack_from('>hh', hhea, 4)
+        num_hmetrics = struct.unpack_from('>H', hhea, 34)[0]
+        self.num_glyphs = struct.unpack_from('>H', self._table(b'maxp'), 4)[0]
+
+        hmtx = self._table(b'hmtx')
+        advances = [struct.unpack_from('>H', hmtx, 4 * i)[0] for i in range(num_hmetrics)]
+        advances.extend([advances[-1]] * (self.num_glyphs - num_hmetrics))
+        self.advances = advances
+
+        self.cmap = self._parse_cmap()
+        self.name = self._postscript_name()
+        self.missing_glyph = self.cmap.get(ord('?'), 0)
+        self._loca = None
+        self._subset_cache = LRUCache(maxsize=64)
+
+    def _table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    def _parse_cmap(self):
+        """Разбор таблицы cmap (форматы 4 и 12, Unicode)"""
+        offset = self.tables[b'cmap'][0]
+        num_subtables = struct.unpack_from('>H', self.data, offset + 2)[0]
+        subtables = {}
+        for i in range(num_subtables):
+            platform, encoding, sub_offset = struct.unpack_from('>HHI', self.data, offset + 4 + 8 * i)
+            subtables[(platform, encoding)] = offset + sub_offset
+
+        cmap = {}
+        for key in ((3, 10), (0, 4), (3, 1), (0, 3)):
+            if key not in subtables:
+                continue
+            sub = subtables[key]
+            fmt = struct.unpack_from('>H', self.data, sub)[0]
+            if fmt == 12:
+                groups = struct.unpack_from('>I', self.data, sub + 12)[0]
+                for g in range(groups):
+                    start, end, glyph = struct.unpack_from('>III', self.data, sub + 16 + 12 * g)
+                    for code in range(start, end + 1):
+                        cmap[code] = glyph + code - start
+                return cmap
+            if fmt == 4:
+                seg_count = struct.unpack_from('>H', self.data, sub + 6)[0] // 2
+                ends_at = sub + 14
+                starts_at = ends_at + 2 * seg_count + 2
+                deltas_at = starts_at + 2 * seg_count
+                ranges_at = deltas_at + 2 * seg_count
+                for s in range(seg_count):
+                    end = struct.unpack_from('>H', self.data, ends_at + 2 * s)[0]
+                    start = struct.unpack_from('>H', self.data, starts_at + 2 * s)[0]
+                    delta = struct.unpack_from('>h', self.data, deltas_at + 2 * s)[0]
+                    range_pos = ranges_at + 2 * s
+                    range_offset = struct.unpack_from('>H', self.data, range_pos)[0]
+                    for code in range(start, end + 1):
+                        if code == 0xFFFF:
+                            continue
+                        if range_offset == 0:
+                            glyph = (code + delta) & 0xFFFF
+                        else:
+                            glyph_pos = range_pos + range_offset + 2 * (code - start)
+                            glyph = struct.unpack_from('>H', self.data, glyph_pos)[0]
+                            if glyph:
+                                glyph = (glyph + delta) & 0xFFFF
+                        if glyph:
+                            cmap[code] = glyph
+                return cmap
+        raise ImproperlyConfigured(f"Шрифт {self.path} не содержит Unicode-таблицы cmap")
+
+    def _postscript_name(self):
+        """PostScript-имя шрифта из таблицы name"""
+        if b'name' in self.tables:
+            offset = self.tables[b'name'][0]
+            count, string_offset = struct.unpack_from('>HH', self.data, offset + 2)
+            for i in range(count):
+                platform, encoding, _, name_id, length, str_offset = struct.unpack_from(
+                    '>HHHHHH', self.data, offset + 6 + 12 * i
+                )
+                if name_id != 6:
+                    continue
+                start = offset + string_offset + str_offset
+                raw = self.data[start:start + length]
+                name = raw.decode('utf-16-be') if platform in (0, 3) else raw.decode('latin-1')
+                return re.sub(r'[^A-Za-z0-9-]', '', name)
+        return 'EmbeddedFont'
+
+    def glyph_id(self, char):
+        return self.cmap.get(ord(char), self.missing_glyph)
+
+    def text_width(self, text, size):
+        """Ширина текста в пунктах при заданном кегле"""
+        return _text_units(self, text) * size / self.units_per_em
+
+    def pdf_width(self, glyph):
+        """Ширина глифа в единицах PDF (1/1000 кегля)"""
+        return round(self.advances[glyph] * 1000 / self.units_per_em)
+
+    def subset(self, glyphs):
+        """
+        Файл шрифта, в котором оставлены только контуры указанных глифов.
+        Номера глифов сохраняются, поэтому CIDToGIDMap остается Identity.
+        :return: tuple(bytes, int) - сжатый (Flate) файл шрифта и его исходный размер
+        """
+        key = frozenset(glyphs) | {0}
+        cached = self._subset_cache.get(key)
+        if cached is not None:
+            return cached
+
+        glyf = self._table(b'glyf')
+        loca = self._parse_loca()
+        keep = set()
+        pending = list(key)
+        while pending:
+            glyph = pending.pop()
+            if glyph in keep or glyph >= self.num_glyphs:
+                continue
+            keep.add(glyph)
+            pending.extend(self._composite_components(glyf[loca[glyph]:loca[glyph + 1]]))
+
+        new_glyf = bytearray()
+        new_loca = []
+        for glyph in range(self.num_glyphs):
+            new_loca.append(len(new_glyf))
+            if glyph in keep:
+                new_glyf += glyf[loca[glyph]:loca[glyph + 1]]
+                new_glyf += b'\0' * (-len(new_glyf) % 4)
+        new_loca.append(len(new_glyf))
+
+        head = bytearray(self._table(b'head'))
+        struct.pack_into('>I', head, 8, 0)    # checkSumAdjustment
+        struct.pack_into('>h', head, 50, 1)   # длинный формат loca
+
+        tables = {
+            b'head': bytes(head),
+            b'loca': struct.pack(f'>{len(new_loca)}I', *new_loca),
+            b'glyf': bytes(new_glyf),
+        }
+        for tag in self.SUBSET_TABLES:
+            if tag not in tables and tag in self.tables:
+                tables[tag] = self._table(tag)
+
+        font_file = _build_sfnt(tables)
+        subset = (zlib.compress(font_file, 6), len(font_file))
+        self._subset_cache.set(key, subset)
+        return subset
+
+    def _parse_loca(self):
+        if self._loca is not None:
+            return self._loca
+        loca = self._table(b'loca')
+        count = self.num_glyphs + 1
+        if self.index_to_loc_format == 0:
+            self._loca = [offset * 2 for offset in struct.unpack_from(f'>{count}H', loca)]
+        else:
+            self._loca = list(struct.unpack_from(f'>{count}I', loca))
+        return self._loca
+
+    @staticmethod
+    def _composite_components(glyph_data):
+        """Номера глифов, из которых состоит составной глиф"""
+        if len(glyph_data) < 10 or struct.unpack_from('>h', glyph_data, 0)[0] >= 0:
+            return []
+        components = []
+        pos = 10
+        while True:
+            flags, glyph = struct.unpack_from('>HH', glyph_data, pos)
+            components.append(glyph)
+            pos += 4
+            pos += 4 if flags & 0x0001 else 2
+            if flags & 0x0008:
+                pos += 2
+            elif flags & 0x0040:
+                pos += 4
+            elif flags & 0x0080:
+                pos += 8
+            if not flags & 0x0020:
+                return components
+
+
+def _build_sfnt(tables):
+    """Сборка файла TrueType из набора таблиц"""
+    tags = sorted(tables)
+    num_tables = len(tags)
+    entry_selector = int(math.log2(num_tables))
+    search_range = 16 * 2 ** entry_selector
+    header = struct.pack('>IHHHH', 0x00010000, num_tables, search_range,
+                         entry_selector, num_tables * 16 - search_range)
+
+    directory = bytearray()
+    body = bytearray()
+    offset = 12 + 16 * num_tables
+    for tag in tags:
+        data = tables[tag]
+        padded = data + b'\0' * (-len(data) % 4)
+        checksum = sum(struct.unpack(f'>{len(padded) // 4}I', padded)) & 0xFFFFFFFF
+        directory += struct.pack('>4sIII', tag, checksum, offset + len(body), len(data))
+        body += padded
+    return header + bytes(directory) + bytes(body)
+
+
+@lru_cache(maxsize=32768)
+def _text_units(font, text):
+    """Ширина слова в единицах шрифта (кэш метрик на процесс)"""
+    advances = font.advances
+    return sum(advances[font.glyph_id(char)] for char in text)
+
+
+_fonts = {}
+_fonts_lock = threading.Lock()
+
+
+def get_font(style):
+    """Шрифт процесса для начертания 'regular' или 'bold' (загружается один раз)"""
+    font = _fonts.get(style)
+    if font is not None:
+        return font
+    with _fonts_lock:
+        if style not in _fonts:
+            setting = 'PDF_FONT_BOLD' if style == 'bold' else 'PDF_FONT_REGULAR'
+            path = getattr(settings, setting, None) or DEFAULT_FONTS[style]
+            try:
+                _fonts[style] = TrueTypeFont(path)
+            except OSError as e:
+                raise ImproperlyConfigured(
+                    f"Не удалось загрузить шрифт для PDF ({setting}={path}): {e}"
+                )
+        return _fonts[style]
+
+
+@receiver(setting_changed)
+def _reset_fonts_on_setting_change(setting, **kwargs):
+    if setting.startswith('PDF_FONT_'):
+        with _fonts_lock:
+            _fonts.clear()
+
+
+# --- Разбор HTML ----------------------------------------------------------
+
+# Оформление блока: кегль, жирность, выравнивание, отступ слева, висячий отступ, маркер
+BlockStyle = namedtuple('BlockStyle', 'size bold align indent hang marker space_before space_after')
+Block = namedtuple('Block', 'style runs')
+
+HEADING_STYLES = {
+    'h1': (16, 'center'),
+    'h2': (15, 'center'),
+    'h3': (14, 'center'),
+    'h4': (12, 'center'),
+    'h5': (12, 'left'),
+    'h6': (12, 'left'),
+}
+BODY_SIZE = 12
+
+# Секции шапки документа печатаются в правой половине страницы
+RIGHT_COLUMN_CLASSES = {'lawsuit-header', 'lawsuit-defendant', 'appeal-header', 'motion-header'}
+HIDDEN_CLASSES = {'same-field', 'd-none'}
+HIDDEN_TAGS = {'head', 'title', 'style', 'script', 'template', 'button'}
+BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'header', 'footer', 'blockquote',
+    'li', 'ul', 'ol', 'tr', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+}
+VOID_TAGS = {'br', 'hr', 'img', 'input', 'meta', 'link', 'col', 'wbr'}
+BOLD_TAGS = {'b', 'strong', 'th'}
+WHITESPACE_RE = re.compile(r'[ \t\r\n\f\v]+')
+
+
+class _BlockParser(HTMLParser):
+    """Превращает HTML в последовательность блоков с текстовыми фрагментами"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.stack = []
+        self.runs = []
+        self.list_counters = []
+
+    # Состояние текущего контекста
+    def _hidden(self):
+        return bool(self.stack) and self.stack[-1]['hidden']
+
+    def _bold(self):
+        return any(item['tag'] in BOLD_TAGS or item['tag'] in HEADING_STYLES for item in self.stack)
+
+    def _classes(self):
+        classes = set()
+        for item in self.stack:
+            classes.update(item['classes'])
+        return classes
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in VOID_TAGS:
+            if tag == 'br' and not self._hidden():
+                self.runs.append(('\n', False))
+            elif tag == 'hr':
+                self._flush()
+            return
+
+        classes = set((attrs.get('class') or '').split())
+        style = (attrs.get('style') or '').replace(' ', '').lower()
+        hidden = (
+            self._hidden()
+            or tag in HIDDEN_TAGS
+            or bool(classes & HIDDEN_CLASSES)
+            or 'display:none' in style
+        )
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in ('ul', 'ol'):
+            self.list_counters.append(0 if tag == 'ol' else None)
+        elif tag == 'li' and self.list_counters and self.list_counters[-1] is not None:
+            self.list_counters[-1] += 1
+        self.stack.append({'tag': tag, 'classes': classes, 'hidden': hidden})
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS or not any(item['tag'] == tag for item in self.stack):
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+        while self.stack:
+            item = self.stack.pop()
+            if item['tag'] in ('ul', 'ol') and self.list_counters:
+                self.list_counters.pop()
+            if item['tag'] == tag:
+                break
+
+    def handle_data(self, data):
+        if self._hidden() or not data:
+            return
+        self.runs.append((data, self._bold()))
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def _flush(self):
+        """Завершает текущий блок, нормализуя пробелы"""
+        runs = []
+        for text, bold in self.runs:
+            if text == '\n':
+                runs.append((text, bold))
+                continue
+            text = WHITESPACE_RE.sub(' ', text)
+            if runs and runs[-1][1] == bold and runs[-1][0] != '\n':
+                runs[-1] = (runs[-1][0] + text, bold)
+            else:
+                runs.append((text, bold))
+        self.runs = []
+
+        # Обрезаем пробелы по краям блока
+        while runs and not runs[0][0].strip(' ') and runs[0][0] != '\n':
+            runs.pop(0)
+        while runs and (not runs[-1][0].strip() or runs[-1][0] == '\n'):
+            runs.pop()
+        if not runs:
+            return
+        runs[0] = (runs[0][0].lstrip(' '), runs[0][1])
+        runs[-1] = (runs[-1][0].rstrip(' '), runs[-1][1])
+
+        self.blocks.append(Block(self._current_style(), tuple(runs)))
+
+    def _current_style(self):
+        tags = [item['tag'] for item in self.stack]
+        classes = self._classes()
+        indent = CONTENT_WIDTH / 2 if classes & RIGHT_COLUMN_CLASSES else 0.0
+
+        heading = next((tag for tag in reversed(tags) if tag in HEADING_STYLES), None)
+        if heading:
+            size, align = HEADING_STYLES[heading]
+            return BlockStyle(size, True, align, indent, 0.0, '', size * 0.5, size * 0.5)
+
+        if 'li' in tags:
+            depth = max(len(self.list_counters), 1)
+            counter = self.list_counters[-1] if self.list_counters else None
+            marker = f"{counter}." if counter is not None else '•'
+            return BlockStyle(BODY_SIZE, False, 'left', indent + LIST_INDENT * (depth - 1),
+                              LIST_INDENT, marker, 0.0, 2.0)
+
+        align = 'center' if classes & {'text-center', 'center'} else (
+            'right' if classes & {'text-right', 'text-end'} else 'left'
+        )
+        return BlockStyle(BODY_SIZE, False, align, indent, 0.0, '', 0.0, 4.0)
+
+
+def parse_blocks(html):
+    parser = _BlockParser()
+    parser.feed(html)
+    parser.close()
+    return parser.blocks
+
+
+# --- Верстка ----------------------------------------------------------------
+
+# Кэш раскладки блоков по строкам: статические секции шаблонов
+# (заголовки, «Прошу:», «Приложения:» и т.п.) верстаются один раз на процесс
+layout_cache = LRUCache(maxsize=getattr(settings, 'PDF_LAYOUT_CACHE_SIZE', 4096))
+
+
+def layout_block(block, width=CONTENT_WIDTH):
+    """
+    Разбивает блок на строки
+    :return: tuple строк; строка - tuple фрагментов (x, bold, text)
+    """
+    key = (block, width)
+    lines = layout_cache.get(key)
+    if lines is None:
+        lines = _layout_block(block, width)
+        layout_cache.set(key, lines)
+    return lines
+
+
+def _layout_block(block, width):
+    style = block.style
+    size = style.size
+    space_width = {
+        False: get_font('regular').text_width(' ', size),
+        True: get_font('bold').text_width(' ', size),
+    }
+    left = style.indent + style.hang
+    available = max(width - left, size * 4)
+
+    # Слова с признаком жирности; '\n' — принудительный перенос
+    words = []
+    for text, bold in block.runs:
+        bold = bold or style.bold
+        if text == '\n':
+            words.append(('\n', bold))
+            continue
+        for word in text.split(' '):
+            if word:
+                words.append((word, bold))
+
+    lines = []
+    current = []
+    cursor = 0.0
+
+    def finish_line():
+        line_width = cursor
+        if style.align == 'center':
+            shift = (available - line_width) / 2
+        elif style.align == 'right':
+            shift = available - line_width
+        else:
+            shift = 0.0
+        lines.append(tuple((left + shift + x, bold, text) for x, bold, text in current))
+
+    for word, bold in words:
+        if word == '\n':
+            finish_line()
+            current, cursor = [], 0.0
+            continue
+        font = get_font('bold' if bold else 'regular')
+        word_width = font.text_width(word, size)
+        gap = space_width[bold] if current else 0.0
+
+        if current and cursor + gap + word_width > available:
+            finish_line()
+            current, cursor, gap = [], 0.0, 0.0
+
+        # Слово длиннее строки режем по символам
+        while word_width > available and len(word) > 1:
+            cut = len(word)
+            while cut > 1 and font.text_width(word[:cut], size) > available - cursor:
+                cut -= 1
+            current.append((cursor, bold, word[:cut]))
+            finish_line()
+            current, cursor = [], 0.0
+            word = word[cut:]
+            word_width = font.text_width(word, size)
+
+        if current and current[-1][1] == bold:
+            x, _, text = current[-1]
+            current[-1] = (x, bold, f"{text} {word}")
+        else:
+            current.append((cursor + gap, bold, word))
+        cursor += gap + word_width
+
+    if current or not lines:
+        finish_line()
+    return tuple(lines)
+
+
+# --- Запись PDF -------------------------------------------------------------
+
+def _pdf_text_string(text):
+    """Строка PDF в кодировке UTF-16BE"""
+    return '<FEFF' + text.encode('utf-16-be').hex().upper() + '>'
+
+
+class _FontUsage:
+    """Глифы, использованные в документе одним начертанием"""
+
+    def __init__(self, font, resource_name):
+        self.font = font
+        self.resource_name = resource_name
+        self.glyphs = {}
+
+    def encode(self, text):
+        font = self.font
+        codes = []
+        for char in text:
+            glyph = font.glyph_id(char)
+            self.glyphs.setdefault(glyph, char)
+            codes.append(glyph)
+        return ''.join(f'{glyph:04X}' for glyph in codes)
+
+
+class _PDFWriter:
+    def __init__(self):
+        self.objects = []
+
+    def reserve(self):
+        self.objects.append(None)
+        return len(self.objects)
+
+    def add(self, body):
+        self.objects.append(body)
+        return len(self.objects)
+
+    def set(self, number, body):
+        self.objects[number - 1] = body
+
+    def add_stream(self, data, extra='', compressed=None):
+        if compressed is None:
+            compressed = zlib.compress(data, 6)
+        return self.add(
+            f'<< /Length {len(compressed)} /Filter /FlateDecode{extra} >>\nstream\n'.encode('latin-1')
+            + compressed + b'\nendstream'
+        )
+
+    def add_font(self, usage):
+        font = usage.font
+        glyphs = sorted(usage.glyphs)
+        tag = ''.join(
+            chr(65 + b % 26) for b in hashlib.sha1(repr(glyphs).encode()).digest()[:6]
+        )
+        base_name = f'{tag}+{font.name}'
+
+        font_file, font_length = font.subset(glyphs)
+        file_ref = self.add_stream(None, f' /Length1 {font_length}', compressed=font_file)
+
+        scale = 1000 / font.units_per_em
+        bbox = ' '.join(str(round(v * scale)) for v in font.bbox)
+        descriptor_ref = self.add(
+            f'<< /Type /FontDescriptor /FontName /{base_name} /Flags 32 /FontBBox [{bbox}] '
+            f'/ItalicAngle 0 /Ascent {round(font.ascent * scale)} /Descent {round(font.descent * scale)} '
+            f'/CapHeight {round(font.ascent * scale)} /StemV 80 /FontFile2 {file_ref} 0 R >>'.encode('latin-1')
+        )
+
+        widths = ' '.join(f'{glyph} [{font.pdf_width(glyph)}]' for glyph in glyphs)
+        cid_ref = self.add(
+            f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{base_name} '
+            f'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+            f'/FontDescriptor {descriptor_ref} 0 R /W [{widths}] /CIDToGIDMap /Identity >>'.encode('latin-1')
+        )
+
+        to_unicode_ref = self.add_stream(self._to_unicode(usage.glyphs))
+        return self.add(
+            f'<< /Type /Font /Subtype /Type0 /BaseFont /{base_name} /Encoding /Identity-H '
+            f'/DescendantFonts [{cid_ref} 0 R] /ToUnicode {to_unicode_ref} 0 R >>'.encode('latin-1')
+        )
+
+    @staticmethod
+    def _to_unicode(glyphs):
+        """CMap для извлечения и копирования текста из PDF"""
+        items = sorted(glyphs.items())
+        chunks = []
+        for i in range(0, len(items), 100):
+            chunk = items[i:i + 100]
+            mapping = '\n'.join(
+                f'<{glyph:04X}> <{char.encode("utf-16-be").hex().upper()}>' for glyph, char in chunk
+            )
+            chunks.append(f'{len(chunk)} beginbfchar\n{mapping}\nendbfchar')
+        return (
+            '/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n'
+            '/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+            '1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+            + '\n'.join(chunks)
+            + '\nendcmap\nCMapName currentdict /CMap defineresource pop\nend\nend'
+        ).encode('latin-1')
+
+    def output(self, root_ref, info_ref):
+        out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for number, body in enumerate(self.objects, start=1):
+            offsets.append(len(out))
+            out += f'{number} 0 obj\n'.encode('latin-1') + body + b'\nendobj\n'
+        xref_offset = len(out)
+        out += f'xref\n0 {len(self.objects) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+        for offset in offsets:
+            out += f'{offset:010d} 00000 n \n'.encode('latin-1')
+        out += (
+            f'trailer\n<< /Size {len(self.objects) + 1} /Root {root_ref} 0 R /Info {info_ref} 0 R >>\n'
+            f'startxref\n{xref_offset}\n%%EOF\n'
+        ).encode('latin-1')
+        return bytes(out)
+
+
+def _paginate(blocks):
+    """Раскладывает строки блоков по страницам: [(y, size, фрагменты), ...] на страницу"""
+    pages = [[]]
+    top = PAGE_HEIGHT - MARGIN_TOP
+    y = top
+    for block in blocks:
+        style = block.style
+        line_height = style.size * LINE_SPACING
+        if y < top:
+            y -= style.space_before
+        lines = layout_block(block)
+        for index, line in enumerate(lines):
+            if y - line_height < MARGIN_BOTTOM:
+                pages.append([])
+                y = top
+            baseline = y - style.size
+            segments = line
+            if index == 0 and style.marker:
+                segments = ((style.indent, False, style.marker),) + line
+            pages[-1].append((baseline, style.size, segments))
+            y -= line_height
+        y -= style.space_after
+    return pages
+
+
+def render_pdf(html, title=''):
+    """
+    Рендерит HTML в PDF
+    :param html: str - HTML документа
+    :param title: str - заголовок PDF
+    :return: tuple(bytes, int) - содержимое PDF и число страниц
+    """
+    blocks = parse_blocks(html)
+    pages = _paginate(blocks)
+
+    usages = {
+        False: _FontUsage(get_font('regular'), 'F1'),
+        True: _FontUsage(get_font('bold'), 'F2'),
+    }
+    writer = _PDFWriter()
+    catalog_ref = writer.reserve()
+    pages_ref = writer.reserve()
+
+    contents = []
+    for page in pages:
+        commands = []
+        for baseline, size, segments in page:
+            for x, bold, text in segments:
+                usage = usages[bold]
+                commands.append(
+                    f'BT /{usage.resource_name} {size:g} Tf 1 0 0 1 {MARGIN_LEFT + x:.2f} {baseline:.2f} Tm '
+                    f'<{usage.encode(text)}> Tj ET'
+                )
+        contents.append(writer.add_stream('\n'.join(commands).encode('latin-1')))
+
+    fonts = ' '.join(
+        f'/{usage.resource_name} {writer.add_font(usage)} 0 R'
+        for usage in usages.values() if usage.glyphs
+    )
+    page_refs = []
+    for content_ref in contents:
+        page_refs.append(writer.add(
+            f'<< /Type /Page /Parent {pages_ref} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << {fonts} >> >> /Contents {content_ref} 0 R >>'.encode('latin-1')
+        ))
+
+    kids = ' '.join(f'{ref} 0 R' for ref in page_refs)
+    writer.set(pages_ref, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_refs)} >>'.encode('latin-1'))
+    writer.set(catalog_ref, f'<< /Type /Catalog /Pages {pages_ref} 0 R >>'.encode('latin-1'))
+    info_ref = writer.add(
+        f'<< /Title {_pdf_text_string(title)} /Producer (AutoDocPro) >>'.encode('latin-1')
+    )
+    return writer.output(catalog_ref, info_ref), len(page_refs)
+
+
+def html_to_pdf(html, title=''):
+    """Рендерит HTML в PDF и возвращает содержимое файла"""
+    with metrics.timer('pdf_seconds'):
+        return render_pdf(html, title)[0]
+
+
+def get_layout_cache_stats():
+    """Статистика кэша раскладки блоков"""
+    return layout_cache.stats()
@@ -0,0 +1,183 @@
+# documents/prompts.py
+"""
+Промпты с бюджетом токенов.
+
+Пользователи вставляют в формы решения суда и описания дел целиком:
+без ограничения такие запросы идут медленно и упираются в лимиты модели.
+Здесь входной текст сокращается до бюджета (AI_CONFIG['MAX_INPUT_TOKENS'],
+для шаблона — не больше DocumentTemplate.ai_max_length) без обращения к API:
+остаются начало и конец текста (реквизиты и резолютивная часть решения)
+и абзацы, больше других относящиеся к делу.
+
+Число токенов оценивается локально по классам символов — без токенизатора
+модели, с точностью, достаточной для бюджета.
+"""
+import math
+import re
+from django.conf import settings
+
+# Символов на токен в среднем для BPE-токенизатора модели
+_CHARS_PER_TOKEN = (
+    (re.compile(r'[А-Яа-яЁё]+'), 3.0),
+    (re.compile(r'[A-Za-z]+'), 4.0),
+    (re.compile(r'\d+'), 3.0),
+)
+_SYMBOL_RE = re.compile(r'[^\sА-Яа-яЁёA-Za-z\d]')
+
+_GAP = '[...]'
+_PARAGRAPH_RE = re.compile(r'\n\s*\n')
+_SENTENCE_RE = re.compile(r'(?<=[.!?…;])\s+')
+_WORD_RE = re.compile(r'[А-Яа-яЁёA-Za-z]{3,}')
+# Юридическая лексика: абзацы с ней важнее для оснований апелляции
+_LEGAL_CUES_RE = re.compile(
+    r'(?<![А-Яа-яЁё])(суд|реш|постанов|установ|стать|ст\.|кодекс|закон|наруш|доказ|'
+    r'отказ|удовлетвор|взыск|апелл|основан|довод|ходатайств|иск)',
+    re.IGNORECASE
+)
+
+GROUNDS_PROMPT = """Сгенерируйте юридические основания для апелляции на решение:
+{decision_text}
+
+Детали дела:
+{case_details}
+"""
+
+OPTIMIZE_PROMPT = """Улучшите юридический текст: сделайте его точнее и убедительнее, \
+сохраните смысл и ссылки на нормы права. Верните только исправленный текст.
+
+Контекст:
+{context}
+
+Текст:
+{text}
+"""
+
+
+def estimate_tokens(text):
+    """
+    Оценка числа токенов: слово из n символов — примерно n / (символов на токен)
+    плюс половина токена на границу слова; знаки препинания — по токену
+    """
+    if not text:
+        return 0
+    tokens = 0.0
+    for pattern, chars_per_token in _CHARS_PER_TOKEN:
+        words = pattern.findall(text)
+        if words:
+            tokens += sum(map(len, words)) / chars_per_token + len(words) / 2
+    tokens += len(_SYMBOL_RE.findall(text))
+    return math.ceil(tokens)
+
+
+def input_budget(template=None):
+    """Бюджет входных токенов запроса: общий лимит, для шаблона — не больше его ai_max_length"""
+    budget = settings.AI_CONFIG['MAX_INPUT_TOKENS']
+    if template is not None and template.ai_max_length:
+        budget = min(budget, template.ai_max_length)
+    return budget
+
+
+def share_budget(budget, costs):
+    """Делит бюджет между частями: короткие получают сколько нужно, остаток поровну длинным"""
+    shares = [0] * len(costs)
+    remaining = max(budget, 0)
+    pending = sorted(range(len(costs)), key=costs.__getitem__)
+    while pending:
+        index = pending.pop(0)
+        shares[index] = min(costs[index], remaining // (len(pending) + 1))
+        remaining -= shares[index]
+    return shares
+
+
+def fit_text(text, budget, query=''):
+    """
+    Сокращает текст до budget токенов.
+
+    Первый и последний фрагменты сохраняются всегда (если помещаются),
+    остальные — по убыванию релевантности: пересечение слов с query
+    и юридическая лексика на единицу длины. Фрагменты идут в исходном
+    порядке, пропуски отмечены [...].
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    parts = _split(text, budget)
+    gap_cost = estimate_tokens(_GAP)
+    costs = [estimate_tokens(part) + gap_cost for part in parts]
+    query_stems = _stems(query)
+    scores = [_relevance(part, query_stems) for part in parts]
+
+    order = [0, len(parts) - 1] + sorted(range(1, len(parts) - 1), key=lambda i: -scores[i])
+    chosen, used = set(), 0
+    for index in order:
+        if index not in chosen and used + costs[index] <= budget:
+            chosen.add(index)
+            used += costs[index]
+    if not chosen:
+        return _cut(parts[0], budget - gap_cost)
+
+    pieces, previous = [], -1
+    for index in sorted(chosen):
+        if index != previous + 1:
+            pieces.append(_GAP)
+        pieces.append(parts[index])
+        previous = index
+    if previous != len(parts) - 1:
+        pieces.append(_GAP)
+    return '\n\n'.join(pieces)
+
+
+def grounds_prompt(decision_text, case_details, budget):
+    """Промпт генерации оснований апелляции; решение и детали дела сокращаются до бюджета"""
+    fixed = estimate_tokens(GROUNDS_PROMPT.format(decision_text='', case_details=''))
+    decision_budget, details_budget = share_budget(
+        budget - fixed, [estimate_tokens(decision_text), estimate_tokens(case_details)]
+    )
+    return GROUNDS_PROMPT.format(
+        decision_text=fit_text(decision_text, decision_budget, query=case_details),
+        case_details=fit_text(case_details, details_budget, query=decision_text),
+    )
+
+
+def optimize_prompt(text, context, budget):
+    """Промпт улучшения текста: текст передается целиком, контекст сокращается до остатка бюджета"""
+    fixed = estimate_tokens(OPTIMIZE_PROMPT.format(text=text, context=''))
+    return OPTIMIZE_PROMPT.format(text=text, context=fit_text(context, max(budget - fixed, 0), query=text))
+
+
+def _split(text, budget):
+    """Абзацы текста; слишком крупные (больше четверти бюджета) делятся на предложения"""
+    parts = []
+    for paragraph in _PARAGRAPH_RE.split(text.strip()):
+        lines = [line.strip() for line in paragraph.splitlines() if line.strip()]
+        paragraph = '\n'.join(lines)
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) > budget / 4:
+            parts.extend(sentence for sentence in _SENTENCE_RE.split(paragraph) if sentence)
+        else:
+            parts.append(paragraph)
+    return parts or [text]
+
+
+def _stems(text):
+    # Грубая основа слова — первые 5 букв: достаточно для пересечения лексики
+    return {word[:5].lower() for word in _WORD_RE.findall(text)}
+
+
+def _relevance(part, query_stems):
+    stems = _stems(part)
+    if not stems:
+        return 0.0
+    matches = len(stems & query_stems) + len(_LEGAL_CUES_RE.findall(part)) / 2
+    return matches / math.sqrt(len(stems))
+
+
+def _cut(text, budget):
+    """Обрезает текст по границе слова примерно до budget токенов"""
+    if budget <= 0:
+        return _GAP
+    chars = int(len(text) * budget / max(estimate_tokens(text), 1))
+    cut = text[:chars]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return f"{cut} {_GAP}"
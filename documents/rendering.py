@@ -0,0 +1,185 @@
+# documents/rendering.py
+import json
+import logging
+from django.conf import settings
+from django.template import Context, Template
+from .caching import LRUCache
+from .metrics import metrics
+from .specs import get_template_spec
+
+logger = logging.getLogger(__name__)
+
+# Контекст для примеров документов
+DOCUMENT_CONTEXTS = {
+    'motion': {
+        'court_name': "Московский городской суд",
+        'applicant': {
+            'full_name': "Иванов Иван Иванович",
+            'address': "г. Москва, ул. Примерная, д. 1",
+            'phone': "+7 (999) 123-45-67",
+            'email': "ivanov@example.com"
+        },
+        'motion_type': "отложении судебного заседания",
+        'motion_reason': "Необходимость представления дополнительных доказательств",
+        'current_date': "20.11.2023",
+        'case_number': "А40-12345/2023",
+        'judge_name': "Петрова Мария Ивановна"
+    },
+    'appeal': {
+        'appellate_court': "Московский областной суд",
+        'appellant': {
+            'full_name': "Иванов Иван Иванович",
+            'address': "г. Москва, ул. Примерная, д. 1",
+            'phone': "+7 (999) 123-45-67",
+            'email': "ivanov@example.com"
+        },
+        'decision_date': "15.10.2023",
+        'case_number': "А40-123456/2023",
+        'grounds': ["Нарушение норм материального права", "Несоответствие выводов суда"],
+        'original_court': "Московский городской суд",
+        'original_judge': "Сидоров Алексей Петрович"
+    },
+    'claim': {
+        'court_name': "Московский городской суд",
+        'plaintiff': {
+            'full_name': "Иванов Иван Иванович",
+            'address': "г. Москва, ул. Примерная, д. 1",
+            'phone': "+7 (999) 123-45-67",
+            'email': "ivanov@example.com",
+            'inn': "771234567890"
+        },
+        'defendant': {
+            'full_name': "ООО 'Компания'",
+            'address': "г. Москва, ул. Тестовая, д. 2",
+            'inn': "770987654321"
+        },
+        'claim_amount': "115 000 руб.",
+        'claim_reason': "долга по договору займа",
+        'contract_date': "15.05.2023",
+        'contract_number': "123",
+        'payment_due_date': "15.08.2023"
+    }
+}
+
+# Фиксированная дата для примеров документов
+EXAMPLE_DATE = "20.11.2023"
+
+# Кэш скомпилированных шаблонов документов, общий для всего процесса.
+# Ключ: (id шаблона, версия файла) — новый файл шаблона (другой хэш
+# содержимого) автоматически приводит к промаху и повторной компиляции.
+template_cache = LRUCache(maxsize=getattr(settings, 'TEMPLATE_CACHE_SIZE', 256))
+
+
+def get_compiled_template(template):
+    """
+    Возвращает скомпилированный django.template.Template для DocumentTemplate
+    :param template: Объект DocumentTemplate
+    :return: Template
+    :raises FileNotFoundError: если файл шаблона отсутствует
+    """
+    path = template.template_file.path
+    try:
+        key = (template.pk, template.get_file_version())
+        compiled = template_cache.get(key)
+        if compiled is not None:
+            metrics.inc('template_cache_total', result='hit')
+            return compiled
+        metrics.inc('template_cache_total', result='miss')
+
+        with open(path, 'r', encoding='utf-8') as f:
+            compiled = Template(f.read())
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Файл шаблона не найден: {path}")
+
+    # Старые версии этого шаблона больше не понадобятся
+    invalidate_template(template.pk)
+    template_cache.set(key, compiled)
+    logger.debug(f"Шаблон {template.pk} скомпилирован и помещен в кэш")
+    return compiled
+
+
+def invalidate_template(template_id):
+    """Удаляет из кэша все скомпилированные версии шаблона"""
+    return template_cache.invalidate(lambda key: key[0] == template_id)
+
+
+def get_template_cache_stats():
+    """Счетчики попаданий/промахов кэша скомпилированных шаблонов"""
+    return template_cache.stats()
+
+
+def render_document(template, context_data=None):
+    """
+    Рендеринг документа по шаблону
+    :param template: Объект DocumentTemplate
+    :param context_data: dict - данные для контекста
+    :return: str - отрендеренный HTML
+    """
+    with metrics.timer('render_seconds', doc_type=template.doc_type):
+        compiled_template = get_compiled_template(template)
+        return compiled_template.render(Context(build_render_context(template.doc_type, context_data)))
+
+
+def build_render_context(doc_type, context_data=None):
+    """Контекст рендеринга: пример для типа документа, данные пользователя и общие поля"""
+    context = DOCUMENT_CONTEXTS.get(doc_type, {}).copy()
+    if context_data:
+        context.update(context_data)
+
+    # Добавляем общие поля
+    context.update({
+        'current_date': EXAMPLE_DATE,
+    })
+    return context
+
+
+def build_form_context(template, cleaned_data):
+    """
+    Контекст документа из очищенных данных формы DynamicDocumentForm:
+    поля динамических блоков собираются в словарь dynamic_blocks[block_id]
+    """
+    return {
+        **cleaned_data,
+        'dynamic_blocks': get_template_spec(template).block_data(cleaned_data)
+    }
+
+
+def get_example_version(template):
+    """
+    Версия примера документа: тип документа и версия файла шаблона.
+    Пример перестраивается только при изменении одного из них.
+    """
+    return f"{template.doc_type}:{template.get_file_version()}"
+
+
+def build_example(template):
+    """
+    Рендерит пример документа и сохраняет его в шаблоне
+    :return: tuple(str, str) - HTML примера и JSON его контекста
+    """
+    example_context = DOCUMENT_CONTEXTS.get(template.doc_type, {})
+    example_html = render_document(template, example_context)
+    example_context_json = json.dumps(example_context, ensure_ascii=False)
+    example_version = get_example_version(template)
+
+    # update() вместо save(): не вызывает сигналы и не трогает остальные поля
+    type(template).objects.filter(pk=template.pk).update(
+        example_html=example_html,
+        example_context_json=example_context_json,
+        example_version=example_version,
+    )
+    template.example_html = example_html
+    template.example_context_json = example_context_json
+    template.example_version = example_version
+    logger.info(f"Пример документа для шаблона {template.pk} перестроен ({example_version})")
+    return example_html, example_context_json
+
+
+def get_example(template):
+    """
+    Возвращает сохраненный пример документа, перестраивая его при смене версии
+    :return: tuple(str, str) - HTML примера и JSON его контекста
+    """
+    if template.example_version and template.example_version == get_example_version(template):
+        return template.example_html, template.example_context_json
+    return build_example(template)
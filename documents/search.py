@@ -0,0 +1,237 @@
+# documents/search.py
+"""
+Полнотекстовый поиск шаблонов документов.
+
+Инвертированный индекс в памяти процесса: основы слов (documents/stemmer.py)
+из названия, описания, категории и типа документа с весами полей.
+Основа слова запроса ищется как префикс основ индекса ("иск" находит
+"исковое"), шаблон должен содержать все слова запроса.
+
+Индекс строится при первом поиске. Перед каждым поиском сравнивается
+версия каталога (documents/catalogue.py): если шаблоны сохранялись или
+удалялись в любом воркере, переиндексируются только шаблоны с новой
+ревизией.
+"""
+import bisect
+import logging
+import re
+import threading
+from collections import namedtuple
+from .catalogue import get_catalogue_version
+from .models import DocumentTemplate
+from .stemmer import stem
+
+logger = logging.getLogger(__name__)
+
+# Вес слова в зависимости от поля шаблона, в котором оно встречается
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'category': 2.0,
+    'doc_type': 2.0,
+    'description': 1.0,
+}
+
+# Точное совпадение основы весит больше совпадения по префиксу
+EXACT_MATCH_FACTOR = 2.0
+
+STOP_WORDS = frozenset(
+    'а без бы в во вы да для до же за и из или к ко как ли на над не ни но о об '
+    'от по под при про с со так то у что это'.split()
+)
+
+_WORD_RE = re.compile(r'[0-9a-zа-яё]+')
+
+_Doc = namedtuple('_Doc', 'revision name is_active category doc_type terms')
+
+
+def tokenize(text):
+    """Основы значимых слов текста в порядке появления"""
+    return [stem(word) for word in _WORD_RE.findall((text or '').lower()) if word not in STOP_WORDS]
+
+
+def template_terms(template):
+    """Основы слов шаблона и их веса: вес поля учитывается один раз на поле"""
+    texts = {
+        'name': template.name,
+        'description': template.description,
+        'category': f"{template.category} {template.get_category_display()}",
+        'doc_type': f"{template.doc_type} {template.get_doc_type_display()}",
+    }
+    weights = {}
+    for field, text in texts.items():
+        for term in set(tokenize(text)):
+            weights[term] = weights.get(term, 0.0) + FIELD_WEIGHTS[field]
+    return weights
+
+
+class SearchIndex:
+    """Инвертированный индекс шаблонов процесса с фильтрами по активности, категории и типу"""
+
+    FILTERS = ('is_active', 'category', 'doc_type')
+    FIELDS = ('pk', 'revision', 'name', 'description', 'is_active', 'category', 'doc_type')
+    LOAD_BATCH = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает индекс: следующий поиск построит его заново"""
+        self._postings = {}  # основа -> {id шаблона: вес}
+        self._terms = []     # отсортированные основы (поиск по префиксу)
+        self._docs = {}      # id шаблона -> _Doc
+        self._filters = {field: {} for field in self.FILTERS}  # поле -> значение -> {id шаблона}
+        self._order = {}     # id шаблона -> позиция по названию
+        self._version = None
+
+    def search(self, query, **filters):
+        """
+        id шаблонов, содержащих все слова запроса и удовлетворяющих filters,
+        по убыванию релевантности (при равной — по названию)
+        """
+        unknown = set(filters) - set(self.FILTERS)
+        if unknown:
+            raise ValueError(f"Поиск не фильтрует по полям: {', '.join(sorted(unknown))}")
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            self._sync()
+            ranks = None
+            for term in terms:
+                hits = self._match(term)
+                if ranks is None:
+                    ranks = hits
+                    continue
+                smaller, larger = sorted((ranks, hits), key=len)
+                ranks = {pk: rank + larger[pk] for pk, rank in smaller.items() if pk in larger}
+                if not ranks:
+                    return []
+            allowed = [self._filters[field].get(value, set()) for field, value in filters.items()]
+            order = self._order
+            found = [
+                (-rank, order[pk], pk) for pk, rank in ranks.items()
+                if all(pk in ids for ids in allowed)
+            ]
+        found.sort()
+        return [pk for _, _, pk in found]
+
+    def _match(self, term):
+        """{id шаблона: вес} для основ, начинающихся с term"""
+        hits = {}
+        index = bisect.bisect_left(self._terms, term)
+        while index < len(self._terms) and self._terms[index].startswith(term):
+            found = self._terms[index]
+            factor = EXACT_MATCH_FACTOR if found == term else 1.0
+            for pk, weight in self._postings[found].items():
+                hits[pk] = hits.get(pk, 0.0) + weight * factor
+            index += 1
+        return hits
+
+    def _sync(self):
+        """Приводит индекс к текущему каталогу, если версия каталога изменилась"""
+        version = get_catalogue_version().get()
+        if version is not None and version == self._version:
+            return
+        revisions = dict(DocumentTemplate.objects.values_list('pk', 'revision'))
+        removed = self._docs.keys() - revisions.keys()
+        changed = [
+            pk for pk, revision in revisions.items()
+            if pk not in self._docs or self._docs[pk].revision != revision
+        ]
+        for pk in removed:
+            self._remove(pk)
+        templates = DocumentTemplate.objects.only(*self.FIELDS).order_by()
+        if len(changed) == len(revisions):
+            # Первое построение: весь каталог одним запросом
+            batches = [templates]
+        else:
+            batches = [
+                templates.filter(pk__in=changed[start:start + self.LOAD_BATCH])
+                for start in range(0, len(changed), self.LOAD_BATCH)
+            ]
+        for batch in batches:
+            for template in batch.iterator(chunk_size=2000):
+                self._remove(template.pk)
+                self._add(template)
+        if removed or changed:
+            self._terms = sorted(self._postings)
+            self._order = {pk: i for i, pk in enumerate(sorted(self._docs, key=lambda pk: self._docs[pk].name))}
+            logger.info(f"Поисковый индекс: переиндексировано шаблонов {len(changed)}, удалено {len(removed)}")
+        self._version = version
+
+    def _add(self, template):
+        weights = template_terms(template)
+        for term, weight in weights.items():
+            self._postings.setdefault(term, {})[template.pk] = weight
+        self._docs[template.pk] = _Doc(
+            template.revision, template.name, template.is_active,
+            template.category, template.doc_type, tuple(weights)
+        )
+        for field in self.FILTERS:
+            self._filters[field].setdefault(getattr(template, field), set()).add(template.pk)
+
+    def _remove(self, pk):
+        doc = self._docs.pop(pk, None)
+        if doc is None:
+            return
+        for field in self.FILTERS:
+            self._filters[field][getattr(doc, field)].discard(pk)
+        for term in doc.terms:
+            postings = self._postings[term]
+            del postings[pk]
+            if not postings:
+                del self._postings[term]
+
+    def stats(self):
+        """Размер индекса процесса"""
+        return {
+            'templates': len(self._docs),
+            'terms': len(self._postings),
+            'postings': sum(len(postings) for postings in self._postings.values()),
+            'version': self._version,
+        }
+
+
+search_index = SearchIndex()
+
+
+class SearchResults:
+    """
+    Найденные шаблоны в порядке релевантности. Для Paginator: число
+    результатов известно сразу, объекты загружаются только для нужной страницы
+    """
+
+    def __init__(self, queryset, ids):
+        self.queryset = queryset
+        self.ids = ids
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return bool(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1 or None][0]
+        ids = self.ids[index]
+        objects = self.queryset.in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+def search_templates(query, **filters):
+    """
+    Поиск шаблонов по названию, описанию, категории и типу с учетом словоформ.
+    filters — is_active, category, doc_type.
+    Returns:
+        SearchResults
+    """
+    return SearchResults(DocumentTemplate.objects.filter(**filters), search_index.search(query, **filters))
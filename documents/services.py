@@ -1,13 +1,120 @@
 # documents/services.py
+import asyncio
+import hashlib
+import time
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.cache import cache
-from .models import AIRequestHistory
+from .breaker import get_breaker
+from .clients import get_async_client, get_client
+from .fieldhelp import get_stored_field_help, store_field_help
+from .history import arecord_history, record_history
+from .limiter import get_limiter
+from .prompts import input_budget, optimize_prompt
+from .sharedstore import get_shared_store
+from .singleflight import get_single_flight
 import logging
 
 logger = logging.getLogger('deepseek')
 
+# Фоновое обновление устаревших ответов кэша (stale-while-revalidate)
+_revalidation_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ai-revalidate')
+_revalidation_tasks = set()
+
+
+def get_response_cache():
+    """
+    Общий для всех воркеров кэш ответов DeepSeek API. Ответ с истекшим
+    TTL хранится еще STALE_TIMEOUT и отдается, пока обновляется в фоне
+    или пока API недоступен
+    """
+    return get_shared_store(
+        'deepseek',
+        max_entries=settings.AI_CONFIG['CACHE_MAX_ENTRIES'],
+        timeout=settings.AI_CONFIG['CACHE_TIMEOUT'],
+        stale_timeout=settings.AI_CONFIG['STALE_TIMEOUT'],
+    )
+
+
+def make_cache_key(endpoint, payload):
+    """
+    Ключ кэша по содержимому запроса: SHA-256 канонического JSON
+    (одинаков во всех процессах, в отличие от hash())
+    """
+    canonical = json.dumps(
+        {
+            'endpoint': endpoint,
+            'model': payload.get('model', settings.DEEPSEEK_MODEL),
+            'payload': payload,
+        },
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def token_usage(result):
+    """Токены запроса по данным API: {'input_tokens': ..., 'output_tokens': ...}"""
+    usage = (result or {}).get('usage') or {}
+    return {
+        'input_tokens': usage.get('prompt_tokens'),
+        'output_tokens': usage.get('completion_tokens'),
+    }
+
+
+def chat_completion(content, finish_reason=None, usage=None):
+    """Ответ chat/completions того же вида, что возвращает API без stream"""
+    return {
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': finish_reason,
+        }],
+        'usage': usage,
+    }
+
+
+class ChatStream:
+    """
+    Сборка потокового ответа chat/completions из строк SSE ("data: {...}").
+    Собранный ответ имеет обычный вид и кэшируется наравне с ним.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.usage = None
+        self.finish_reason = None
+        self.done = False
+
+    @property
+    def complete(self):
+        """Поток дочитан до конца (а не оборван)"""
+        return self.done or self.finish_reason is not None
+
+    def feed(self, line):
+        """Разбирает строку потока; возвращает новый фрагмент текста или ''"""
+        if not line.startswith('data:'):
+            return ''
+        data = line[5:].strip()
+        if data == '[DONE]':
+            self.done = True
+            return ''
+        chunk = json.loads(data)
+        if chunk.get('usage'):
+            self.usage = chunk['usage']
+        text = ''
+        for choice in chunk.get('choices') or []:
+            text += (choice.get('delta') or {}).get('content') or ''
+            self.finish_reason = choice.get('finish_reason') or self.finish_reason
+        if text:
+            self.parts.append(text)
+        return text
+
+    def result(self):
+        return chat_completion(''.join(self.parts), self.finish_reason, self.usage)
+
+
 class DeepSeekIntegration:
     @classmethod
     def _make_request(cls, endpoint, payload):
@@ -23,63 +130,159 @@ class DeepSeekIntegration:
             
         Raises:
             requests.exceptions.RequestException: Если произошла ошибка при запросе
+            CircuitOpenError: Если API недоступен, а в кэше нет даже устаревшего ответа
         """
-        headers = {
-            "Authorization": f"Bearer {settings.DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        response_cache = get_response_cache()
+        cache_key = make_cache_key(endpoint, payload)
+        cached_response, stale = response_cache.get_stale(cache_key)
         
-        # Генерируем уникальный ключ кэша на основе endpoint и payload
-        cache_key = f"deepseek_{endpoint}_{hash(json.dumps(payload, sort_keys=True))}"
-        cached_response = cache.get(cache_key)
-        
-        if cached_response:
+        if cached_response and not stale:
             logger.debug(f"Возвращаем закэшированный ответ для ключа: {cache_key}")
             return cached_response
 
+        if cached_response:
+            # Устаревший ответ отдаем сразу; обновляем в фоне, если API доступен
+            logger.debug(f"Возвращаем устаревший ответ для ключа: {cache_key}")
+            cls._start_revalidation(endpoint, payload, cache_key)
+            return cached_response
+
+        get_breaker().check()
+        # Одинаковые одновременные запросы (в том числе из других воркеров) ждут один вызов API
+        return get_single_flight('deepseek').do(
+            cache_key,
+            lambda: cls._fetch(endpoint, payload, cache_key),
+            lambda: response_cache.get(cache_key)
+        )
+
+    @classmethod
+    def _start_revalidation(cls, endpoint, payload, cache_key):
+        if get_breaker().allow():
+            _revalidation_executor.submit(cls._revalidate, endpoint, payload, cache_key)
+
+    @classmethod
+    def _revalidate(cls, endpoint, payload, cache_key):
+        """Фоновое обновление устаревшего ответа в кэше"""
         try:
-            logger.info(f"Отправка запроса к DeepSeek API: {endpoint}")
-            response = requests.post(
-                f"{settings.DEEPSEEK_API_URL}/{endpoint}",
-                headers=headers,
-                json=payload,
-                timeout=settings.DEEPSEEK_TIMEOUT
+            get_single_flight('deepseek').do(
+                cache_key,
+                lambda: cls._fetch(endpoint, payload, cache_key),
+                lambda: get_response_cache().get(cache_key)
             )
-            response.raise_for_status()
-            
+        except Exception as e:
+            logger.warning(f"Не удалось обновить устаревший ответ {cache_key}: {e!r}")
+
+    @classmethod
+    def _fetch(cls, endpoint, payload, cache_key):
+        """Запрос к API с сохранением ответа в кэш и записью истории"""
+        response_cache = get_response_cache()
+        started = time.perf_counter()
+        try:
+            logger.info(f"Отправка запроса к DeepSeek API: {endpoint}")
+            # Слот общего для воркеров ограничителя: ждем очереди или RateLimitExceeded
+            with get_limiter().slot(), get_breaker().track():
+                response = get_client().post(endpoint, payload)
             result = response.json()
             
             # Сохраняем в кэш
-            cache.set(cache_key, result, settings.AI_CONFIG['CACHE_TIMEOUT'])
+            response_cache.set(cache_key, result)
             logger.debug(f"Ответ сохранен в кэш с ключом: {cache_key}")
             
-            # Логируем успешный запрос в базу данных
-            AIRequestHistory.objects.create(
-                request_type=endpoint,
-                request_data=payload,
-                response_data=result,
-                api_endpoint=endpoint,
-                model_used=settings.DEEPSEEK_MODEL
-            )
+            # Логируем успешный запрос (запись в БД выполняется в фоне)
+            record_history(**cls._history_entry(endpoint, payload, started, result))
             
             return result
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Ошибка при запросе к DeepSeek API: {str(e)}")
             
-            # Логируем ошибку в базу данных
-            AIRequestHistory.objects.create(
-                request_type=endpoint,
-                request_data=payload,
-                response_data={"error": str(e)},
-                is_error=True,
-                api_endpoint=endpoint,
-                model_used=settings.DEEPSEEK_MODEL
-            )
+            # Логируем ошибку (запись в БД выполняется в фоне)
+            record_history(**cls._history_entry(endpoint, payload, started, error=e))
             raise
 
     @classmethod
-    def generate_text(cls, prompt, max_tokens=None, temperature=None):
+    def _stream_request(cls, endpoint, payload):
+        """
+        Потоковый запрос к API DeepSeek: генератор фрагментов текста по мере
+        их генерации. Собранный ответ кэшируется под ключом обычного запроса,
+        поэтому повтор отдается из кэша одним фрагментом. Оборванный поток
+        (например, пользователь закрыл страницу) в кэш не попадает.
+
+        Raises:
+            requests.exceptions.RequestException: Если произошла ошибка при запросе
+            CircuitOpenError: Если API недоступен, а в кэше нет даже устаревшего ответа
+        """
+        response_cache = get_response_cache()
+        cache_key = make_cache_key(endpoint, payload)
+        cached_response, stale = response_cache.get_stale(cache_key)
+
+        if cached_response:
+            logger.debug(f"Возвращаем закэшированный ответ для ключа: {cache_key}")
+            if stale:
+                cls._start_revalidation(endpoint, payload, cache_key)
+            yield cached_response['choices'][0]['message']['content']
+            return
+
+        get_breaker().check()
+        started = time.perf_counter()
+        stream = ChatStream()
+        try:
+            logger.info(f"Отправка потокового запроса к DeepSeek API: {endpoint}")
+            with get_limiter().slot():
+                # Выключатель учитывает время до ответа API, а не длину генерации
+                with get_breaker().track():
+                    response = get_client().post(endpoint, cls._stream_payload(payload), stream=True)
+                with response:
+                    response.encoding = 'utf-8'
+                    for line in response.iter_lines(decode_unicode=True):
+                        text = stream.feed(line)
+                        if text:
+                            cls._log_first_token(stream, started)
+                            yield text
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Ошибка при потоковом запросе к DeepSeek API: {str(e)}")
+            record_history(**cls._history_entry(endpoint, payload, started, error=e))
+            raise
+
+        if not stream.complete:
+            logger.warning("Поток ответа DeepSeek API оборван, ответ не кэшируется")
+            return
+        result = stream.result()
+        response_cache.set(cache_key, result)
+        record_history(**cls._history_entry(endpoint, payload, started, result))
+
+    @staticmethod
+    def _stream_payload(payload):
+        return {**payload, 'stream': True, 'stream_options': {'include_usage': True}}
+
+    @staticmethod
+    def _log_first_token(stream, started):
+        if len(stream.parts) == 1:
+            logger.info(f"Первый фрагмент ответа DeepSeek API через {time.perf_counter() - started:.2f} с")
+
+    @staticmethod
+    def _history_entry(endpoint, payload, started, result=None, error=None):
+        """Поля записи AIRequestHistory для запроса к API, начатого в момент started"""
+        entry = {
+            'request_type': endpoint,
+            'request_data': payload,
+            'response_data': result if error is None else {"error": str(error)},
+            'api_endpoint': endpoint,
+            'model_used': settings.DEEPSEEK_MODEL,
+            'processing_time': time.perf_counter() - started,
+            **token_usage(result)
+        }
+        if error is not None:
+            entry['is_error'] = True
+        else:
+            logger.info(
+                f"Запрос к DeepSeek API {endpoint}: токенов на входе {entry['input_tokens']}, "
+                f"на выходе {entry['output_tokens']}, {entry['processing_time']:.2f} с"
+            )
+        return entry
+
+    @classmethod
+    def generate_text(cls, prompt, max_tokens=None, temperature=None, stream=False):
         """
         Генерирует текст с помощью DeepSeek API.
         
@@ -87,14 +290,280 @@ class DeepSeekIntegration:
             prompt (str): Текст запроса
             max_tokens (int, optional): Максимальное количество токенов в ответе
             temperature (float, optional): Параметр температуры для генерации
+            stream (bool): Возвращать текст фрагментами по мере генерации
             
         Returns:
             dict: Ответ от API с сгенерированным текстом
+            (при stream=True — генератор фрагментов текста)
+        """
+        payload = cls._chat_payload(prompt, max_tokens, temperature)
+        if stream:
+            return cls._stream_request("chat/completions", payload)
+        return cls._make_request("chat/completions", payload)
+
+    @classmethod
+    def optimize_text(cls, text, context, stream=False, max_input_tokens=None):
+        """
+        Улучшает юридический текст с учетом контекста дела.
+
+        Args:
+            text (str): Исходный текст
+            context (str): Контекст (тип документа, обстоятельства дела)
+            stream (bool): Возвращать текст фрагментами по мере генерации
+            max_input_tokens (int, optional): Бюджет промпта; контекст сокращается до него
+
+        Returns:
+            dict: Ответ от API с оптимизированным текстом
+            (при stream=True — генератор фрагментов текста)
+        """
+        return cls.generate_text(
+            optimize_prompt(text, context, max_input_tokens or input_budget()),
+            temperature=settings.AI_CONFIG['DOCUMENT_TEMPERATURE'],
+            stream=stream
+        )
+
+    @classmethod
+    def get_field_help(cls, template, field_meta):
+        """
+        Справка по полю шаблона: из индекса FieldHelp (заполняется командой
+        build_field_help), при промахе — генерация через API с сохранением в индекс.
+
+        Args:
+            template (DocumentTemplate): Шаблон документа
+            field_meta (dict): Описание поля из fields_schema
+
+        Returns:
+            dict: help_text, examples, common_mistakes, legal_references
+
+        Raises:
+            requests.exceptions.RequestException: Если произошла ошибка при запросе
+            ValueError: Если ответ модели не удалось разобрать
         """
-        payload = {
+        help_data = get_stored_field_help(template, field_meta)
+        if help_data is None:
+            help_data = cls.generate_field_help(template, field_meta)
+            store_field_help(template, field_meta, help_data)
+        return help_data
+
+    @classmethod
+    def generate_field_help(cls, template, field_meta):
+        """Генерирует справку по полю через API, минуя индекс"""
+        result = cls._make_request("chat/completions", cls._field_help_payload(template, field_meta))
+        return cls._parse_field_help(result['choices'][0]['message']['content'])
+
+    @classmethod
+    def _field_help_payload(cls, template, field_meta):
+        return {
+            **cls._chat_payload(
+                cls._field_help_prompt(template, field_meta),
+                max_tokens=1000,
+                temperature=settings.AI_CONFIG['DOCUMENT_TEMPERATURE']
+            ),
+            "response_format": {"type": "json_object"}
+        }
+
+    @staticmethod
+    def _field_help_prompt(template, field_meta):
+        details = [
+            f"Документ: {template.get_doc_type_display()} «{template.name}» ({template.get_category_display()})",
+            f"Поле: {field_meta.get('label', field_meta['name'])} (тип: {field_meta.get('type', 'text')}, "
+            f"{'обязательное' if field_meta.get('required') else 'необязательное'})",
+        ]
+        if field_meta.get('options'):
+            details.append(f"Варианты: {', '.join(map(str, field_meta['options']))}")
+        if field_meta.get('help_text'):
+            details.append(f"Подсказка шаблона: {field_meta['help_text']}")
+        return "\n".join([
+            "Подготовьте справку для пользователя, заполняющего поле юридического документа.",
+            *details,
+            "",
+            "Ответьте JSON-объектом с ключами:",
+            "help_text - что указать в поле и зачем (2-4 предложения);",
+            "examples - 2-3 примера заполнения;",
+            "common_mistakes - типичные ошибки при заполнении;",
+            "legal_references - нормы права, относящиеся к полю (статьи кодексов и законов).",
+        ])
+
+    @staticmethod
+    def _parse_field_help(content):
+        """Справка из ответа модели: JSON-объект, возможно в блоке ```json"""
+        start, end = content.find('{'), content.rfind('}')
+        if start == -1 or end < start:
+            raise ValueError("Ответ модели не содержит JSON")
+        data = json.loads(content[start:end + 1])
+        if not isinstance(data, dict):
+            raise ValueError("Ответ модели не является JSON-объектом")
+
+        def strings(value):
+            if isinstance(value, str):
+                value = [value]
+            return [str(item).strip() for item in value or [] if str(item).strip()]
+
+        return {
+            'help_text': str(data.get('help_text') or '').strip(),
+            'examples': strings(data.get('examples')),
+            'common_mistakes': strings(data.get('common_mistakes')),
+            'legal_references': strings(data.get('legal_references')),
+        }
+
+    @staticmethod
+    def _chat_payload(prompt, max_tokens=None, temperature=None):
+        return {
             "model": settings.DEEPSEEK_MODEL,
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": max_tokens or settings.AI_CONFIG['MAX_TOKENS'],
             "temperature": temperature or settings.AI_CONFIG['TEMPERATURE']
         }
-        return cls._make_request("chat/completions", payload)
\ No newline at end of file
+
+
+class AsyncDeepSeekIntegration(DeepSeekIntegration):
+    """
+    Асинхронный вариант DeepSeekIntegration для ASGI: ожидание ответа API
+    не занимает поток, поэтому один воркер обслуживает сотни запросов.
+    Кэш и история общие с синхронным вариантом.
+    """
+
+    @classmethod
+    async def _make_request(cls, endpoint, payload):
+        """
+        Асинхронный запрос к API DeepSeek с кэшированием и логированием.
+
+        Raises:
+            requests.exceptions.RequestException: Если произошла ошибка при запросе
+        """
+        response_cache = get_response_cache()
+        cache_key = make_cache_key(endpoint, payload)
+        # SQLite может ждать блокировку — не держим событийное кольцо
+        cache_get = sync_to_async(response_cache.get, thread_sensitive=False)
+        cached_response, stale = await sync_to_async(response_cache.get_stale, thread_sensitive=False)(cache_key)
+
+        if cached_response and not stale:
+            logger.debug(f"Возвращаем закэшированный ответ для ключа: {cache_key}")
+            return cached_response
+
+        if cached_response:
+            logger.debug(f"Возвращаем устаревший ответ для ключа: {cache_key}")
+            await cls._start_revalidation(endpoint, payload, cache_key)
+            return cached_response
+
+        await sync_to_async(get_breaker().check, thread_sensitive=False)()
+        return await get_single_flight('deepseek').ado(
+            cache_key,
+            lambda: cls._fetch(endpoint, payload, cache_key),
+            lambda: cache_get(cache_key)
+        )
+
+    @classmethod
+    async def _start_revalidation(cls, endpoint, payload, cache_key):
+        if await sync_to_async(get_breaker().allow, thread_sensitive=False)():
+            task = asyncio.get_running_loop().create_task(cls._revalidate(endpoint, payload, cache_key))
+            _revalidation_tasks.add(task)
+            task.add_done_callback(_revalidation_tasks.discard)
+
+    @classmethod
+    async def _revalidate(cls, endpoint, payload, cache_key):
+        """Фоновое обновление устаревшего ответа в кэше"""
+        try:
+            await get_single_flight('deepseek').ado(
+                cache_key,
+                lambda: cls._fetch(endpoint, payload, cache_key),
+                lambda: sync_to_async(get_response_cache().get, thread_sensitive=False)(cache_key)
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось обновить устаревший ответ {cache_key}: {e!r}")
+
+    @classmethod
+    async def _fetch(cls, endpoint, payload, cache_key):
+        """Асинхронный запрос к API с сохранением ответа в кэш и записью истории"""
+        response_cache = get_response_cache()
+        started = time.perf_counter()
+        try:
+            logger.info(f"Отправка асинхронного запроса к DeepSeek API: {endpoint}")
+            async with get_limiter().aslot(), get_breaker().atrack():
+                response = await get_async_client().post(endpoint, payload)
+            result = response.json()
+
+            await sync_to_async(response_cache.set, thread_sensitive=False)(cache_key, result)
+            await arecord_history(**cls._history_entry(endpoint, payload, started, result))
+
+            return result
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Ошибка при запросе к DeepSeek API: {e!r}")
+            await arecord_history(**cls._history_entry(endpoint, payload, started, error=e))
+            raise
+
+    @classmethod
+    async def _stream_request(cls, endpoint, payload):
+        """Асинхронный вариант потокового запроса: async-генератор фрагментов текста"""
+        response_cache = get_response_cache()
+        cache_key = make_cache_key(endpoint, payload)
+        cached_response, stale = await sync_to_async(response_cache.get_stale, thread_sensitive=False)(cache_key)
+
+        if cached_response:
+            logger.debug(f"Возвращаем закэшированный ответ для ключа: {cache_key}")
+            if stale:
+                await cls._start_revalidation(endpoint, payload, cache_key)
+            yield cached_response['choices'][0]['message']['content']
+            return
+
+        await sync_to_async(get_breaker().check, thread_sensitive=False)()
+        started = time.perf_counter()
+        stream = ChatStream()
+        try:
+            logger.info(f"Отправка асинхронного потокового запроса к DeepSeek API: {endpoint}")
+            async with get_limiter().aslot():
+                async with get_breaker().atrack():
+                    response = await get_async_client().post(endpoint, cls._stream_payload(payload), stream=True)
+                try:
+                    async for line in response.aiter_lines():
+                        text = stream.feed(line)
+                        if text:
+                            cls._log_first_token(stream, started)
+                            yield text
+                finally:
+                    await response.aclose()
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Ошибка при потоковом запросе к DeepSeek API: {e!r}")
+            await arecord_history(**cls._history_entry(endpoint, payload, started, error=e))
+            raise
+
+        if not stream.complete:
+            logger.warning("Поток ответа DeepSeek API оборван, ответ не кэшируется")
+            return
+        result = stream.result()
+        await sync_to_async(response_cache.set, thread_sensitive=False)(cache_key, result)
+        await arecord_history(**cls._history_entry(endpoint, payload, started, result))
+
+    @classmethod
+    async def generate_text(cls, prompt, max_tokens=None, temperature=None, stream=False):
+        """Асинхронно генерирует текст с помощью DeepSeek API (stream=True — async-генератор фрагментов)"""
+        payload = cls._chat_payload(prompt, max_tokens, temperature)
+        if stream:
+            return cls._stream_request("chat/completions", payload)
+        return await cls._make_request("chat/completions", payload)
+
+    @classmethod
+    async def get_field_help(cls, template, field_meta):
+        """Асинхронно возвращает справку по полю: из индекса FieldHelp или через API"""
+        help_data = await sync_to_async(get_stored_field_help)(template, field_meta)
+        if help_data is None:
+            help_data = await cls.generate_field_help(template, field_meta)
+            await sync_to_async(store_field_help)(template, field_meta, help_data)
+        return help_data
+
+    @classmethod
+    async def generate_field_help(cls, template, field_meta):
+        """Асинхронно генерирует справку по полю через API, минуя индекс"""
+        result = await cls._make_request("chat/completions", cls._field_help_payload(template, field_meta))
+        return cls._parse_field_help(result['choices'][0]['message']['content'])
+
+    @classmethod
+    async def optimize_text(cls, text, context, stream=False, max_input_tokens=None):
+        """Асинхронно улучшает юридический текст с учетом контекста дела"""
+        return await cls.generate_text(
+            optimize_prompt(text, context, max_input_tokens or input_budget()),
+            temperature=settings.AI_CONFIG['DOCUMENT_TEMPERATURE'],
+            stream=stream
+        )
\ No newline at end of file
@@ -0,0 +1,326 @@
+# documents/sharedstore.py
+"""
+Общее для всех воркеров и перезапусков хранилище ключ-значение на SQLite.
+
+Кэш Django (LocMemCache) живет внутри процесса, поэтому gunicorn-воркеры
+не видят записи друг друга. SharedStore хранит значения в одном файле SQLite
+(режим WAL: чтения не блокируют запись), с TTL, ограничением числа записей
+на пространство имен и счетчиками попаданий/промахов. Записи с истекшим
+TTL могут храниться еще stale_timeout секунд и читаться get_stale():
+устаревший ответ лучше, чем никакого, пока источник недоступен.
+
+Чтение ничего не пишет в файл: попадания и промахи считаются в процессе
+и выгружаются в таблицу counters не чаще раза в flush_interval секунд,
+а время последнего чтения записи (для вытеснения) обновляется, только если
+оно старше touch_interval секунд.
+
+SQLiteConnection — соединения с файлом хранилища для этого и других
+модулей, хранящих общее состояние воркеров в том же файле.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (namespace, accessed_at);
+CREATE TABLE IF NOT EXISTS counters (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (namespace, name)
+);
+"""
+
+
+class SQLiteConnection:
+    """
+    Соединение с файлом SQLite: свое в каждом потоке и процессе (соединение
+    SQLite нельзя передавать между потоками и через fork), в режиме WAL,
+    со схемой schema. Вызов возвращает соединение текущего потока
+    """
+
+    def __init__(self, path, schema):
+        self.path = str(path)
+        self.schema = schema
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(self.schema)
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+
+def to_seconds(timeout):
+    """TTL в секундах: число, timedelta или None (без срока)"""
+    if isinstance(timeout, timedelta):
+        return timeout.total_seconds()
+    return timeout
+
+
+class SharedStore:
+    """
+    Пространство имен в общем SQLite-хранилище.
+    Ошибки SQLite не пробрасываются: хранилище работает как кэш,
+    и его недоступность не должна ломать запрос.
+    """
+
+    def __init__(self, path, namespace='default', max_entries=10000, timeout=None, stale_timeout=None,
+                 flush_interval=5.0, touch_interval=60.0):
+        self.path = str(path)
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.default_timeout = to_seconds(timeout)
+        self.stale_timeout = to_seconds(stale_timeout) or 0
+        self.flush_interval = flush_interval
+        self.touch_interval = touch_interval
+        self._connect = SQLiteConnection(self.path, _SCHEMA)
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._flushed_at = time.monotonic()
+
+    def _count(self, name, delta=1):
+        """Счетчик процесса; в общую таблицу — раз в flush_interval секунд"""
+        with self._lock:
+            self._counters[name] += delta
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush_counters()
+
+    def flush_counters(self):
+        """Выгружает счетчики процесса в таблицу counters"""
+        with self._lock:
+            counters, self._counters = self._counters, defaultdict(int)
+            self._flushed_at = time.monotonic()
+        if not counters:
+            return
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    'INSERT INTO counters (namespace, name, value) VALUES (?, ?, ?) '
+                    'ON CONFLICT (namespace, name) DO UPDATE SET value = value + excluded.value',
+                    [(self.namespace, name, delta) for name, delta in counters.items()]
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось записать счетчики общего хранилища ({self.namespace}): {str(e)}")
+
+    def _read(self, key, now, grace):
+        """
+        Строка записи (value, expires_at), если ее срок с запасом grace не истек.
+        accessed_at обновляется, только если запись не читали touch_interval секунд
+        """
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT value, expires_at, accessed_at FROM entries WHERE namespace = ? AND key = ?',
+            (self.namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] + grace <= now):
+            return None
+        if now - row[2] >= self.touch_interval:
+            conn.execute(
+                'UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                (now, self.namespace, key)
+            )
+        return row[:2]
+
+    def get(self, key, default=None):
+        """Значение по ключу или default, если записи нет или срок истек"""
+        try:
+            row = self._read(key, time.time(), 0)
+            if row is None:
+                self._count('misses')
+                return default
+            value = pickle.loads(row[0])
+        except (sqlite3.Error, pickle.UnpicklingError) as e:
+            logger.warning(f"Общее хранилище недоступно ({self.namespace}): {str(e)}")
+            return default
+        self._count('hits')
+        return value
+
+    def get_stale(self, key, default=None):
+        """
+        Значение с учетом устаревших записей (TTL истек не более stale_timeout назад).
+        Returns:
+            tuple: (значение или default, устарело ли значение)
+        """
+        now = time.time()
+        try:
+            row = self._read(key, now, self.stale_timeout)
+            if row is None:
+                self._count('misses')
+                return default, False
+            value = pickle.loads(row[0])
+        except (sqlite3.Error, pickle.UnpicklingError) as e:
+            logger.warning(f"Общее хранилище недоступно ({self.namespace}): {str(e)}")
+            return default, False
+        stale = row[1] is not None and row[1] <= now
+        self._count('stale_hits' if stale else 'hits')
+        return value, stale
+
+    def contains(self, key):
+        """Есть ли запись с неистекшим сроком. Только чтение: без счетчиков и времени обращения"""
+        try:
+            row = self._connect().execute(
+                'SELECT 1 FROM entries WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (self.namespace, key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Общее хранилище недоступно ({self.namespace}): {str(e)}")
+            return False
+        return row is not None
+
+    def set(self, key, value, timeout=None):
+        """Сохраняет значение; при превышении max_entries вытесняет давно не читавшиеся записи"""
+        timeout = to_seconds(timeout) if timeout is not None else self.default_timeout
+        now = time.time()
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries (namespace, key, value, expires_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (self.namespace, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                     now + timeout if timeout is not None else None, now)
+                )
+                self._cull(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось записать в общее хранилище ({self.namespace}): {str(e)}")
+
+    def add(self, key, value, timeout=None):
+        """
+        Сохраняет значение, только если ключа нет или срок записи истек.
+        Проверка и запись атомарны между процессами, поэтому запись с TTL
+        годится как блокировка с арендой.
+        Returns:
+            bool: записано ли значение (True и при недоступном хранилище)
+        """
+        timeout = to_seconds(timeout) if timeout is not None else self.default_timeout
+        now = time.time()
+        try:
+            conn = self._connect()
+            with conn:
+                added = conn.execute(
+                    'INSERT INTO entries (namespace, key, value, expires_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, '
+                    'expires_at = excluded.expires_at, accessed_at = excluded.accessed_at '
+                    'WHERE entries.expires_at <= ?',
+                    (self.namespace, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                     now + timeout if timeout is not None else None, now, now)
+                ).rowcount
+                if added:
+                    self._cull(conn, now)
+            return added > 0
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось записать в общее хранилище ({self.namespace}): {str(e)}")
+            return True
+
+    def _cull(self, conn, now):
+        conn.execute(
+            'DELETE FROM entries WHERE namespace = ? AND expires_at <= ?',
+            (self.namespace, now - self.stale_timeout)
+        )
+        evicted = conn.execute(
+            'DELETE FROM entries WHERE namespace = ? AND key IN ('
+            '  SELECT key FROM entries WHERE namespace = ? '
+            '  ORDER BY accessed_at DESC LIMIT -1 OFFSET ?'
+            ')',
+            (self.namespace, self.namespace, self.max_entries)
+        ).rowcount
+        if evicted:
+            self._count('evictions', evicted)
+
+    def delete(self, key):
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    'DELETE FROM entries WHERE namespace = ? AND key = ?',
+                    (self.namespace, key)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось удалить запись общего хранилища ({self.namespace}): {str(e)}")
+
+    def clear(self):
+        """Удаляет все записи и счетчики пространства имен"""
+        with self._lock:
+            self._counters.clear()
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM entries WHERE namespace = ?', (self.namespace,))
+            conn.execute('DELETE FROM counters WHERE namespace = ?', (self.namespace,))
+
+    def stats(self):
+        """Статистика пространства имен по всем процессам (без невыгруженных счетчиков других процессов)"""
+        self.flush_counters()
+        conn = self._connect()
+        counters = dict(conn.execute(
+            'SELECT name, value FROM counters WHERE namespace = ?', (self.namespace,)
+        ).fetchall())
+        size = conn.execute(
+            'SELECT COUNT(*) FROM entries WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (self.namespace, time.time())
+        ).fetchone()[0]
+        hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+        total = hits + misses
+        return {
+            'size': size,
+            'maxsize': self.max_entries,
+            'hits': hits,
+            'misses': misses,
+            'evictions': counters.get('evictions', 0),
+            'stale_hits': counters.get('stale_hits', 0),
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_shared_store(namespace, max_entries=None, timeout=None, stale_timeout=None):
+    """Хранилище пространства имен в файле SHARED_STORE_PATH (один объект на процесс)"""
+    with _stores_lock:
+        store = _stores.get(namespace)
+        if store is None:
+            store = SharedStore(
+                settings.SHARED_STORE_PATH,
+                namespace=namespace,
+                max_entries=max_entries or getattr(settings, 'SHARED_STORE_MAX_ENTRIES', 10000),
+                timeout=timeout,
+                stale_timeout=stale_timeout,
+            )
+            _stores[namespace] = store
+        return store
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith('SHARED_STORE_') or setting == 'AI_CONFIG':
+        with _stores_lock:
+            _stores.clear()
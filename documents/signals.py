@@ -0,0 +1,44 @@
+# documents/signals.py
+import logging
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .catalogue import get_catalogue_version
+from .forms import invalidate_form_class
+from .models import DocumentTemplate
+from .rendering import build_example, get_example_version, invalidate_template
+from .specs import invalidate_template_spec
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=DocumentTemplate)
+@receiver(post_delete, sender=DocumentTemplate)
+def invalidate_template_caches(sender, instance, **kwargs):
+    """Сброс кэшей процесса при изменении или удалении шаблона"""
+    invalidate_template(instance.pk)
+    invalidate_template_spec(instance.pk)
+    invalidate_form_class(instance.pk)
+
+
+@receiver(post_save, sender=DocumentTemplate)
+@receiver(post_delete, sender=DocumentTemplate)
+def bump_catalogue_version(sender, instance, **kwargs):
+    """
+    Новая версия каталога для всех воркеров (поисковый индекс, кэш страниц) — после
+    фиксации транзакции, чтобы воркеры не перечитали незафиксированные данные
+    """
+    transaction.on_commit(get_catalogue_version().bump)
+
+
+@receiver(post_save, sender=DocumentTemplate)
+def refresh_example_render(sender, instance, raw=False, **kwargs):
+    """Перестраивает пример документа, если изменились файл шаблона или doc_type"""
+    if raw or not instance.template_file:
+        return
+    try:
+        if instance.example_version != get_example_version(instance):
+            build_example(instance)
+    except Exception as e:
+        # Пример перестроится при первом просмотре страницы шаблона
+        logger.error(f"Не удалось построить пример для шаблона {instance.pk}: {str(e)}")
@@ -0,0 +1,213 @@
+# documents/singleflight.py
+"""
+Объединение одинаковых одновременных запросов (single flight).
+
+Кэш ответов заполняется только после ответа API, поэтому несколько
+пользователей, одновременно запросивших одно и то же, без объединения
+отправят столько же запросов. Здесь первый вызов с ключом выполняет
+запрос, остальные ждут его результат:
+- в процессе — через событие (потоки) или общую задачу (asyncio);
+- между воркерами — через блокировку с арендой в общем хранилище:
+  воркер, не получивший блокировку, ждет ее снятия и берет ответ из кэша.
+  Блокировка проверяется только чтением, паузы между проверками растут
+  от poll_interval до max_poll_interval; дольше wait_timeout воркер не
+  ждет и отклоняет запрос (SingleFlightTimeout).
+"""
+import asyncio
+import logging
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .sharedstore import get_shared_store
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlightTimeout(Exception):
+    """Тот же запрос выполняет другой воркер дольше wait_timeout; retry_after — через сколько повторить"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Call:
+    """Выполняемый в процессе вызов, которого ждут другие потоки"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Однократное выполнение одинаковых одновременных вызовов.
+
+    do()/ado() принимают ключ, функцию запроса и функцию поиска результата
+    в общем кэше: запрос сам кладет ответ в кэш, а ожидавшие блокировку
+    другого воркера читают его оттуда. Если чужой запрос завершился
+    ошибкой, ожидавший воркер выполняет запрос сам.
+    """
+
+    def __init__(self, locks, lease=120, poll_interval=0.05, max_poll_interval=1.0, wait_timeout=None):
+        self.locks = locks
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(max_poll_interval, poll_interval)
+        self.wait_timeout = wait_timeout or lease
+        self.executed = 0
+        self.joined = 0
+        self.joined_remote = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+    def do(self, key, fetch, lookup):
+        """Результат fetch() — один вызов на ключ среди одновременных в процессе и между воркерами"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.joined += 1
+
+        if not leader:
+            if not call.done.wait(self.lease):
+                return fetch()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_exclusive(key, fetch, lookup)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run_exclusive(self, key, fetch, lookup):
+        deadline = None
+        while True:
+            if self.locks.add(key, True, timeout=self.lease):
+                try:
+                    self.executed += 1
+                    return fetch()
+                finally:
+                    self.locks.delete(key)
+            if deadline is None:
+                deadline = self._start_waiting(key)
+            # Блокировку держит другой воркер: ждем снятия (или истечения аренды)
+            for delay in self._poll_delays(key, deadline):
+                if not self.locks.contains(key):
+                    break
+                time.sleep(delay)
+            result = lookup()
+            if result is not None:
+                return result
+
+    def _start_waiting(self, key):
+        """Срок ожидания чужой блокировки"""
+        self.joined_remote += 1
+        logger.debug(f"Запрос {key} уже выполняется другим воркером, ждем ответ")
+        return time.monotonic() + self.wait_timeout
+
+    def _poll_delays(self, key, deadline):
+        """Паузы между проверками чужой блокировки: с удвоением до max_poll_interval и до срока deadline"""
+        delay = self.poll_interval
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Запрос {key} выполняется другим воркером дольше {self.wait_timeout} с")
+                raise SingleFlightTimeout(
+                    "Такой же запрос уже выполняется и не завершился вовремя, повторите позже",
+                    retry_after=self.max_poll_interval
+                )
+            yield min(delay, remaining)
+            delay = min(delay * 2, self.max_poll_interval)
+
+    async def ado(self, key, fetch, lookup):
+        """
+        Асинхронный вариант do(): fetch и lookup — корутинные функции.
+        Запрос выполняется отдельной задачей, поэтому отмена запроса
+        пользователя, начавшего его (разрыв соединения), не прерывает
+        его для остальных ожидающих.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get((loop, key))
+        if task is None:
+            task = loop.create_task(self._arun_exclusive(key, fetch, lookup))
+            self._tasks[(loop, key)] = task
+            task.add_done_callback(lambda done: self._forget(loop, key, done))
+        else:
+            self.joined += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, loop, key, task):
+        del self._tasks[(loop, key)]
+        # Ошибку получат ожидающие; если их не осталось, не пишем в лог "never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    async def _arun_exclusive(self, key, fetch, lookup):
+        add = sync_to_async(self.locks.add, thread_sensitive=False)
+        contains = sync_to_async(self.locks.contains, thread_sensitive=False)
+        deadline = None
+        while True:
+            if await add(key, True, timeout=self.lease):
+                try:
+                    self.executed += 1
+                    return await fetch()
+                finally:
+                    await sync_to_async(self.locks.delete, thread_sensitive=False)(key)
+            if deadline is None:
+                deadline = self._start_waiting(key)
+            for delay in self._poll_delays(key, deadline):
+                if not await contains(key):
+                    break
+                await asyncio.sleep(delay)
+            result = await lookup()
+            if result is not None:
+                return result
+
+    def stats(self):
+        """Счетчики процесса: выполнено запросов, присоединилось в процессе и из-за чужой блокировки"""
+        return {
+            'executed': self.executed,
+            'joined': self.joined,
+            'joined_remote': self.joined_remote,
+        }
+
+
+_single_flights = {}
+_single_flights_lock = threading.Lock()
+
+
+def get_single_flight(namespace):
+    """SingleFlight с блокировками в пространстве имен общего хранилища (один объект на процесс)"""
+    with _single_flights_lock:
+        single_flight = _single_flights.get(namespace)
+        if single_flight is None:
+            single_flight = SingleFlight(
+                get_shared_store(f"{namespace}-inflight"),
+                lease=getattr(settings, 'AI_COALESCE_LEASE', 120),
+                poll_interval=getattr(settings, 'AI_COALESCE_POLL_INTERVAL', 0.05),
+                wait_timeout=getattr(settings, 'AI_COALESCE_WAIT_TIMEOUT', None),
+            )
+            _single_flights[namespace] = single_flight
+        return single_flight
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith(('SHARED_STORE_', 'AI_COALESCE_')):
+        with _single_flights_lock:
+            _single_flights.clear()
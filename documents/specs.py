@@ -0,0 +1,90 @@
+# documents/specs.py
+import json
+import logging
+from django.conf import settings
+from .caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Разобранные схемы шаблонов, ключ: (id шаблона, ревизия)
+spec_cache = LRUCache(maxsize=getattr(settings, 'TEMPLATE_SPEC_CACHE_SIZE', 512))
+
+
+def _load_json(value, default):
+    """fields_schema/dynamic_blocks могут храниться строкой JSON"""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return default
+    return value if value is not None else default
+
+
+class TemplateSpec:
+    """
+    Неизменяемое разобранное описание шаблона: поля, динамические блоки
+    и производные имена полей формы dynamic_{block}_{field}
+    """
+    __slots__ = ('template_id', 'revision', 'fields', 'blocks', 'dynamic_fields', 'field_map')
+
+    def __init__(self, template_id, revision, fields, blocks):
+        dynamic_fields = tuple(
+            (f"dynamic_{block['id']}_{field['name']}", block['id'], field['name'], {
+                **field,
+                'name': f"dynamic_{block['id']}_{field['name']}",
+                'label': f"{block['title']} - {field['label']}"
+            })
+            for block in blocks
+            for field in block.get('fields', [])
+        )
+        object.__setattr__(self, 'template_id', template_id)
+        object.__setattr__(self, 'revision', revision)
+        object.__setattr__(self, 'fields', tuple(fields))
+        object.__setattr__(self, 'blocks', tuple(blocks))
+        object.__setattr__(self, 'dynamic_fields', dynamic_fields)
+        object.__setattr__(self, 'field_map', {field['name']: field for field in fields})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TemplateSpec неизменяем")
+
+    @classmethod
+    def from_template(cls, template):
+        fields_schema = _load_json(template.fields_schema, {'fields': []})
+        blocks = _load_json(getattr(template, 'dynamic_blocks', []), [])
+        return cls(
+            template.pk,
+            getattr(template, 'revision', 0),
+            fields_schema.get('fields', []) if isinstance(fields_schema, dict) else [],
+            blocks if isinstance(blocks, list) else [],
+        )
+
+    @property
+    def form_fields(self):
+        """Конфигурации всех полей формы: обычные поля, затем поля динамических блоков"""
+        return self.fields + tuple(config for _, _, _, config in self.dynamic_fields)
+
+    def block_data(self, cleaned_data):
+        """Данные динамических блоков из очищенных данных формы: {block_id: {field: value}}"""
+        data = {block['id']: {} for block in self.blocks}
+        for form_name, block_id, field_name, _ in self.dynamic_fields:
+            data[block_id][field_name] = cleaned_data.get(form_name)
+        return data
+
+
+def get_template_spec(template):
+    """Возвращает TemplateSpec шаблона из кэша процесса"""
+    if template.pk is None:
+        return TemplateSpec.from_template(template)
+
+    key = (template.pk, getattr(template, 'revision', 0))
+    spec = spec_cache.get(key)
+    if spec is None:
+        spec = TemplateSpec.from_template(template)
+        invalidate_template_spec(template.pk)
+        spec_cache.set(key, spec)
+    return spec
+
+
+def invalidate_template_spec(template_id):
+    """Удаляет из кэша все ревизии описания шаблона"""
+    return spec_cache.invalidate(lambda key: key[0] == template_id)
@@ -0,0 +1,112 @@
+# documents/stemmer.py
+"""
+Стеммер русского языка (алгоритм Snowball, snowballstem.org) на чистом Python.
+
+Отсекает окончания, чтобы разные формы слова давали одну основу:
+"жалоба", "жалобы", "жалобой" -> "жалоб". Слова на латинице и числа
+возвращаются без изменений (в нижнем регистре).
+"""
+from functools import lru_cache
+
+VOWELS = 'аеиоуыэюя'
+
+# Окончания, перед которыми должна стоять "а" или "я" (группа 1 в алгоритме)
+PERFECTIVE_GERUND_1 = ('в', 'вши', 'вшись')
+PERFECTIVE_GERUND_2 = ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись')
+ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+REFLEXIVE = ('ся', 'сь')
+VERB_1 = ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно')
+VERB_2 = (
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым',
+    'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+)
+NOUN = (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой',
+    'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию',
+    'ью', 'ю', 'ия', 'ья', 'я',
+)
+SUPERLATIVE = ('ейш', 'ейше')
+DERIVATIONAL = ('ост', 'ость')
+
+
+def _longest(word, suffixes):
+    """Самое длинное окончание слова из suffixes или пустая строка"""
+    found = ''
+    for suffix in suffixes:
+        if len(suffix) > len(found) and word.endswith(suffix):
+            found = suffix
+    return found
+
+
+def _strip_grouped(word, group_1, group_2):
+    """
+    Отсекает самое длинное окончание из двух групп; окончание группы 1
+    отсекается, только если перед ним "а" или "я" (они остаются)
+    """
+    suffix_1 = _longest(word, group_1)
+    if suffix_1 and word[:-len(suffix_1)][-1:] not in ('а', 'я'):
+        suffix_1 = ''
+    suffix_2 = _longest(word, group_2)
+    suffix = max(suffix_1, suffix_2, key=len)
+    return (word[:-len(suffix)], True) if suffix else (word, False)
+
+
+def _strip(word, suffixes):
+    suffix = _longest(word, suffixes)
+    return (word[:-len(suffix)], True) if suffix else (word, False)
+
+
+def _region(word, start=0):
+    """Начало области после первой пары "гласная, согласная" начиная с start (R1/R2)"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    """Основа слова (в нижнем регистре, "ё" заменяется на "е")"""
+    word = word.lower().replace('ё', 'е')
+    rv_start = next((i + 1 for i, char in enumerate(word) if char in VOWELS), len(word))
+    if rv_start >= len(word):
+        return word
+    r2_start = _region(word, _region(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1
+    rv, found = _strip_grouped(rv, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if not found:
+        rv, _ = _strip(rv, REFLEXIVE)
+        rv, found = _strip(rv, ADJECTIVE)
+        if found:
+            rv, _ = _strip_grouped(rv, PARTICIPLE_1, PARTICIPLE_2)
+        else:
+            rv, found = _strip_grouped(rv, VERB_1, VERB_2)
+            if not found:
+                rv, _ = _strip(rv, NOUN)
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразующее окончание, целиком лежащее в R2
+    suffix = _longest(rv, DERIVATIONAL)
+    if suffix and rv_start + len(rv) - len(suffix) >= r2_start:
+        rv = rv[:-len(suffix)]
+
+    # Шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        rv, found = _strip(rv, SUPERLATIVE)
+        if found and rv.endswith('нн'):
+            rv = rv[:-1]
+        elif not found and rv.endswith('ь'):
+            rv = rv[:-1]
+    return prefix + rv
@@ -0,0 +1,81 @@
+# documents/storage.py
+"""
+Хранение файлов шаблонов по содержимому.
+
+Файл сохраняется под именем <каталог>/<2 символа хэша>/<sha256><расширение>:
+повторная загрузка того же файла не создает копию, а имя файла однозначно
+определяет его содержимое. Поэтому хэш содержимого — версия шаблона, по
+которой кэши (скомпилированные шаблоны, примеры, сгенерированные документы)
+узнают об изменении, не сверяя mtime. Файлы не перезаписываются: измененный
+шаблон — это новый файл.
+"""
+import hashlib
+import posixpath
+import re
+from django.core.files.storage import FileSystemStorage
+
+_HASHED_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{2}/([0-9a-f]{64})(?:\.[^/]*)?$')
+
+
+def content_hash(content):
+    """SHA-256 содержимого File (позиция чтения возвращается в начало)"""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def hash_from_name(name):
+    """Хэш из имени файла в хранилище по содержимому или None для прежних имен"""
+    match = _HASHED_NAME_RE.search(name or '')
+    return match.group(1) if match else None
+
+
+def hashed_name(name, digest):
+    """Имя файла с содержимым digest в каталоге name (расширение сохраняется)"""
+    directory, filename = posixpath.split(name)
+    extension = posixpath.splitext(filename)[1].lower()
+    return posixpath.join(directory, digest[:2], f"{digest}{extension}")
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, который сохраняет файл под хэшем содержимого"""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        name = hashed_name(name, content_hash(content))
+        if self.exists(name):
+            return name
+        saved = super().save(name, content, max_length)
+        if saved != name:
+            # Тот же файл успел сохранить другой процесс: копия не нужна
+            self.delete(saved)
+        return name
+
+
+template_storage = ContentAddressedStorage()
+
+
+def get_template_storage():
+    """Хранилище файлов шаблонов (вызываемый объект — для миграций)"""
+    return template_storage
+
+
+def file_hash(field_file):
+    """
+    Хэш содержимого файла поля FileField: из имени файла в хранилище по
+    содержимому, иначе — по данным (новая загрузка или файл с прежним именем).
+    Для отсутствующего файла — пустая строка
+    """
+    if getattr(field_file, '_committed', True):
+        digest = hash_from_name(field_file.name)
+        if digest:
+            return digest
+        try:
+            with field_file.storage.open(field_file.name, 'rb') as f:
+                return content_hash(f)
+        except FileNotFoundError:
+            return ''
+    return content_hash(field_file.file)
@@ -0,0 +1,34 @@
+# documents/tests/mixins.py
+import os
+import shutil
+import tempfile
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from documents.models import DocumentTemplate
+
+
+class TempStorageMixin:
+    """
+    SHARED_STORE_PATH и MEDIA_ROOT во временном каталоге на время тестов
+    класса: тесты не пишут в общее хранилище и media/ проекта
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp(prefix='autodocpro-tests-')
+        cls.addClassCleanup(shutil.rmtree, cls.temp_dir, ignore_errors=True)
+        overrides = override_settings(
+            SHARED_STORE_PATH=os.path.join(cls.temp_dir, 'shared_store.sqlite3'),
+            MEDIA_ROOT=os.path.join(cls.temp_dir, 'media'),
+        )
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+        super().setUpClass()
+
+
+def make_template(body, name="Ходатайство", doc_type='motion', **fields):
+    """Шаблон документа с файлом body (MEDIA_ROOT должен быть временным)"""
+    template = DocumentTemplate(name=name, doc_type=doc_type, description=fields.pop('description', ''), **fields)
+    template.template_file.save('template.html', ContentFile(body.encode('utf-8')), save=False)
+    template.save()
+    return template
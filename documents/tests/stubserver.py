@@ -0,0 +1,85 @@
+# documents/tests/stubserver.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def reply(status=200, body=None, headers=None):
+    """Ответ stub-сервера с Content-Length"""
+    content = json.dumps(body if body is not None else {}, ensure_ascii=False).encode('utf-8')
+    head = [f"HTTP/1.1 {status} Stub", "Content-Type: application/json", f"Content-Length: {len(content)}"]
+    head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + content
+
+
+def chunked(*chunks):
+    """Ответ 200 с Transfer-Encoding: chunked"""
+    body = b''.join(f"{len(chunk):x}\r\n".encode('ascii') + chunk + b'\r\n' for chunk in chunks)
+    return b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n" + body + b"0\r\n\r\n"
+
+
+class Close(bytes):
+    """Сырые байты ответа, после которых сервер закрывает соединение"""
+
+
+class Delay(float):
+    """Задержка перед следующим ответом (секунды)"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append({'path': self.path, 'body': json.loads(body or b'null'),
+                                     'connection': self.client_address})
+        with self.server.lock:
+            response, delay = self._next(), 0
+            if isinstance(response, Delay):
+                response, delay = self._next(), response
+        time.sleep(delay)
+        self.wfile.write(response)
+        self.wfile.flush()
+        if isinstance(response, Close):
+            self.close_connection = True
+
+    def _next(self):
+        return self.server.responses.pop(0) if self.server.responses else reply()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer:
+    """
+    Локальный HTTP/1.1 сервер вместо DeepSeek API: отдает заранее заданные
+    ответы по очереди (по умолчанию - 200 и {}) и запоминает запросы
+    """
+
+    def __init__(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.requests = []
+        self._server.responses = []
+        self._server.lock = threading.Lock()
+        self.url = f"http://127.0.0.1:{self._server.server_port}/v1"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def requests(self):
+        return self._server.requests
+
+    @property
+    def connections(self):
+        """Число разных TCP-соединений, по которым пришли запросы"""
+        return len({request['connection'] for request in self.requests})
+
+    def respond(self, *responses):
+        self._server.requests.clear()
+        self._server.responses[:] = responses
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,231 @@
+# documents/tests/test_breaker.py
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+import requests
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from documents import services
+from documents.breaker import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, get_breaker,
+                              is_upstream_failure)
+from documents.metrics import metrics
+from documents.models import FieldHelp
+from documents.services import DeepSeekIntegration, get_response_cache, make_cache_key
+from documents.singleflight import SingleFlightTimeout
+from .mixins import TempStorageMixin, make_template
+from .test_fieldhelp import COURT, HELP, JUDGE
+
+ANSWER = {'choices': [{'message': {'content': "Ответ"}}]}
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(response=response)
+
+
+class UpstreamFailureTests(SimpleTestCase):
+
+    def test_failures_of_api_and_of_request(self):
+        for error in (requests.exceptions.ConnectTimeout(), requests.exceptions.ConnectionError(),
+                      http_error(429), http_error(502)):
+            with self.subTest(error=repr(error)):
+                self.assertTrue(is_upstream_failure(error))
+        for error in (http_error(400), http_error(401), ValueError()):
+            with self.subTest(error=repr(error)):
+                self.assertFalse(is_upstream_failure(error))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp(prefix='autodocpro-tests-')
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.path = os.path.join(temp_dir, 'store.sqlite3')
+
+    def breaker(self, **options):
+        """Выключатель воркера: у каждого воркера свой объект, состояние — общее"""
+        options = {'failure_threshold': 2, 'reset_timeout': 0.05, 'probe_timeout': 60, **options}
+        return CircuitBreaker(self.path, **options)
+
+    def open(self, breaker):
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure("таймаут")
+        self.assertEqual(breaker.stats()['state'], OPEN)
+
+    def test_consecutive_failures_open_breaker_for_all_workers(self):
+        breaker, other = self.breaker(), self.breaker()
+        breaker.record_failure("таймаут")
+        self.assertEqual(other.stats()['state'], CLOSED)
+        other.record_failure("таймаут")
+        self.assertFalse(breaker.allow())
+        with self.assertRaises(CircuitOpenError) as raised:
+            other.check()
+        self.assertEqual(raised.exception.retry_after, 0.05)
+        self.assertEqual(breaker.stats()['rejected'], 2)
+
+    def test_success_resets_failure_count(self):
+        breaker = self.breaker()
+        breaker.record_failure("таймаут")
+        breaker.record_success()
+        breaker.record_failure("таймаут")
+        self.assertEqual(breaker.stats()['state'], CLOSED)
+
+    def test_single_probe_after_reset_timeout(self):
+        breaker, other = self.breaker(), self.breaker()
+        self.open(breaker)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.stats()['state'], HALF_OPEN)
+        # Пробный запрос уже выполняется: остальные отклоняются
+        self.assertFalse(other.allow())
+
+    def test_successful_probe_closes_breaker(self):
+        breaker = self.breaker()
+        self.open(breaker)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        stats = breaker.stats()
+        self.assertEqual((stats['state'], stats['failures']), (CLOSED, 0))
+        self.assertEqual((stats['opened'], stats['half_opened'], stats['closed']), (1, 1, 1))
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens_breaker(self):
+        breaker = self.breaker()
+        self.open(breaker)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure("таймаут")
+        self.assertEqual(breaker.stats()['state'], OPEN)
+        self.assertEqual(breaker.stats()['opened'], 2)
+        self.assertFalse(breaker.allow())
+
+    def test_lost_probe_is_replaced_after_probe_timeout(self):
+        breaker = self.breaker(probe_timeout=0.05)
+        self.open(breaker)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+
+    def test_track_counts_slow_calls_and_ignores_request_errors(self):
+        breaker = self.breaker(slow_call=0.01)
+        with self.assertRaises(requests.exceptions.HTTPError), breaker.track():
+            raise http_error(400)
+        self.assertEqual(breaker.stats()['failures'], 0)
+        with breaker.track():
+            time.sleep(0.02)
+        self.assertEqual(breaker.stats()['failures'], 1)
+
+    def test_atrack_counts_failures(self):
+        breaker = self.breaker()
+
+        async def fail():
+            async with breaker.atrack():
+                raise requests.exceptions.ReadTimeout()
+
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                asyncio.run(fail())
+        self.assertEqual(breaker.stats()['state'], OPEN)
+
+    def test_unavailable_store_counts_as_closed(self):
+        breaker = CircuitBreaker(os.path.join(self.path, 'missing', 'store.sqlite3'))
+        breaker.record_failure("таймаут")
+        self.assertTrue(breaker.allow())
+
+
+@override_settings(AI_BREAKER_ENABLED=True, AI_BREAKER_FAILURE_THRESHOLD=1, AI_BREAKER_RESET_TIMEOUT=60)
+class StaleWhileRevalidateTests(TempStorageMixin, SimpleTestCase):
+    endpoint, payload = 'chat/completions', {'messages': [{'role': 'user', 'content': "Вопрос"}]}
+
+    def setUp(self):
+        self.breaker = get_breaker()
+        self.breaker.reset()
+        self.cache_key = make_cache_key(self.endpoint, self.payload)
+        get_response_cache().delete(self.cache_key)
+        submit = mock.patch.object(services._revalidation_executor, 'submit')
+        self.submit = submit.start()
+        self.addCleanup(submit.stop)
+
+    def cache(self, timeout):
+        get_response_cache().set(self.cache_key, ANSWER, timeout=timeout)
+
+    def test_fresh_answer_is_served_without_revalidation(self):
+        self.cache(60)
+        self.assertEqual(DeepSeekIntegration._make_request(self.endpoint, self.payload), ANSWER)
+        self.submit.assert_not_called()
+
+    def test_stale_answer_is_served_and_revalidated(self):
+        self.cache(-1)
+        self.assertEqual(DeepSeekIntegration._make_request(self.endpoint, self.payload), ANSWER)
+        self.submit.assert_called_once_with(DeepSeekIntegration._revalidate, self.endpoint, self.payload,
+                                            self.cache_key)
+
+    def test_stale_answer_is_served_without_revalidation_while_open(self):
+        self.cache(-1)
+        self.breaker.record_failure("таймаут")
+        self.assertEqual(DeepSeekIntegration._make_request(self.endpoint, self.payload), ANSWER)
+        self.submit.assert_not_called()
+
+    def test_open_breaker_without_cached_answer_fails_fast(self):
+        self.breaker.record_failure("таймаут")
+        with mock.patch.object(DeepSeekIntegration, '_fetch') as fetch, self.assertRaises(CircuitOpenError):
+            DeepSeekIntegration._make_request(self.endpoint, self.payload)
+        fetch.assert_not_called()
+
+
+@override_settings(AI_BREAKER_ENABLED=True, AI_BREAKER_FAILURE_THRESHOLD=1, AI_BREAKER_RESET_TIMEOUT=60)
+class BreakerMetricsTests(TempStorageMixin, SimpleTestCase):
+
+    def test_transitions_and_state_are_exported(self):
+        metrics.reset()
+        breaker = get_breaker()
+        breaker.reset()
+        breaker.record_failure("таймаут")
+        self.assertFalse(breaker.allow())
+        text = metrics.render()
+        self.assertIn('autodocpro_ai_breaker_transitions_total{from="closed",to="open"} 1', text)
+        self.assertIn('autodocpro_ai_breaker_rejected_total 1', text)
+        self.assertIn('# TYPE autodocpro_ai_breaker_state gauge', text)
+        self.assertIn('autodocpro_ai_breaker_state{state="open"} 1', text)
+        self.assertIn('autodocpro_ai_breaker_state{state="closed"} 0', text)
+        breaker.record_success()
+        text = metrics.render()
+        self.assertIn('autodocpro_ai_breaker_transitions_total{from="open",to="closed"} 1', text)
+        self.assertIn('autodocpro_ai_breaker_state{state="closed"} 1', text)
+
+
+@override_settings(AI_BREAKER_ENABLED=True, AI_BREAKER_FAILURE_THRESHOLD=1, AI_BREAKER_RESET_TIMEOUT=60,
+                   AI_LIMITER_ENABLED=False)
+class BuildFieldHelpBreakerTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        self.template = make_template('<p></p>', fields_schema={'fields': [COURT, JUDGE]})
+        get_breaker().reset()
+
+    def test_open_breaker_fails_fields_without_aborting_build(self):
+        get_breaker().record_failure("таймаут")
+        out, err = StringIO(), StringIO()
+        with mock.patch.object(services, 'get_client') as get_client, \
+                mock.patch('documents.management.commands.build_field_help.time.sleep') as sleep:
+            call_command('build_field_help', '--concurrency', '1', stdout=out, stderr=err)
+        get_client.assert_not_called()
+        sleep.assert_not_called()
+        self.assertEqual(err.getvalue().count("Сервис AI временно недоступен"), 2)
+        self.assertIn("Сгенерировано справок: 0, ошибок: 2", out.getvalue())
+        self.assertFalse(FieldHelp.objects.exists())
+
+    def test_single_flight_timeout_is_retried(self):
+        waited = SingleFlightTimeout("Запрос выполняет другой воркер", retry_after=0.5)
+        with mock.patch.object(DeepSeekIntegration, 'generate_field_help', side_effect=[waited, HELP, HELP]), \
+                mock.patch('documents.management.commands.build_field_help.time.sleep') as sleep:
+            call_command('build_field_help', '--concurrency', '1', stdout=StringIO(), stderr=StringIO())
+        sleep.assert_called_once_with(0.5)
+        self.assertEqual(FieldHelp.objects.count(), 2)
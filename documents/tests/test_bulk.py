@@ -0,0 +1,120 @@
+# documents/tests/test_bulk.py
+import io
+import json
+import zipfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from documents.bulk import BulkInputError, generate_zip, read_rows
+from .mixins import TempStorageMixin, make_template
+
+FIELDS_SCHEMA = {'fields': [{'name': 'court_name', 'label': "Суд", 'type': 'text', 'required': True}]}
+
+
+def rows(data, input_format):
+    return list(read_rows(io.BytesIO(data), input_format))
+
+
+class ReadRowsTests(TestCase):
+
+    def test_csv_rows_with_bom(self):
+        data = '﻿court_name,case_number\r\nАрбитражный суд,А40-1\r\n\r\nМосковский суд,А40-2\r\n'
+        self.assertEqual(rows(data.encode('utf-8'), 'csv'), [
+            (1, {'court_name': "Арбитражный суд", 'case_number': 'А40-1'}),
+            (2, {'court_name': "Московский суд", 'case_number': 'А40-2'}),
+        ])
+
+    def test_multiline_csv_field(self):
+        data = 'court_name,motion_reason\r\nСуд,"первая строка\r\nвторая строка"\r\n'.encode('utf-8')
+        self.assertEqual(rows(data, 'csv'), [
+            (1, {'court_name': "Суд", 'motion_reason': "первая строка\r\nвторая строка"}),
+        ])
+
+    def test_non_utf8_file_is_rejected_before_reading_rows(self):
+        with self.assertRaises(BulkInputError):
+            read_rows(io.BytesIO('суд,дело\r\nАрбитражный суд,1\r\n'.encode('cp1251')), 'csv')
+
+    def test_empty_file_is_rejected(self):
+        for input_format in ('csv', 'jsonl'):
+            with self.subTest(input_format), self.assertRaises(BulkInputError):
+                read_rows(io.BytesIO(b'\r\n'), input_format)
+
+    def test_header_without_names_is_rejected(self):
+        with self.assertRaises(BulkInputError):
+            read_rows(io.BytesIO(b',,\r\n1,2\r\n'), 'csv')
+
+    def test_bad_csv_rows_are_reported_in_place(self):
+        data = b''.join([
+            'court_name\r\n'.encode('utf-8'),
+            'Арбитражный суд\r\n'.encode('cp1251'),
+            b'"' + b'x' * 200_000 + b'"\r\n',
+            'Московский суд\r\n'.encode('utf-8'),
+        ])
+        result = rows(data, 'csv')
+        self.assertEqual([index for index, _ in result], [1, 2, 3])
+        self.assertIsInstance(result[0][1], BulkInputError)
+        self.assertIn('UTF-8', str(result[0][1]))
+        self.assertIsInstance(result[1][1], BulkInputError)
+        self.assertIn('CSV', str(result[1][1]))
+        self.assertEqual(result[2][1], {'court_name': "Московский суд"})
+
+    def test_bad_jsonl_rows_are_reported_in_place(self):
+        data = b'\n'.join([
+            json.dumps({'court_name': "Суд"}, ensure_ascii=False).encode('utf-8'),
+            b'{"court_name": ',
+            b'[1, 2]',
+            '{"court_name": "Суд"}'.encode('cp1251'),
+        ])
+        result = rows(data, 'jsonl')
+        self.assertEqual(result[0], (1, {'court_name': "Суд"}))
+        self.assertEqual([index for index, _ in result], [1, 2, 3, 4])
+        self.assertTrue(all(isinstance(row, BulkInputError) for _, row in result[1:]))
+
+
+class BulkGenerateTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        self.template = make_template('<p>{{ court_name }}</p>', fields_schema=FIELDS_SCHEMA)
+
+    @staticmethod
+    def unzip(chunks):
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        return {name: archive.read(name) for name in archive.namelist()}
+
+    def test_manifest_lists_bad_rows(self):
+        data = 'court_name\r\nАрбитражный суд\r\n\xa0\r\n'.encode('utf-8') + 'Суд\r\n'.encode('cp1251')
+        files = self.unzip(generate_zip(self.template, read_rows(io.BytesIO(data), 'csv'), 'html', workers=1))
+        manifest = json.loads(files.pop('manifest.json'))
+        self.assertEqual(files, {'00001_motion.html': '<p>Арбитражный суд</p>'.encode('utf-8')})
+        self.assertEqual((manifest['total_rows'], manifest['generated']), (3, 1))
+        self.assertEqual([error['row'] for error in manifest['errors']], [2, 3])
+        self.assertIn('court_name', manifest['errors'][0]['errors'])
+
+    def test_max_rows_truncates(self):
+        data = 'court_name\n' + 'Суд\n' * 5
+        chunks = generate_zip(self.template, read_rows(io.BytesIO(data.encode('utf-8')), 'csv'),
+                              'html', workers=1, max_rows=2)
+        manifest = json.loads(self.unzip(chunks)['manifest.json'])
+        self.assertEqual((manifest['generated'], manifest['truncated']), (2, True))
+
+    def test_parallel_rendering_matches_serial(self):
+        data = ('court_name\r\n' + ''.join(f"Суд №{i}\r\n" for i in range(1, 6)) + '\r\n\xa0\r\n').encode('utf-8')
+        serial = self.unzip(generate_zip(self.template, read_rows(io.BytesIO(data), 'csv'), 'html', workers=1))
+        parallel = self.unzip(generate_zip(self.template, read_rows(io.BytesIO(data), 'csv'), 'html', workers=2))
+        self.assertEqual(list(parallel), list(serial))
+        self.assertEqual(parallel, serial)
+        self.assertEqual(json.loads(parallel['manifest.json'])['generated'], 5)
+
+    def test_view_rejects_non_utf8_csv_before_streaming(self):
+        upload = SimpleUploadedFile('rows.csv', 'Суд\r\nАрбитражный суд\r\n'.encode('cp1251'))
+        response = self.client.post(reverse('bulk_generate', args=[self.template.pk]),
+                                    {'rows': upload, 'format': 'html'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.json()['message'])
+
+    def test_view_streams_archive(self):
+        upload = SimpleUploadedFile('rows.jsonl', '{"court_name": "Суд"}\n'.encode('utf-8'))
+        response = self.client.post(reverse('bulk_generate', args=[self.template.pk]),
+                                    {'rows': upload, 'format': 'html'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('00001_motion.html', self.unzip(response.streaming_content))
@@ -0,0 +1,183 @@
+# documents/tests/test_clients.py
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import requests
+from django.test import SimpleTestCase
+from documents.clients import AsyncDeepSeekClient, DeepSeekClient, _RetryPolicy
+from .stubserver import Close, Delay, StubServer, chunked, reply
+
+
+class StubServerMixin:
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StubServer()
+        cls.addClassCleanup(cls.server.close)
+
+    def client_options(self, **options):
+        return {'base_url': self.server.url, 'api_key': 'test', 'max_retries': 2, 'connect_timeout': 1,
+                'read_timeout': 2, 'backoff_base': 0, 'backoff_max': 1, **options}
+
+
+class RetryAfterTests(SimpleTestCase):
+
+    @staticmethod
+    def retry_after(value):
+        return _RetryPolicy._retry_after(SimpleNamespace(headers={'Retry-After': value}))
+
+    def test_seconds(self):
+        self.assertEqual(self.retry_after('2.5'), 2.5)
+        self.assertEqual(self.retry_after('-1'), 0.0)
+
+    def test_http_date(self):
+        value = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        self.assertAlmostEqual(self.retry_after(value), 30, delta=2)
+
+    def test_invalid_value_is_ignored(self):
+        self.assertIsNone(self.retry_after('скоро'))
+
+
+class DeepSeekClientTests(StubServerMixin, SimpleTestCase):
+
+    def setUp(self):
+        self.client = DeepSeekClient(**self.client_options())
+        self.addCleanup(self.client.close)
+
+    def test_keep_alive_connection_is_reused(self):
+        self.server.respond(reply(body={'n': 1}), reply(body={'n': 2}), reply(body={'n': 3}))
+        results = [self.client.post('chat/completions', {'i': i}).json()['n'] for i in range(3)]
+        self.assertEqual(results, [1, 2, 3])
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.requests[0]['path'], '/v1/chat/completions')
+
+    def test_retries_with_retry_after(self):
+        self.server.respond(reply(429, headers={'Retry-After': '0'}), reply(503), reply(body={'ok': True}))
+        self.assertEqual(self.client.post('chat/completions', {}).json(), {'ok': True})
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_long_retry_after_is_not_waited(self):
+        self.server.respond(reply(429, headers={'Retry-After': '60'}))
+        with self.assertRaises(requests.exceptions.HTTPError) as caught:
+            self.client.post('chat/completions', {})
+        self.assertEqual(caught.exception.response.status_code, 429)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retries_are_limited(self):
+        self.server.respond(reply(502), reply(502), reply(502), reply(body={}))
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.client.post('chat/completions', {})
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.respond(reply(400, body={'error': 'bad'}))
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.client.post('chat/completions', {})
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_read_timeout_is_not_retried(self):
+        client = DeepSeekClient(**self.client_options(read_timeout=0.2))
+        self.addCleanup(client.close)
+        self.server.respond(Delay(0.5), reply())
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            client.post('chat/completions', {})
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_streamed_error_releases_connection(self):
+        self.server.respond(reply(429, body={'error': 'limit'}, headers={'Retry-After': '60'}), reply(body={'n': 1}))
+        with self.assertRaises(requests.exceptions.HTTPError) as caught:
+            self.client.post('chat/completions', {}, stream=True)
+        self.assertEqual(self.client.post('chat/completions', {}).json(), {'n': 1})
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(caught.exception.response.json(), {'error': 'limit'})
+
+    def test_closed_connection_is_replaced(self):
+        self.server.respond(Close(reply(body={'n': 1})), reply(body={'n': 2}))
+        self.assertEqual(self.client.post('chat/completions', {}).json(), {'n': 1})
+        self.assertEqual(self.client.post('chat/completions', {}).json(), {'n': 2})
+        self.assertEqual(self.server.connections, 2)
+
+
+class AsyncDeepSeekClientTests(StubServerMixin, SimpleTestCase):
+
+    async def post(self, *responses, stream=False, **options):
+        """Ответы stub-сервера по очереди и результат запроса асинхронного клиента"""
+        self.server.respond(*responses)
+        client = AsyncDeepSeekClient(**self.client_options(**options))
+        try:
+            response = await client.post('chat/completions', {'messages': []}, stream=stream)
+            if stream:
+                return [line async for line in response.aiter_lines()]
+            return response.json()
+        finally:
+            await client.aclose()
+
+    async def test_chunked_response(self):
+        result = await self.post(chunked(b'{"choices": ', '["Ответ"]}'.encode('utf-8')))
+        self.assertEqual(result, {'choices': ["Ответ"]})
+
+    async def test_streamed_lines(self):
+        lines = await self.post(chunked(b'data: {"a": 1}\n\nda', b'ta: [DONE]\n'), stream=True)
+        self.assertEqual([line for line in lines if line], ['data: {"a": 1}', 'data: [DONE]'])
+
+    async def test_keep_alive_connection_is_reused(self):
+        self.server.respond(reply(body={'n': 1}), chunked(b'{"n": 2}'), reply(body={'n': 3}))
+        client = AsyncDeepSeekClient(**self.client_options())
+        try:
+            results = [(await client.post('chat/completions', {})).json()['n'] for _ in range(3)]
+        finally:
+            await client.aclose()
+        self.assertEqual(results, [1, 2, 3])
+        self.assertEqual(self.server.connections, 1)
+
+    async def test_truncated_body_is_retried_on_new_connection(self):
+        truncated = Close(b'HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n{"choices"')
+        self.assertEqual(await self.post(truncated, reply(body={'ok': True})), {'ok': True})
+        self.assertEqual(self.server.connections, 2)
+
+    async def test_truncated_body_error_after_retries(self):
+        truncated = Close(b'HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n{"choices"')
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            await self.post(truncated, truncated, truncated)
+
+    async def test_truncated_stream_is_reported(self):
+        truncated = Close(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\ndata:')
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            await self.post(truncated, stream=True)
+
+    async def test_retry_after(self):
+        result = await self.post(reply(429, headers={'Retry-After': '0'}), reply(body={'ok': True}))
+        self.assertEqual(result, {'ok': True})
+        self.assertEqual(len(self.server.requests), 2)
+
+    async def test_long_retry_after_is_not_waited(self):
+        with self.assertRaises(requests.exceptions.HTTPError) as caught:
+            await self.post(reply(503, headers={'Retry-After': '60'}), stream=True)
+        self.assertEqual(caught.exception.response.status_code, 503)
+        self.assertEqual(caught.exception.response.reason, 'Stub')
+        self.assertEqual(len(self.server.requests), 1)
+
+    async def test_read_timeout(self):
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            await self.post(Delay(0.5), reply(), read_timeout=0.2)
+        self.assertEqual(len(self.server.requests), 1)
+
+    async def test_read_timeout_per_call(self):
+        self.server.respond(Delay(0.5), reply(body={'ok': True}), Delay(0.5), reply())
+        client = AsyncDeepSeekClient(**self.client_options(max_retries=0, read_timeout=0.2))
+        try:
+            response = await client.post('chat/completions', {}, timeout=(1, 2))
+            self.assertEqual(response.json(), {'ok': True})
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                await client.post('chat/completions', {})
+        finally:
+            await client.aclose()
+
+    async def test_connection_refused(self):
+        client = AsyncDeepSeekClient(**{**self.client_options(max_retries=1), 'base_url': 'http://127.0.0.1:9/v1'})
+        try:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                await client.post('chat/completions', {})
+        finally:
+            await client.aclose()
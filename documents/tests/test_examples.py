@@ -0,0 +1,38 @@
+# documents/tests/test_examples.py
+from unittest import mock
+from django.test import TestCase
+from documents import rendering
+from documents.models import DocumentTemplate
+from documents.rendering import get_example, get_example_version
+from .mixins import TempStorageMixin, make_template
+
+
+class PrecomputedExampleTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        self.template = make_template('<p>{{ court_name }} {{ claim_amount }}</p>')
+
+    def test_example_is_built_on_save(self):
+        stored = DocumentTemplate.objects.get(pk=self.template.pk)
+        self.assertEqual(stored.example_version, get_example_version(stored))
+        self.assertEqual(stored.example_html, '<p>Московский городской суд </p>')
+
+    def test_saved_example_is_reused(self):
+        stored = DocumentTemplate.objects.get(pk=self.template.pk)
+        with mock.patch.object(rendering, 'render_document') as render:
+            html, _ = get_example(stored)
+        render.assert_not_called()
+        self.assertEqual(html, stored.example_html)
+
+    def test_example_is_rebuilt_when_doc_type_changes(self):
+        self.template.doc_type = 'claim'
+        self.template.save()
+        stored = DocumentTemplate.objects.get(pk=self.template.pk)
+        self.assertTrue(stored.example_version.startswith('claim:'))
+        self.assertEqual(stored.example_html, '<p>Московский городской суд 115 000 руб.</p>')
+
+    def test_unrelated_change_keeps_example(self):
+        with mock.patch.object(rendering, 'render_document') as render:
+            self.template.description = 'Новое описание'
+            self.template.save()
+        render.assert_not_called()
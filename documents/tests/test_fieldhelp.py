@@ -0,0 +1,60 @@
+# documents/tests/test_fieldhelp.py
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from documents.fieldhelp import field_schema_hash, get_stored_field_help, store_field_help
+from documents.models import FieldHelp
+from documents.services import DeepSeekIntegration
+from .mixins import TempStorageMixin, make_template
+
+COURT = {'name': 'court_name', 'label': "Суд", 'type': 'text', 'required': True}
+JUDGE = {'name': 'judge_name', 'label': "Судья", 'type': 'text'}
+HELP = {'help_text': "Укажите полное наименование суда.", 'examples': ["Арбитражный суд г. Москвы"],
+        'common_mistakes': [], 'legal_references': ["ст. 125 АПК РФ"]}
+
+
+class ParseFieldHelpTests(SimpleTestCase):
+
+    def test_json_in_code_block(self):
+        content = 'Справка:\n```json\n{"help_text": " Текст ", "examples": "Пример", "legal_references": null}\n```'
+        self.assertEqual(DeepSeekIntegration._parse_field_help(content), {
+            'help_text': "Текст", 'examples': ["Пример"], 'common_mistakes': [], 'legal_references': [],
+        })
+
+    def test_answer_without_object_is_rejected(self):
+        for content in ("Справки нет", '["help"]'):
+            with self.subTest(content), self.assertRaises(ValueError):
+                DeepSeekIntegration._parse_field_help(content)
+
+
+class FieldHelpIndexTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        self.template = make_template('<p></p>', fields_schema={'fields': [COURT, JUDGE]})
+
+    def test_stored_help_is_served_without_api(self):
+        store_field_help(self.template, COURT, HELP)
+        with mock.patch.object(DeepSeekIntegration, 'generate_field_help') as generate:
+            self.assertEqual(DeepSeekIntegration.get_field_help(self.template, COURT), HELP)
+        generate.assert_not_called()
+
+    def test_changed_field_description_invalidates_help(self):
+        store_field_help(self.template, COURT, HELP)
+        changed = {**COURT, 'label': "Наименование суда"}
+        self.assertNotEqual(field_schema_hash(self.template, changed), field_schema_hash(self.template, COURT))
+        self.assertIsNone(get_stored_field_help(self.template, changed))
+        with mock.patch.object(DeepSeekIntegration, 'generate_field_help', return_value=HELP) as generate:
+            DeepSeekIntegration.get_field_help(self.template, changed)
+        generate.assert_called_once()
+        self.assertEqual(FieldHelp.objects.get().schema_hash, field_schema_hash(self.template, changed))
+
+    def test_build_command_generates_missing_and_prunes_removed_fields(self):
+        store_field_help(self.template, COURT, HELP)
+        FieldHelp.objects.create(template=self.template, field_name='removed', schema_hash='', help_text='')
+        out = StringIO()
+        with mock.patch.object(DeepSeekIntegration, 'generate_field_help', return_value=HELP) as generate:
+            call_command('build_field_help', stdout=out, stderr=StringIO())
+        self.assertEqual([call.args[1]['name'] for call in generate.call_args_list], ['judge_name'])
+        self.assertEqual(sorted(FieldHelp.objects.values_list('field_name', flat=True)), ['court_name', 'judge_name'])
+        self.assertIn("удалено устаревших: 1", out.getvalue())
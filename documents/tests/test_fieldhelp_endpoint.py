@@ -0,0 +1,39 @@
+# documents/tests/test_fieldhelp_endpoint.py
+from django.test import TestCase
+from django.urls import reverse
+from documents.fieldhelp import store_field_help
+from .mixins import TempStorageMixin, make_template
+from .test_fieldhelp import COURT, HELP, JUDGE
+
+
+class FieldHelpEndpointTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        self.template = make_template('<p></p>', fields_schema={'fields': [COURT, JUDGE]})
+        store_field_help(self.template, COURT, HELP)
+        self.url = reverse('field_help', args=[self.template.pk])
+
+    def test_all_fields_in_one_response(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['fields'], {'court_name': {'label': "Суд", **HELP}})
+        self.assertEqual(data['missing'], ['judge_name'])
+
+    def test_selected_fields(self):
+        data = self.client.get(self.url, {'fields': 'judge_name,unknown'}).json()
+        self.assertEqual((data['fields'], data['missing']), ({}, ['judge_name']))
+
+    def test_unchanged_help_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertIn('max-age', response['Cache-Control'])
+        repeated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeated.status_code, 304)
+
+        store_field_help(self.template, JUDGE, HELP)
+        updated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(updated.json()['missing'], [])
+
+    def test_inactive_template_is_not_found(self):
+        self.template.is_active = False
+        self.template.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
@@ -0,0 +1,60 @@
+# documents/tests/test_fields.py
+import json
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from documents.fields import CompressedJSONField
+from documents.models import AIRequestHistory
+
+PROMPT = {'messages': [{'role': 'user', 'content': "Составьте исковое заявление о взыскании долга. " * 40}]}
+
+
+def stored(pk, column='request_data'):
+    """Значение колонки в БД как есть"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {column} FROM {AIRequestHistory._meta.db_table} WHERE id = %s', [pk])
+        return cursor.fetchone()[0]
+
+
+class CompressedJSONFieldTests(TestCase):
+
+    def create(self, request_data, response_data=None):
+        return AIRequestHistory.objects.create(
+            request_type='generate', request_data=request_data, response_data=response_data or {}
+        )
+
+    def test_long_value_is_compressed(self):
+        history = self.create(PROMPT)
+        raw = stored(history.pk)
+        self.assertTrue(raw.startswith('z'))
+        self.assertLess(len(raw), len(json.dumps(PROMPT, ensure_ascii=False)) / 4)
+        self.assertEqual(AIRequestHistory.objects.get(pk=history.pk).request_data, PROMPT)
+
+    def test_short_value_is_stored_as_json(self):
+        history = self.create({'action': 'field_help'}, ["Пример"])
+        self.assertEqual(json.loads(stored(history.pk)), {'action': 'field_help'})
+        history = AIRequestHistory.objects.get(pk=history.pk)
+        self.assertEqual((history.request_data, history.response_data), ({'action': 'field_help'}, ["Пример"]))
+
+    def test_rows_written_by_json_field_are_readable(self):
+        history = self.create({})
+        legacy = json.dumps(PROMPT, ensure_ascii=False)
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {AIRequestHistory._meta.db_table} SET request_data = %s WHERE id = %s',
+                           [legacy, history.pk])
+        self.assertEqual(AIRequestHistory.objects.get(pk=history.pk).request_data, PROMPT)
+
+    def test_values_for_serialization(self):
+        history = self.create(PROMPT)
+        field = AIRequestHistory._meta.get_field('request_data')
+        self.assertEqual(json.loads(field.value_to_string(history)), PROMPT)
+
+
+class CompressedJSONFieldDeconstructTests(SimpleTestCase):
+
+    def test_options_survive_migrations(self):
+        field = CompressedJSONField(encoder=json.JSONEncoder, min_length=64, level=9)
+        _, path, args, kwargs = field.deconstruct()
+        self.assertEqual(path, 'documents.fields.CompressedJSONField')
+        rebuilt = CompressedJSONField(*args, **kwargs)
+        self.assertEqual((rebuilt.encoder, rebuilt.min_length, rebuilt.level, rebuilt.editable),
+                         (json.JSONEncoder, 64, 9, False))
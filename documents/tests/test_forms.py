@@ -0,0 +1,40 @@
+# documents/tests/test_forms.py
+from django.test import TestCase
+from documents.forms import DynamicDocumentForm, form_class_cache
+from .mixins import TempStorageMixin, make_template
+
+FIELDS_SCHEMA = {'fields': [
+    {'name': 'court_name', 'label': "Суд"},
+    {'name': 'motion_reason', 'label': "Основание", 'type': 'textarea', 'required': False},
+]}
+
+
+class FormClassCacheTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        form_class_cache.clear()
+        self.template = make_template('<p></p>', fields_schema=FIELDS_SCHEMA)
+
+    def test_form_class_is_built_once_per_revision(self):
+        first = DynamicDocumentForm(template=self.template)
+        second = DynamicDocumentForm({'court_name': "Суд"}, template=self.template)
+        self.assertIs(type(first), type(second))
+        self.assertEqual(list(second.fields), ['court_name', 'motion_reason'])
+        self.assertTrue(second.is_valid())
+        self.assertEqual(second.template, self.template)
+
+    def test_instances_do_not_share_bound_state(self):
+        first = DynamicDocumentForm({}, template=self.template)
+        second = DynamicDocumentForm({'court_name': "Суд"}, template=self.template)
+        self.assertFalse(first.is_valid())
+        self.assertTrue(second.is_valid())
+        self.assertNotIn('court_name', second.errors)
+
+    def test_new_revision_builds_new_class(self):
+        old = type(DynamicDocumentForm(template=self.template))
+        self.template.fields_schema = {'fields': [{'name': 'judge_name'}]}
+        self.template.save()
+        form = DynamicDocumentForm(template=self.template)
+        self.assertIsNot(type(form), old)
+        self.assertEqual(list(form.fields), ['judge_name'])
+        self.assertEqual(len(form_class_cache), 1)
@@ -0,0 +1,136 @@
+# documents/tests/test_generated.py
+import os
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from documents import generated
+from documents.generated import canonical_context, cleanup_documents, document_hash, get_document, pdf_name
+from documents.models import GeneratedDocument
+from .mixins import TempStorageMixin, make_template
+
+BODY = '<p>{{ court_name }}: {{ plaintiff_name }}</p>'
+CONTEXT = {'court_name': "Московский городской суд", 'plaintiff_name': "Иванов И. И."}
+
+
+def session():
+    """Ключ живой сессии в БД"""
+    store = SessionStore()
+    store.create()
+    return store.session_key
+
+
+class CanonicalContextTests(SimpleTestCase):
+
+    def test_key_order_does_not_change_context(self):
+        self.assertEqual(canonical_context({'b': 1, 'a': "Иск"}), '{"a":"Иск","b":1}')
+        self.assertEqual(canonical_context(None), '{}')
+
+
+class GetDocumentTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        self.template = make_template(BODY, name="Исковое заявление", doc_type='claim')
+        render = mock.patch.object(generated, 'render_document', wraps=generated.render_document)
+        self.render = render.start()
+        self.addCleanup(render.stop)
+
+    def test_repeated_document_is_not_rendered_again(self):
+        first, other = session(), session()
+        html = get_document(self.template, CONTEXT, first)
+        self.assertEqual(html, "<p>Московский городской суд: Иванов И. И.</p>")
+        self.assertEqual(get_document(self.template, dict(reversed(CONTEXT.items())), first), html)
+        # Другая сессия получает свою запись, но HTML того же хэша
+        self.assertEqual(get_document(self.template, CONTEXT, other), html)
+        self.assertEqual(self.render.call_count, 1)
+        self.assertEqual(GeneratedDocument.objects.count(), 2)
+        self.assertEqual(GeneratedDocument.objects.values('content_hash').distinct().count(), 1)
+
+    def test_changed_context_or_template_is_a_new_document(self):
+        key = session()
+        get_document(self.template, CONTEXT, key)
+        get_document(self.template, {**CONTEXT, 'plaintiff_name': "Петров П. П."}, key)
+        self.template.name = "Исковое заявление о взыскании долга"
+        self.template.save()
+        get_document(self.template, CONTEXT, key)
+        self.assertEqual(self.render.call_count, 3)
+        self.assertEqual(GeneratedDocument.objects.filter(session_key=key).count(), 3)
+
+    def test_pdf_is_stored_once_per_hash(self):
+        first, other = session(), session()
+        with mock.patch.object(generated, 'render_document_to_pdf', return_value=b'%PDF-1.4') as render_pdf:
+            self.assertEqual(get_document(self.template, CONTEXT, first, format='pdf'), b'%PDF-1.4')
+            self.assertEqual(get_document(self.template, CONTEXT, other, format='pdf'), b'%PDF-1.4')
+        render_pdf.assert_called_once()
+        name = pdf_name(document_hash(self.template, canonical_context(CONTEXT)))
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(set(GeneratedDocument.objects.values_list('file', flat=True)), {name})
+
+
+class CleanupTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        self.template = make_template(BODY, name="Исковое заявление", doc_type='claim')
+
+    def generate(self, key, **context):
+        with mock.patch.object(generated, 'render_document_to_pdf', return_value=b'%PDF-1.4'):
+            get_document(self.template, {**CONTEXT, **context}, key, format='pdf')
+        return GeneratedDocument.objects.get(session_key=key, content_hash=self.digest(**context))
+
+    def digest(self, **context):
+        return document_hash(self.template, canonical_context({**CONTEXT, **context}))
+
+    def test_expired_sessions_and_old_documents_are_removed(self):
+        live, old, gone = session(), session(), 'x' * 32
+        kept = self.generate(live)
+        self.generate(old, plaintiff_name="Петров П. П.")
+        GeneratedDocument.objects.filter(session_key=old).update(accessed_at=timezone.now() - timedelta(days=30))
+        self.generate(gone, plaintiff_name="Сидоров С. С.")
+
+        self.assertEqual(cleanup_documents(retention_days=7, dry_run=True), {'documents': 2, 'hashed': 0, 'files': 0})
+        self.assertEqual(GeneratedDocument.objects.count(), 3)
+        self.assertEqual(cleanup_documents(retention_days=7), {'documents': 2, 'hashed': 0, 'files': 2})
+        self.assertEqual(list(GeneratedDocument.objects.all()), [kept])
+        self.assertTrue(default_storage.exists(kept.file.name))
+        self.assertFalse(default_storage.exists(pdf_name(self.digest(plaintiff_name="Петров П. П."))))
+
+    def test_legacy_documents_get_hash_and_duplicates_are_removed(self):
+        key, other = session(), session()
+        # Документы, сохраненные до хранения по хэшу: content_hash пустой, уникальность не проверяется
+        legacy = [
+            GeneratedDocument.objects.create(template=self.template, content=CONTEXT, session_key=key,
+                                             accessed_at=timezone.now() - timedelta(hours=hours))
+            for hours in (1, 2)
+        ]
+        moved = GeneratedDocument.objects.create(template=self.template, content=CONTEXT, session_key=other)
+        already = self.generate(other)
+        GeneratedDocument.objects.filter(pk=already.pk).update(accessed_at=timezone.now() - timedelta(hours=3))
+
+        self.assertEqual(cleanup_documents(retention_days=7), {'documents': 2, 'hashed': 1, 'files': 0})
+        remaining = dict(GeneratedDocument.objects.values_list('pk', 'content_hash'))
+        self.assertEqual(remaining, {legacy[0].pk: self.digest(), already.pk: self.digest()})
+        self.assertNotIn(moved.pk, remaining)
+        # Документ с вычисленным хэшем находится как обычный
+        with mock.patch.object(generated, 'render_document') as render:
+            get_document(self.template, CONTEXT, key)
+        render.assert_not_called()
+
+    def test_legacy_document_of_template_without_file_is_skipped(self):
+        key = session()
+        document = GeneratedDocument.objects.create(template=self.template, content=CONTEXT, session_key=key)
+        type(self.template).objects.filter(pk=self.template.pk).update(content_hash='')
+        os.remove(os.path.join(settings.MEDIA_ROOT, self.template.template_file.name))
+        self.assertEqual(cleanup_documents(retention_days=7)['hashed'], 0)
+        document.refresh_from_db()
+        self.assertEqual(document.content_hash, '')
+
+    def test_command(self):
+        self.generate('x' * 32)
+        out = StringIO()
+        call_command('cleanup_generated_documents', stdout=out)
+        self.assertIn("Удалено документов: 1, файлов PDF: 1", out.getvalue())
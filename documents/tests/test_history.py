@@ -0,0 +1,123 @@
+# documents/tests/test_history.py
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from documents.history import HistoryRecorder, _day_start, prune_history, record_history, rollup_history
+from documents.models import AIRequestDailyStats, AIRequestHistory
+from .mixins import TempStorageMixin
+
+
+def entry(n=0, **fields):
+    return {'request_type': 'generate', 'request_data': {'n': n}, 'response_data': {}, **fields}
+
+
+class HistoryRecorderTests(TempStorageMixin, TestCase):
+
+    def test_records_are_written_in_batches(self):
+        recorder = HistoryRecorder(batch_size=2, flush_interval=5)
+        with mock.patch.object(AIRequestHistory.objects, 'bulk_create') as bulk_create:
+            for n in range(5):
+                recorder.record(**entry(n))
+            self.assertTrue(recorder.flush())
+        sizes = [len(call.args[0]) for call in bulk_create.call_args_list]
+        self.assertEqual(sum(sizes), 5)
+        self.assertTrue(all(size <= 2 for size in sizes))
+        self.assertEqual(recorder.stats(), {'queued': 0, 'written': 5, 'dropped': 0, 'failed': 0})
+
+    def test_records_over_queue_limit_are_dropped(self):
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_write(objects):
+            writing.set()
+            release.wait(5)
+
+        recorder = HistoryRecorder(batch_size=1, flush_interval=5, max_queue=1)
+        with mock.patch.object(AIRequestHistory.objects, 'bulk_create', side_effect=slow_write):
+            recorder.record(**entry(1))
+            self.assertTrue(writing.wait(5))
+            recorder.record(**entry(2))
+            recorder.record(**entry(3))
+            release.set()
+            recorder.flush()
+        self.assertEqual((recorder.written, recorder.dropped), (2, 1))
+
+    def test_failed_batches_are_counted(self):
+        recorder = HistoryRecorder(batch_size=10, flush_interval=5)
+        with mock.patch.object(AIRequestHistory.objects, 'bulk_create', side_effect=RuntimeError("БД недоступна")):
+            recorder.record(**entry())
+            recorder.flush()
+        self.assertEqual((recorder.written, recorder.failed), (0, 1))
+
+    @override_settings(AI_HISTORY_BUFFERED=False)
+    def test_unbuffered_record_is_written_immediately(self):
+        record_history(**entry(7))
+        self.assertEqual(AIRequestHistory.objects.get().request_data, {'n': 7})
+
+
+class HistoryWriterTests(TempStorageMixin, TransactionTestCase):
+
+    def test_buffered_records_reach_database(self):
+        recorder = HistoryRecorder(batch_size=100, flush_interval=0.05)
+        for n in range(3):
+            recorder.record(**entry(n, processing_time=0.5))
+        self.assertTrue(recorder.flush())
+        self.assertEqual(sorted(row.request_data['n'] for row in AIRequestHistory.objects.all()), [0, 1, 2])
+
+
+class RollupTests(TestCase):
+
+    def add(self, days_ago, count, request_type='generate', is_error=False, processing_time=1.0):
+        """count записей за день days_ago дней назад (created_at — auto_now_add, задается после создания)"""
+        created_at = _day_start(timezone.localdate() - timedelta(days=days_ago)) + timedelta(hours=12)
+        rows = AIRequestHistory.objects.bulk_create([
+            AIRequestHistory(**entry(n, request_type=request_type, is_error=is_error,
+                                     processing_time=processing_time * (n + 1), input_tokens=10, output_tokens=2))
+            for n in range(count)
+        ])
+        AIRequestHistory.objects.filter(pk__in=[row.pk for row in rows]).update(created_at=created_at)
+
+    def test_completed_days_are_rolled_up(self):
+        self.add(2, 100)
+        self.add(2, 2, request_type='field_help', is_error=True)
+        self.add(0, 5)
+        self.assertEqual(rollup_history(), 2)
+        stats = AIRequestDailyStats.objects.get(request_type='generate')
+        self.assertEqual(stats.day, timezone.localdate() - timedelta(days=2))
+        self.assertEqual((stats.requests, stats.errors, stats.input_tokens, stats.output_tokens), (100, 0, 1000, 200))
+        self.assertEqual((stats.latency_p50, stats.latency_p95, stats.latency_p99), (50.0, 95.0, 99.0))
+        self.assertAlmostEqual(stats.latency_avg, 50.5)
+        self.assertEqual(AIRequestDailyStats.objects.get(request_type='field_help').errors, 2)
+
+    def test_rolled_up_days_are_not_recounted(self):
+        self.add(2, 3)
+        rollup_history()
+        AIRequestHistory.objects.filter(pk=AIRequestHistory.objects.first().pk).delete()
+        self.add(1, 1)
+        self.assertEqual(rollup_history(), 1)
+        self.assertEqual(AIRequestDailyStats.objects.get(day=timezone.localdate() - timedelta(days=2)).requests, 3)
+        self.assertEqual(rollup_history(rebuild=True), 2)
+        self.assertEqual(AIRequestDailyStats.objects.get(day=timezone.localdate() - timedelta(days=2)).requests, 2)
+
+    def test_prune_deletes_only_rolled_up_days_in_batches(self):
+        self.add(10, 5)
+        self.add(5, 1)
+        self.assertEqual(prune_history(1), 0)
+        rollup_history()
+        AIRequestDailyStats.objects.filter(day=timezone.localdate() - timedelta(days=5)).delete()
+        with mock.patch.object(AIRequestHistory.objects, 'filter', wraps=AIRequestHistory.objects.filter) as filter:
+            self.assertEqual(prune_history(1, batch_size=2), 5)
+        # Пачки по 2 записи: 3 удаления и пустая выборка
+        self.assertEqual(sum('pk__in' in call.kwargs for call in filter.call_args_list), 3)
+        self.assertEqual(AIRequestHistory.objects.count(), 1)
+
+    def test_command(self):
+        self.add(40, 2)
+        out = StringIO()
+        call_command('rollup_ai_history', '--retention-days', '30', '--pause', '0', stdout=out)
+        self.assertIn("Дневных сводок создано или обновлено: 1", out.getvalue())
+        self.assertIn("Удалено записей старше 30 дн.: 2", out.getvalue())
+        self.assertEqual(AIRequestDailyStats.objects.get().requests, 2)
@@ -0,0 +1,156 @@
+# documents/tests/test_jobs.py
+import json
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from documents import jobs
+from documents.jobs import claim_job, execute_job, maintain_queue, submit_job
+from documents.management.commands.ai_worker import run_worker
+from documents.models import AIJob
+from documents.views import AIDocumentView
+from .mixins import TempStorageMixin
+from .stubserver import StubServer, reply
+from .test_streaming import GROUNDS
+
+ANSWER = {'choices': [{'message': {'content': "Основание"}}], 'usage': {'prompt_tokens': 5, 'completion_tokens': 1}}
+
+
+class JobQueueTests(TempStorageMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StubServer()
+        cls.addClassCleanup(cls.server.close)
+        overrides = override_settings(
+            DEEPSEEK_API_URL=cls.server.url, DEEPSEEK_MAX_RETRIES=0, AI_LIMITER_ENABLED=False,
+            AI_BREAKER_ENABLED=False, AI_HISTORY_BUFFERED=False, AI_JOB_MAX_ATTEMPTS=2,
+        )
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+
+    def post(self, data):
+        return self.client.post('/api/ai/', json.dumps(data), content_type='application/json')
+
+    def test_background_action_is_queued(self):
+        response = self.post({**GROUNDS, 'background': True})
+        self.assertEqual(response.status_code, 202)
+        job = AIJob.objects.get()
+        self.assertEqual(response.json()['status_url'], f"/api/ai/jobs/{job.pk}/")
+        self.assertEqual((job.state, job.action), (AIJob.QUEUED, 'generate_grounds'))
+        self.assertNotIn('background', job.payload)
+        self.assertEqual(self.server.requests, [])
+
+    def test_invalid_background_action_is_rejected_at_once(self):
+        response = self.post({'action': 'generate_grounds', 'background': True})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(AIJob.objects.exists())
+
+    def test_jobs_are_claimed_by_priority_then_age(self):
+        first = submit_job('generate_grounds', GROUNDS)
+        second = submit_job('generate_grounds', GROUNDS)
+        urgent = submit_job('field_help', {})
+        claimed = [claim_job('worker') for _ in range(4)]
+        self.assertEqual(claimed[:3], [urgent, first, second])
+        self.assertIsNone(claimed[3])
+        urgent.refresh_from_db()
+        self.assertEqual((urgent.state, urgent.worker, urgent.attempts), (AIJob.RUNNING, 'worker', 1))
+
+    def test_job_result_matches_inline_response(self):
+        self.server.respond(reply(body=ANSWER))
+        submit_job('generate_grounds', GROUNDS)
+        execute_job(claim_job('worker'), AIDocumentView())
+        job = AIJob.objects.get()
+        self.assertEqual((job.state, job.http_status), (AIJob.DONE, 200))
+        self.server.respond(reply(body=ANSWER))
+        self.assertEqual(job.result, self.post(GROUNDS).json())
+
+    def test_upstream_failure_is_retried_with_backoff(self):
+        self.server.respond(reply(503), reply(503))
+        submit_job('generate_grounds', {**GROUNDS, 'case_details': "Сбой API"})
+        execute_job(claim_job('worker'), AIDocumentView())
+        job = AIJob.objects.get()
+        self.assertEqual((job.state, job.attempts, job.worker), (AIJob.QUEUED, 1, ''))
+        self.assertGreater(job.run_after, timezone.now())
+        # Задание ждет повтора: воркер его не берет
+        self.assertIsNone(claim_job('worker'))
+
+        AIJob.objects.update(run_after=timezone.now())
+        execute_job(claim_job('worker'), AIDocumentView())
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (AIJob.FAILED, 2))
+        self.assertEqual(job.result['status'], 'error')
+
+    def test_result_of_expired_lease_is_discarded(self):
+        self.server.respond(reply(body=ANSWER))
+        submit_job('generate_grounds', GROUNDS)
+        slow = claim_job('slow')
+        # Аренда истекла: задание вернулось в очередь и досталось другому воркеру
+        AIJob.objects.update(lease_until=timezone.now())
+        maintain_queue()
+        claim_job('other')
+        with self.assertLogs('documents.jobs', 'WARNING'):
+            execute_job(slow, AIDocumentView())
+        job = AIJob.objects.get()
+        self.assertEqual((job.state, job.worker, job.attempts, job.result), (AIJob.RUNNING, 'other', 2, None))
+
+    def test_worker_survives_unexpected_error(self):
+        self.server.respond(reply(body=ANSWER))
+        broken, good = submit_job('field_help', {}), submit_job('generate_grounds', GROUNDS)
+        original = jobs.execute_job
+
+        def execute(job, view):
+            if job.pk == broken.pk:
+                raise RuntimeError("ошибка обработчика")
+            original(job, view)
+
+        # Процесс-воркер в тесте: без django.setup() (он перенастроил бы логирование) и обработчиков сигналов
+        with mock.patch.object(jobs, 'execute_job', side_effect=execute), \
+                mock.patch('documents.management.commands.ai_worker.django.setup'), \
+                mock.patch('documents.management.commands.ai_worker.signal.signal'), \
+                self.assertLogs('documents.jobs', 'ERROR'):
+            run_worker(poll_interval=0, once=True)
+        states = dict(AIJob.objects.values_list('pk', 'state'))
+        self.assertEqual(states, {broken.pk: AIJob.FAILED, good.pk: AIJob.DONE})
+        broken.refresh_from_db()
+        self.assertEqual((broken.http_status, broken.result['status']), (500, 'error'))
+
+    def test_deleted_template_fails_without_retry(self):
+        submit_job('field_help', {'template_id': 999999, 'field': 'court_name'})
+        execute_job(claim_job('worker'), AIDocumentView())
+        job = AIJob.objects.get()
+        self.assertEqual((job.state, job.http_status, job.attempts), (AIJob.FAILED, 404, 1))
+
+    def test_maintenance_expires_requeues_and_purges(self):
+        now = timezone.now()
+        expired = submit_job('generate_grounds', GROUNDS)
+        AIJob.objects.filter(pk=expired.pk).update(expires_at=now)
+        abandoned = submit_job('generate_grounds', GROUNDS)
+        exhausted = submit_job('generate_grounds', GROUNDS)
+        AIJob.objects.filter(pk__in=[abandoned.pk, exhausted.pk]).update(
+            state=AIJob.RUNNING, worker='dead', lease_until=now, attempts=1
+        )
+        AIJob.objects.filter(pk=exhausted.pk).update(attempts=2)
+        old = submit_job('generate_grounds', GROUNDS)
+        AIJob.objects.filter(pk=old.pk).update(state=AIJob.DONE, finished_at=now - timedelta(days=2))
+
+        self.assertEqual(maintain_queue(), {'expired': 1, 'requeued': 1, 'failed': 1, 'purged': 1})
+        states = dict(AIJob.objects.values_list('pk', 'state'))
+        self.assertEqual(states, {expired.pk: AIJob.EXPIRED, abandoned.pk: AIJob.QUEUED, exhausted.pk: AIJob.FAILED})
+
+    def test_status_endpoint(self):
+        job = submit_job('generate_grounds', GROUNDS)
+        response = self.client.get(f"/api/ai/jobs/{job.pk}/", {'wait': 0})
+        self.assertEqual(response.json()['job']['state'], AIJob.QUEUED)
+        self.assertEqual(self.client.get(f"/api/ai/jobs/{job.pk}/", {'wait': 'скоро'}).status_code, 400)
+        AIJob.objects.all().delete()
+        self.assertEqual(self.client.get(f"/api/ai/jobs/{job.pk}/").status_code, 404)
+
+    @override_settings(AI_JOB_POLL_INTERVAL=0.01)
+    def test_long_poll_returns_finished_job_at_once(self):
+        job = submit_job('generate_grounds', GROUNDS)
+        AIJob.objects.filter(pk=job.pk).update(state=AIJob.DONE, result={'grounds': "Основание"},
+                                               finished_at=timezone.now())
+        response = self.client.get(f"/api/ai/jobs/{job.pk}/", {'wait': 20})
+        self.assertEqual(response.json()['job']['state'], AIJob.DONE)
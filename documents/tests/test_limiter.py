@@ -0,0 +1,187 @@
+# documents/tests/test_limiter.py
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from documents.limiter import ConcurrencyLimiter, RateLimitExceeded, get_limiter, limiter_session, parse_rate
+from documents.metrics import metrics
+from documents.models import FieldHelp
+from documents.services import DeepSeekIntegration
+from .mixins import TempStorageMixin, make_template
+from .test_fieldhelp import COURT, HELP, JUDGE
+
+
+class ParseRateTests(SimpleTestCase):
+
+    def test_drf_rates(self):
+        self.assertEqual(parse_rate('5/minute'), (5, 60))
+        self.assertEqual(parse_rate('100/hour'), (100, 3600))
+        self.assertIsNone(parse_rate(None))
+
+
+class ConcurrencyLimiterTests(SimpleTestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp(prefix='autodocpro-tests-')
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.path = os.path.join(temp_dir, 'store.sqlite3')
+
+    def limiter(self, **options):
+        """Ограничитель воркера: у каждого воркера свой объект, состояние — общее"""
+        options = {'rate': 1000, 'burst': 1000, 'queue_timeout': 1.0, 'poll_interval': 0.01, **options}
+        return ConcurrencyLimiter(self.path, **options)
+
+    def test_slots_are_shared_between_workers(self):
+        first, second = self.limiter(max_in_flight=1), self.limiter(max_in_flight=1)
+        slot = first.acquire()
+        acquired = threading.Event()
+
+        def wait_for_slot():
+            second.release(second.acquire())
+            acquired.set()
+
+        thread = threading.Thread(target=wait_for_slot)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        self.assertEqual(first.stats()['queue_depth'], 1)
+        first.release(slot)
+        self.assertTrue(acquired.wait(5))
+        thread.join(5)
+        stats = first.stats()
+        self.assertEqual((stats['in_flight'], stats['queue_depth'], stats['admitted']), (0, 0, 2))
+        self.assertGreater(stats['wait_seconds_max'], 0.05)
+
+    def test_queue_timeout(self):
+        limiter = self.limiter(max_in_flight=1, queue_timeout=0.05)
+        slot = limiter.acquire()
+        with self.assertRaises(RateLimitExceeded) as raised:
+            limiter.acquire()
+        self.assertEqual(raised.exception.retry_after, 0.05)
+        limiter.release(slot)
+        self.assertEqual((limiter.stats()['timeouts'], limiter.stats()['queue_depth']), (1, 0))
+
+    def test_full_queue_rejects_immediately(self):
+        limiter = self.limiter(max_in_flight=1, max_queue=1)
+        slot = limiter.acquire()
+        waiter = threading.Thread(target=lambda: limiter.release(limiter.acquire()))
+        waiter.start()
+        while limiter.stats()['queue_depth'] == 0:
+            time.sleep(0.01)
+        with self.assertRaises(RateLimitExceeded):
+            limiter.acquire()
+        limiter.release(slot)
+        waiter.join(5)
+        stats = limiter.stats()
+        self.assertEqual((stats['rejected_queue_full'], stats['admitted'], stats['timeouts']), (1, 2, 0))
+
+    def test_token_bucket_delays_requests_over_burst(self):
+        limiter = self.limiter(rate=20, burst=1)
+        limiter.release(limiter.acquire())
+        started = time.monotonic()
+        limiter.release(limiter.acquire())
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_session_quota(self):
+        limiter = self.limiter(session_rate=(2, 60))
+        with limiter_session('alice'):
+            for _ in range(2):
+                with limiter.slot():
+                    pass
+            with self.assertRaises(RateLimitExceeded) as raised, limiter.slot():
+                pass
+        self.assertAlmostEqual(raised.exception.retry_after, 30, delta=1)
+        with limiter_session('bob'), limiter.slot():
+            pass
+        # Вне сессии (команды управления) квота не применяется
+        for _ in range(3):
+            with limiter.slot():
+                pass
+        self.assertEqual(limiter.stats()['rejected_quota'], 1)
+
+    def test_expired_lease_frees_slot_of_crashed_worker(self):
+        limiter = self.limiter(max_in_flight=1, lease=0.05)
+        limiter.acquire()
+        time.sleep(0.1)
+        limiter.release(limiter.acquire())
+        self.assertEqual(limiter.stats()['timeouts'], 0)
+
+    def test_cancelled_async_waiter_leaves_queue(self):
+        limiter = self.limiter(max_in_flight=1, queue_timeout=5)
+
+        async def cancel_waiter():
+            async with limiter.aslot():
+                waiter = asyncio.ensure_future(limiter.aacquire())
+                await asyncio.sleep(0.1)
+                self.assertEqual(limiter.stats()['queue_depth'], 1)
+                waiter.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await waiter
+
+        asyncio.run(cancel_waiter())
+        self.assertEqual((limiter.stats()['queue_depth'], limiter.stats()['in_flight']), (0, 0))
+
+    def test_unavailable_store_does_not_block_requests(self):
+        limiter = ConcurrencyLimiter(os.path.join(self.path, 'missing', 'store.sqlite3'))
+        with limiter.slot():
+            pass
+
+
+@override_settings(AI_LIMITER_ENABLED=True, AI_LIMITER_MAX_IN_FLIGHT=1, AI_LIMITER_QUEUE_TIMEOUT=0.05)
+class LimiterMetricsTests(TempStorageMixin, SimpleTestCase):
+
+    def test_wait_rejections_and_state_are_exported(self):
+        metrics.reset()
+        limiter = get_limiter()
+        slot = limiter.acquire()
+        with self.assertRaises(RateLimitExceeded):
+            limiter.acquire()
+        text = metrics.render()
+        self.assertIn('autodocpro_ai_limiter_wait_seconds_count 1', text)
+        self.assertIn('autodocpro_ai_limiter_rejected_total{reason="timeout"} 1', text)
+        self.assertIn('# TYPE autodocpro_ai_limiter_in_flight gauge', text)
+        self.assertIn('autodocpro_ai_limiter_in_flight 1', text)
+        self.assertIn('autodocpro_ai_limiter_queue_depth 0', text)
+        limiter.release(slot)
+        self.assertIn('autodocpro_ai_limiter_in_flight 0', metrics.render())
+
+    @override_settings(AI_LIMITER_ENABLED=False)
+    def test_disabled_limiter_has_no_state(self):
+        self.assertNotIn('ai_limiter_in_flight', metrics.render())
+
+
+@override_settings(AI_LIMITER_ENABLED=True, AI_LIMITER_MAX_IN_FLIGHT=2)
+class BuildFieldHelpLimiterTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        self.template = make_template('<p></p>', fields_schema={'fields': [COURT, JUDGE]})
+
+    def test_rejected_request_is_retried_after_delay(self):
+        rejected = RateLimitExceeded("Очередь запросов к AI заполнена", retry_after=0.5)
+        with mock.patch.object(DeepSeekIntegration, 'generate_field_help', side_effect=[rejected, HELP, HELP]), \
+                mock.patch('documents.management.commands.build_field_help.time.sleep') as sleep:
+            call_command('build_field_help', '--concurrency', '1', stdout=StringIO(), stderr=StringIO())
+        sleep.assert_called_once_with(0.5)
+        self.assertEqual(FieldHelp.objects.count(), 2)
+
+    def test_request_rejected_every_time_is_a_failure(self):
+        rejected = RateLimitExceeded("Очередь запросов к AI заполнена")
+        err = StringIO()
+        with mock.patch.object(DeepSeekIntegration, 'generate_field_help', side_effect=rejected), \
+                mock.patch('documents.management.commands.build_field_help.time.sleep'):
+            call_command('build_field_help', '--template', str(self.template.pk), stdout=StringIO(), stderr=err)
+        self.assertEqual(err.getvalue().count("Очередь запросов к AI заполнена"), 2)
+        self.assertFalse(FieldHelp.objects.exists())
+
+    def test_concurrency_is_capped_at_limiter_slots(self):
+        with mock.patch.object(DeepSeekIntegration, 'generate_field_help', return_value=HELP), \
+                mock.patch('documents.management.commands.build_field_help.ThreadPoolExecutor',
+                           wraps=ThreadPoolExecutor) as executor:
+            call_command('build_field_help', '--concurrency', '16', stdout=StringIO(), stderr=StringIO())
+        executor.assert_called_once_with(max_workers=2)
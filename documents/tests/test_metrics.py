@@ -0,0 +1,101 @@
+# documents/tests/test_metrics.py
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import mock
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from documents.metrics import MetricsRegistry, metrics
+from .mixins import TempStorageMixin
+
+
+class MetricsRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp(prefix='autodocpro-tests-')
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.path = os.path.join(temp_dir, 'store.sqlite3')
+
+    def registry(self, **options):
+        """Реестр воркера: у каждого воркера свой объект, суммы — общие"""
+        return MetricsRegistry(self.path, flush_interval=3600, buckets=(0.1, 1.0), **options)
+
+    def test_counters_of_workers_are_summed(self):
+        first, second = self.registry(), self.registry()
+        first.inc('template_cache_total', result='hit')
+        first.inc('template_cache_total', 2, result='hit')
+        second.inc('template_cache_total', result='hit')
+        second.inc('template_cache_total', result='miss')
+        second.flush()
+        text = first.render()
+        self.assertIn('# TYPE autodocpro_template_cache_total counter', text)
+        self.assertIn('autodocpro_template_cache_total{result="hit"} 4', text)
+        self.assertIn('autodocpro_template_cache_total{result="miss"} 1', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = self.registry()
+        for value in (0.05, 0.5, 0.7, 3.0):
+            registry.observe('render_seconds', value, doc_type='claim')
+        lines = [line for line in registry.render().splitlines() if line.startswith('autodocpro_render')]
+        self.assertEqual(lines, [
+            'autodocpro_render_seconds_bucket{doc_type="claim",le="0.1"} 1',
+            'autodocpro_render_seconds_bucket{doc_type="claim",le="1"} 3',
+            'autodocpro_render_seconds_bucket{doc_type="claim",le="+Inf"} 4',
+            'autodocpro_render_seconds_sum{doc_type="claim"} 4.25',
+            'autodocpro_render_seconds_count{doc_type="claim"} 4',
+        ])
+
+    def test_timer_labels_can_be_completed_in_block(self):
+        registry = self.registry()
+        with registry.timer('ai_request_seconds', action='field_help') as labels:
+            labels['status'] = 200
+        self.assertIn('autodocpro_ai_request_seconds_count{action="field_help",status="200"} 1', registry.render())
+
+    def test_label_values_are_escaped(self):
+        registry = self.registry()
+        registry.inc('page_cache_total', page='"каталог"\n')
+        self.assertIn(r'autodocpro_page_cache_total{page="\"каталог\"\n"} 1', registry.render())
+
+    def test_values_are_kept_when_store_is_unavailable(self):
+        registry = self.registry()
+        registry.inc('template_cache_total', result='hit')
+        with mock.patch.object(registry, '_connect', side_effect=sqlite3.OperationalError("database is locked")):
+            registry.flush()
+        self.assertEqual(sum(registry._counters.values()), 1)
+        registry.flush()
+        self.assertEqual(registry._counters, {})
+
+    def test_gauges_are_read_on_render(self):
+        registry = self.registry()
+        state = {'queue': 3}
+        registry.gauge('ai_limiter_queue_depth', lambda: [({}, state['queue'])])
+        registry.gauge('ai_limiter_in_flight', mock.Mock(side_effect=sqlite3.OperationalError("database is locked")))
+        self.assertIn('autodocpro_ai_limiter_queue_depth 3', registry.render())
+        state['queue'] = 0
+        text = registry.render()
+        self.assertIn('autodocpro_ai_limiter_queue_depth 0', text)
+        self.assertNotIn('ai_limiter_in_flight', text)
+
+    def test_disabled_registry_records_nothing(self):
+        registry = self.registry(enabled=False)
+        registry.inc('template_cache_total', result='hit')
+        registry.observe('render_seconds', 0.5)
+        self.assertEqual(registry.render(), '\n')
+
+
+class MetricsSettingsTests(TempStorageMixin, SimpleTestCase):
+
+    def test_registry_follows_shared_store_path(self):
+        self.assertEqual(metrics.path, settings.SHARED_STORE_PATH)
+        with override_settings(METRICS_ENABLED=False):
+            self.assertFalse(metrics.enabled)
+        self.assertTrue(metrics.enabled)
+
+    def test_endpoint_is_limited_to_allowed_addresses(self):
+        metrics.reset()
+        metrics.inc('form_class_cache_total', result='miss')
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('autodocpro_form_class_cache_total{result="miss"} 1', response.content.decode('utf-8'))
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
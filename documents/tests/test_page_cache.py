@@ -0,0 +1,63 @@
+# documents/tests/test_page_cache.py
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from documents.caching import LRUCache
+from documents.catalogue import CatalogueVersion
+from documents.views import page_cache
+from .mixins import TempStorageMixin, make_template
+
+
+class LRUCacheTests(SimpleTestCase):
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_invalidate_by_predicate(self):
+        cache = LRUCache()
+        for key in (('list', 1), ('list', 2), ('home', 1)):
+            cache.set(key, key)
+        self.assertEqual(cache.invalidate(lambda key: key[0] == 'list'), 2)
+        self.assertEqual(len(cache), 1)
+
+
+class CataloguePageCacheTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        page_cache.clear()
+        self.template = make_template('<p></p>', name="Исковое заявление о взыскании долга", doc_type='claim')
+
+    def test_repeated_page_is_served_without_queries(self):
+        first = self.client.get('/templates/')
+        self.assertContains(first, "Исковое заявление о взыскании долга")
+        with self.assertNumQueries(0):
+            second = self.client.get('/templates/')
+        self.assertEqual(second.content, first.content)
+
+    def test_saved_template_changes_version_and_page(self):
+        self.client.get('/templates/')
+        self.template.name = "Исковое заявление о расторжении договора"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.template.save()
+        response = self.client.get('/templates/')
+        self.assertContains(response, "о расторжении договора")
+        self.assertNotContains(response, "о взыскании долга")
+
+    def test_parameters_are_part_of_key(self):
+        self.client.get('/templates/', {'type': 'claim'})
+        response = self.client.get('/templates/', {'type': 'motion'})
+        self.assertNotContains(response, "Исковое заявление")
+
+    def test_other_parameters_bypass_cache(self):
+        self.client.get('/templates/', {'utm_source': 'mail'})
+        self.assertEqual(len(page_cache), 0)
+
+    def test_unavailable_version_bypasses_cache(self):
+        with mock.patch.object(CatalogueVersion, 'get', return_value=None):
+            self.assertEqual(self.client.get('/templates/').status_code, 200)
+        self.assertEqual(len(page_cache), 0)
@@ -0,0 +1,111 @@
+# documents/tests/test_pagination.py
+from django.test import SimpleTestCase, TestCase
+from documents.models import DocumentTemplate
+from documents.pagination import NEXT, PREVIOUS, InvalidCursor, KeysetPaginator, decode_cursor, encode_cursor
+from documents.views import page_cache
+from .mixins import TempStorageMixin
+
+# Одинаковые названия на границах страниц по 3: порядок задает только pk
+NAMES = ["Жалоба", "Иск", "Иск", "Иск", "Иск", "Иск", "Иск", "Отзыв", "Отзыв"]
+
+
+class CursorTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        cursor = encode_cursor(NEXT, ["Исковое заявление", 42])
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor, 2), (NEXT, ["Исковое заявление", 42]))
+
+    def test_malformed_cursors(self):
+        for cursor in ('???', encode_cursor('x', ["Иск", 1]), encode_cursor(NEXT, ["Иск"]),
+                       'bm90IGpzb24'):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                decode_cursor(cursor, 2)
+
+
+class KeysetPaginatorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        DocumentTemplate.objects.bulk_create([
+            DocumentTemplate(name=name, doc_type='claim', category='civil', description='',
+                             template_file=f'templates/keyset_{i}.html')
+            for i, name in enumerate(NAMES)
+        ])
+        cls.expected = list(DocumentTemplate.objects.order_by('name', 'pk').values_list('pk', flat=True))
+
+    def paginator(self, per_page=3):
+        return KeysetPaginator(DocumentTemplate.objects.all(), per_page)
+
+    def pks(self, page):
+        return [template.pk for template in page]
+
+    def test_forward_walk_visits_every_row_once(self):
+        for per_page in (1, 2, 3, 4):
+            with self.subTest(per_page=per_page):
+                paginator, seen, cursor = self.paginator(per_page), [], None
+                while True:
+                    page = paginator.page(cursor)
+                    seen.extend(self.pks(page))
+                    if not page.has_next():
+                        break
+                    cursor = page.next_cursor
+                self.assertEqual(seen, self.expected)
+
+    def test_backward_walk_from_last_page(self):
+        paginator = self.paginator()
+        pages, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            pages.append(self.pks(page))
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        backward = [self.pks(page)]
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            backward.append(self.pks(page))
+        self.assertEqual(backward[::-1], pages)
+        self.assertFalse(paginator.page().has_previous())
+
+    def test_previous_before_first_row_returns_first_page(self):
+        first = DocumentTemplate.objects.order_by('name', 'pk').first()
+        page = self.paginator().page(encode_cursor(PREVIOUS, [first.name, first.pk]))
+        self.assertEqual(self.pks(page), self.expected[:3])
+
+    def test_filtered_queryset(self):
+        paginator = KeysetPaginator(DocumentTemplate.objects.filter(name="Иск"), 4)
+        first = paginator.page()
+        self.assertEqual(self.pks(first), self.expected[1:5])
+        last = paginator.page(first.next_cursor)
+        self.assertEqual(self.pks(last), self.expected[5:7])
+        self.assertFalse(last.has_next())
+
+
+class TemplateListPaginationTests(TempStorageMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        DocumentTemplate.objects.bulk_create([
+            DocumentTemplate(name=f"Иск №{i % 5}", doc_type='claim', category='civil', description='',
+                             template_file=f'templates/keyset_{i}.html')
+            for i in range(15)
+        ])
+
+    def setUp(self):
+        # Страницы каталога других тестов могли попасть в кэш под той же версией каталога
+        page_cache.invalidate(lambda key: True)
+
+    def test_cursor_and_page_number_links(self):
+        first = self.client.get('/templates/')
+        page = first.context['page_obj']
+        self.assertEqual(len(page), 12)
+        second = self.client.get('/templates/', {'cursor': page.next_cursor})
+        names = [template.name for template in first.context['templates']] + \
+                [template.name for template in second.context['templates']]
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(second.context['templates']), 3)
+        self.assertEqual(len(self.client.get('/templates/', {'page': 2}).context['templates']), 3)
+
+    def test_malformed_cursor_is_404(self):
+        self.assertEqual(self.client.get('/templates/', {'cursor': '???'}).status_code, 404)
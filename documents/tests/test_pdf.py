@@ -0,0 +1,31 @@
+# documents/tests/test_pdf.py
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from documents.pdf import get_layout_cache_stats, html_to_pdf, render_pdf
+
+
+@override_settings(PDF_FONT_REGULAR='', PDF_FONT_BOLD='')
+class PdfRenderingTests(SimpleTestCase):
+
+    def test_cyrillic_document_uses_bundled_font(self):
+        pdf = html_to_pdf('<h1>Исковое заявление</h1><p>о взыскании <b>алиментов</b></p>', title='Иск')
+        self.assertTrue(pdf.startswith(b'%PDF-'))
+        self.assertTrue(pdf.rstrip().endswith(b'%%EOF'))
+        self.assertIn(b'/FontFile2', pdf)
+        self.assertIn(b'DejaVuSerif', pdf)
+
+    def test_long_document_is_paginated(self):
+        _, pages = render_pdf(''.join(f'<p>Абзац {i}: доводы истца по делу</p>' for i in range(200)))
+        self.assertGreater(pages, 1)
+
+    def test_repeated_blocks_come_from_layout_cache(self):
+        html = '<p>Прошу суд отложить судебное заседание по делу № А40-1/2024</p>'
+        html_to_pdf(html)
+        hits = get_layout_cache_stats()['hits']
+        html_to_pdf(html)
+        self.assertGreater(get_layout_cache_stats()['hits'], hits)
+
+    @override_settings(PDF_FONT_REGULAR='/nonexistent/font.ttf')
+    def test_missing_configured_font_is_reported(self):
+        with self.assertRaises(ImproperlyConfigured):
+            html_to_pdf('<p>Текст</p>')
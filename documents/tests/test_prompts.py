@@ -0,0 +1,55 @@
+# documents/tests/test_prompts.py
+from types import SimpleNamespace
+from django.test import SimpleTestCase, override_settings
+from django.conf import settings
+from documents.prompts import estimate_tokens, fit_text, grounds_prompt, input_budget, optimize_prompt, share_budget
+
+PARAGRAPHS = [
+    "Арбитражный суд города Москвы, дело № А40-12345/2023.",
+    *[f"Абзац {n} о погоде и прочих обстоятельствах, не относящихся к спору сторон." for n in range(30)],
+    "Суд установил нарушение статьи 310 Гражданского кодекса и взыскал долг по договору займа.",
+    *[f"Абзац {n} с описанием заседания и явки представителей сторон." for n in range(30, 60)],
+    "Решил: иск удовлетворить полностью.",
+]
+DECISION = '\n\n'.join(PARAGRAPHS)
+
+
+class TokenBudgetTests(SimpleTestCase):
+
+    def test_estimate_grows_with_text(self):
+        self.assertEqual(estimate_tokens(''), 0)
+        self.assertLess(estimate_tokens("суд"), estimate_tokens("Арбитражный суд города Москвы"))
+        self.assertEqual(estimate_tokens("..."), 3)
+
+    def test_short_parts_get_what_they_need(self):
+        self.assertEqual(share_budget(100, [10, 500, 500]), [10, 45, 45])
+        self.assertEqual(share_budget(-5, [10]), [0])
+
+    def test_short_text_is_unchanged(self):
+        self.assertEqual(fit_text("Короткий текст.", 100), "Короткий текст.")
+
+    def test_long_text_keeps_edges_and_relevant_paragraphs(self):
+        fitted = fit_text(DECISION, 150, query="нарушение договора займа")
+        self.assertLessEqual(estimate_tokens(fitted), 150)
+        self.assertTrue(fitted.startswith(PARAGRAPHS[0]))
+        self.assertTrue(fitted.endswith(PARAGRAPHS[-1]))
+        self.assertIn(PARAGRAPHS[31], fitted)
+        self.assertIn('[...]', fitted)
+
+    def test_grounds_prompt_fits_budget(self):
+        prompt = grounds_prompt(DECISION, "Ответчик не вернул заем по договору.", 300)
+        self.assertLessEqual(estimate_tokens(prompt), 300)
+        self.assertIn("Ответчик не вернул заем по договору.", prompt)
+
+    def test_optimize_prompt_keeps_text_whole(self):
+        text = "Прошу суд отложить заседание."
+        prompt = optimize_prompt(text, DECISION, 120)
+        self.assertIn(text, prompt)
+        self.assertLessEqual(estimate_tokens(prompt), 120)
+
+    @override_settings(AI_CONFIG={**settings.AI_CONFIG, 'MAX_INPUT_TOKENS': 4000})
+    def test_template_limit_lowers_budget(self):
+        self.assertEqual(input_budget(), 4000)
+        self.assertEqual(input_budget(SimpleNamespace(ai_max_length=1000)), 1000)
+        self.assertEqual(input_budget(SimpleNamespace(ai_max_length=0)), 4000)
+        self.assertEqual(input_budget(SimpleNamespace(ai_max_length=9000)), 4000)
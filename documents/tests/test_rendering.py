@@ -0,0 +1,38 @@
+# documents/tests/test_rendering.py
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from documents.rendering import get_compiled_template, render_document, template_cache
+from .mixins import TempStorageMixin, make_template
+
+
+class CompiledTemplateCacheTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        template_cache.clear()
+        self.template = make_template('<p>{{ court_name }}: {{ motion_type }}</p>')
+
+    def test_compiled_template_is_reused(self):
+        first = get_compiled_template(self.template)
+        self.assertIs(get_compiled_template(self.template), first)
+
+    def test_new_file_is_compiled_again(self):
+        first = get_compiled_template(self.template)
+        self.template.template_file.save('template.html', ContentFile(b'<b>{{ court_name }}</b>'))
+        compiled = get_compiled_template(self.template)
+        self.assertIsNot(compiled, first)
+        self.assertEqual(render_document(self.template, {'court_name': 'Суд'}), '<b>Суд</b>')
+
+    def test_saving_template_drops_its_compiled_versions(self):
+        get_compiled_template(self.template)
+        self.template.save()
+        self.assertFalse(any(key[0] == self.template.pk for key in template_cache._data))
+
+    def test_user_data_overrides_example_context(self):
+        html = render_document(self.template, {'court_name': 'Арбитражный суд'})
+        self.assertEqual(html, '<p>Арбитражный суд: отложении судебного заседания</p>')
+
+    def test_missing_file_is_reported(self):
+        self.template.template_file.delete(save=False)
+        self.template.template_file.name = 'templates/missing.html'
+        with self.assertRaises(FileNotFoundError):
+            get_compiled_template(self.template)
@@ -0,0 +1,81 @@
+# documents/tests/test_search.py
+from django.test import SimpleTestCase, TestCase
+from documents.search import search_index, search_templates, tokenize
+from documents.stemmer import stem
+from .mixins import TempStorageMixin, make_template
+
+
+class StemmerTests(SimpleTestCase):
+
+    def test_word_forms_share_stem(self):
+        for forms in (['иск', 'иска', 'иском'], ['исковое', 'исковые', 'искового'],
+                      ['заявление', 'заявления', 'заявлений'], ['алименты', 'алиментов']):
+            with self.subTest(forms=forms):
+                self.assertEqual(len({stem(form) for form in forms}), 1)
+
+    def test_short_word_stem_is_prefix_of_derived_word(self):
+        self.assertTrue(stem('исковое').startswith(stem('иск')))
+
+    def test_yo_is_folded(self):
+        self.assertEqual(stem('ёлка'), stem('елка'))
+
+    def test_tokenize_skips_stop_words_and_case(self):
+        self.assertEqual(tokenize("Заявление О взыскании и АЛИМЕНТАХ"), ['заявлен', 'взыскан', 'алимент'])
+
+
+class SearchIndexTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        search_index.reset()
+        self.claim = make_template('<p></p>', name="Исковое заявление о взыскании долга", doc_type='claim',
+                                   category='civil', description="Взыскание задолженности по договору займа")
+        self.alimony = make_template('<p></p>', name="Заявление о взыскании алиментов", doc_type='claim',
+                                     category='family', description="Иск о взыскании алиментов на ребенка")
+        self.motion = make_template('<p></p>', name="Ходатайство об отложении", category='civil',
+                                    description="Отложение судебного заседания")
+
+    def search(self, query, **filters):
+        return list(search_templates(query, **filters))
+
+    def test_short_stem_finds_capitalised_derived_word(self):
+        # "иск" в названии одного шаблона ("Исковое") и в описании другого ("Иск")
+        self.assertEqual(self.search("иск"), [self.claim, self.alimony])
+
+    def test_all_query_words_are_required(self):
+        self.assertEqual(self.search("взыскание алименты"), [self.alimony])
+        self.assertEqual(self.search("иск ходатайство"), [])
+
+    def test_name_outweighs_description(self):
+        self.assertEqual(self.search("долг"), [self.claim])
+        self.assertEqual(self.search("договор"), [self.claim])
+        # "взыскании" — в названии обоих: при равном весе — по названию
+        self.assertEqual(self.search("взыскании"), [self.alimony, self.claim])
+
+    def test_stop_words_only_finds_nothing(self):
+        self.assertEqual(self.search("о и на"), [])
+
+    def test_filters(self):
+        self.assertEqual(self.search("заявление", category='family'), [self.alimony])
+        self.motion.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.motion.save()
+        self.assertEqual(self.search("отложение", is_active=True), [])
+        with self.assertRaises(ValueError):
+            search_templates("иск", name="Иск")
+
+    def test_changed_and_deleted_templates_are_reindexed(self):
+        self.assertEqual(self.search("ходатайство"), [self.motion])
+        self.motion.name = "Ходатайство об истребовании доказательств"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.motion.save()
+        self.assertEqual(self.search("истребование"), [self.motion])
+        self.assertEqual(self.search("отложении"), [self.motion])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.claim.delete()
+        self.assertEqual(self.search("иск"), [self.alimony])
+        self.assertEqual(search_index.stats()['templates'], 2)
+
+    def test_list_view_paginates_results(self):
+        response = self.client.get('/templates/', {'q': "взыскание"})
+        self.assertEqual(list(response.context['templates']), [self.alimony, self.claim])
+        self.assertEqual(response.context['search_query'], "взыскание")
@@ -0,0 +1,93 @@
+# documents/tests/test_sharedstore.py
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import mock
+from django.test import SimpleTestCase
+from documents.sharedstore import SharedStore
+
+
+class SharedStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp(prefix='autodocpro-tests-')
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.path = os.path.join(temp_dir, 'store.sqlite3')
+
+    def store(self, **options):
+        return SharedStore(self.path, namespace='test', **options)
+
+    def query(self, sql, *params):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def test_value_is_shared_between_store_objects(self):
+        self.store().set('key', {'answer': "Ответ"})
+        self.assertEqual(self.store().get('key'), {'answer': "Ответ"})
+        self.assertIsNone(SharedStore(self.path, namespace='other').get('key'))
+
+    def test_expired_value_is_served_only_as_stale(self):
+        store = self.store(timeout=10, stale_timeout=60)
+        with mock.patch('documents.sharedstore.time.time', return_value=1000.0):
+            store.set('key', 'value')
+        with mock.patch('documents.sharedstore.time.time', return_value=1030.0):
+            self.assertIsNone(store.get('key'))
+            self.assertEqual(store.get_stale('key'), ('value', True))
+        with mock.patch('documents.sharedstore.time.time', return_value=1080.0):
+            self.assertEqual(store.get_stale('key', 'default'), ('default', False))
+
+    def test_reads_do_not_write(self):
+        store = self.store(flush_interval=3600, touch_interval=3600)
+        store.set('key', 'value')
+        accessed = self.query('SELECT accessed_at FROM entries')
+        for _ in range(5):
+            store.get('key')
+            store.get('missing')
+        self.assertEqual(self.query('SELECT accessed_at FROM entries'), accessed)
+        self.assertEqual(self.query('SELECT COUNT(*) FROM counters'), [(0,)])
+
+    def test_counters_are_flushed_by_stats(self):
+        store = self.store(flush_interval=3600)
+        store.set('key', 'value')
+        store.get('key')
+        store.get('key')
+        store.get('missing')
+        stats = self.store().stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+        stats = store.stats()
+        self.assertEqual((stats['size'], stats['hits'], stats['misses']), (1, 2, 1))
+        self.assertAlmostEqual(stats['hit_rate'], 2 / 3)
+
+    def test_counters_are_flushed_periodically(self):
+        store = self.store(flush_interval=0)
+        store.get('missing')
+        self.assertEqual(self.query("SELECT value FROM counters WHERE name = 'misses'"), [(1,)])
+
+    def test_stale_access_time_is_refreshed(self):
+        store = self.store(touch_interval=60)
+        with mock.patch('documents.sharedstore.time.time', return_value=1000.0):
+            store.set('key', 'value')
+        with mock.patch('documents.sharedstore.time.time', return_value=1030.0):
+            store.get('key')
+        self.assertEqual(self.query('SELECT accessed_at FROM entries'), [(1000.0,)])
+        with mock.patch('documents.sharedstore.time.time', return_value=1070.0):
+            store.get('key')
+        self.assertEqual(self.query('SELECT accessed_at FROM entries'), [(1070.0,)])
+
+    def test_least_recently_read_entries_are_evicted(self):
+        store = self.store(max_entries=2, touch_interval=0)
+        with mock.patch('documents.sharedstore.time.time', side_effect=[1.0, 2.0, 3.0, 4.0]):
+            store.set('a', 1)
+            store.set('b', 2)
+            store.get('a')
+            store.set('c', 3)
+        self.assertEqual((store.get('a'), store.get('b'), store.get('c')), (1, None, 3))
+        self.assertEqual(store.stats()['evictions'], 1)
+
+    def test_add_is_a_lease(self):
+        store = self.store()
+        self.assertTrue(store.add('lock', 'first', timeout=30))
+        self.assertFalse(self.store().add('lock', 'second', timeout=30))
+        store.delete('lock')
+        self.assertTrue(store.add('lock', 'third', timeout=30))
@@ -0,0 +1,113 @@
+# documents/tests/test_singleflight.py
+import asyncio
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.test import SimpleTestCase
+from documents.sharedstore import SharedStore
+from documents.singleflight import SingleFlight, SingleFlightTimeout
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp(prefix='autodocpro-tests-')
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.path = os.path.join(temp_dir, 'store.sqlite3')
+        self.cache = SharedStore(self.path, namespace='cache')
+
+    def single_flight(self, **options):
+        """SingleFlight воркера: у каждого воркера свой объект, блокировки — общие"""
+        return SingleFlight(SharedStore(self.path, namespace='inflight'), poll_interval=0.01, **options)
+
+    def test_concurrent_calls_in_process_share_one_fetch(self):
+        single_flight = self.single_flight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "ответ"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight.do('key', fetch, lambda: None)))
+                   for _ in range(5)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((len(calls), results), (1, ["ответ"] * 5))
+        self.assertEqual(single_flight.stats(), {'executed': 1, 'joined': 4, 'joined_remote': 0})
+
+    def test_other_worker_result_is_taken_from_cache(self):
+        other, single_flight = self.single_flight(), self.single_flight()
+        self.assertTrue(other.locks.add('key', True, timeout=60))
+
+        def finish_other():
+            time.sleep(0.1)
+            self.cache.set('key', "ответ другого воркера")
+            other.locks.delete('key')
+
+        threading.Thread(target=finish_other).start()
+        fetch = mock.Mock()
+        self.assertEqual(single_flight.do('key', fetch, lambda: self.cache.get('key')), "ответ другого воркера")
+        fetch.assert_not_called()
+        self.assertEqual(single_flight.joined_remote, 1)
+
+    def test_failed_remote_call_is_repeated_locally(self):
+        other, single_flight = self.single_flight(), self.single_flight()
+        other.locks.add('key', True, timeout=60)
+        threading.Timer(0.05, other.locks.delete, args=['key']).start()
+        self.assertEqual(single_flight.do('key', lambda: "свой ответ", lambda: None), "свой ответ")
+        self.assertFalse(single_flight.locks.contains('key'))
+
+    def test_follower_gives_up_after_wait_timeout(self):
+        other, single_flight = self.single_flight(), self.single_flight(wait_timeout=0.2)
+        other.locks.add('key', True, timeout=60)
+        fetch = mock.Mock()
+        started = time.monotonic()
+        with self.assertRaises(SingleFlightTimeout):
+            single_flight.do('key', fetch, lambda: None)
+        self.assertLess(time.monotonic() - started, 1)
+        fetch.assert_not_called()
+
+    def test_lock_is_polled_read_only_with_backoff(self):
+        other, single_flight = self.single_flight(), self.single_flight(wait_timeout=0.3)
+        other.locks.add('key', True, timeout=60)
+        with mock.patch.object(single_flight.locks, 'get') as get, \
+                mock.patch.object(single_flight.locks, 'contains', wraps=single_flight.locks.contains) as contains:
+            with self.assertRaises(SingleFlightTimeout):
+                single_flight.do('key', mock.Mock(), lambda: None)
+        get.assert_not_called()
+        # 0.01 + 0.02 + 0.04 + 0.08 + 0.16 > 0.3: не больше шести проверок
+        self.assertLessEqual(contains.call_count, 6)
+        delays = single_flight._poll_delays('key', time.monotonic() + 100)
+        self.assertEqual(list(itertools.islice(delays, 9)), [0.01, 0.02, 0.04, 0.08, 0.16, 0.32, 0.64, 1.0, 1.0])
+
+    def test_async_calls_share_one_fetch(self):
+        single_flight = self.single_flight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "ответ"
+
+        async def lookup():
+            return None
+
+        async def main():
+            return await asyncio.gather(*(single_flight.ado('key', fetch, lookup) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), ["ответ"] * 5)
+        self.assertEqual(len(calls), 1)
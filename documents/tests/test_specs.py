@@ -0,0 +1,47 @@
+# documents/tests/test_specs.py
+from django.test import SimpleTestCase, TestCase
+from documents.specs import TemplateSpec, get_template_spec, spec_cache
+from .mixins import TempStorageMixin, make_template
+
+BLOCKS = [{'id': 'witness', 'title': "Свидетель", 'fields': [{'name': 'name', 'label': "ФИО"}]}]
+
+
+class TemplateSpecTests(SimpleTestCase):
+
+    def test_dynamic_fields_are_derived_from_blocks(self):
+        spec = TemplateSpec(1, 0, [{'name': 'court_name', 'label': "Суд"}], BLOCKS)
+        self.assertEqual([field['name'] for field in spec.form_fields], ['court_name', 'dynamic_witness_name'])
+        self.assertEqual(spec.form_fields[1]['label'], "Свидетель - ФИО")
+        self.assertEqual(spec.block_data({'dynamic_witness_name': "Петров"}), {'witness': {'name': "Петров"}})
+
+    def test_spec_is_immutable(self):
+        spec = TemplateSpec(1, 0, [], [])
+        with self.assertRaises(AttributeError):
+            spec.fields = ()
+
+    def test_schema_may_be_json_string_or_broken(self):
+        template = type('Template', (), {'pk': None, 'fields_schema': '{"fields": [{"name": "a"}]}',
+                                         'dynamic_blocks': '{broken'})()
+        spec = get_template_spec(template)
+        self.assertEqual((len(spec.fields), spec.blocks), (1, ()))
+
+
+class TemplateSpecCacheTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        spec_cache.clear()
+        self.template = make_template('<p></p>', fields_schema={'fields': [{'name': 'court_name'}]},
+                                      dynamic_blocks=BLOCKS)
+
+    def test_spec_is_parsed_once_per_revision(self):
+        spec = get_template_spec(self.template)
+        self.assertIs(get_template_spec(self.template), spec)
+
+    def test_new_revision_replaces_cached_spec(self):
+        old = get_template_spec(self.template)
+        self.template.fields_schema = {'fields': []}
+        self.template.save()
+        spec = get_template_spec(self.template)
+        self.assertIsNot(spec, old)
+        self.assertEqual(spec.fields, ())
+        self.assertEqual(list(spec_cache._data), [(self.template.pk, self.template.revision)])
@@ -0,0 +1,115 @@
+# documents/tests/test_storage.py
+import hashlib
+import os
+from io import StringIO
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from documents.models import DocumentTemplate, TemplateVersion
+from documents.storage import file_hash, hash_from_name, hashed_name, template_storage
+from .mixins import TempStorageMixin, make_template
+
+BODY = b'<p>{{ court_name }}</p>'
+DIGEST = hashlib.sha256(BODY).hexdigest()
+
+
+class HashedNameTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        name = hashed_name('templates/Иск.HTML', DIGEST)
+        self.assertEqual(name, f'templates/{DIGEST[:2]}/{DIGEST}.html')
+        self.assertEqual(hash_from_name(name), DIGEST)
+
+    def test_legacy_names_have_no_hash(self):
+        for name in ('templates/template.html', f'templates/{DIGEST}.html', f'templates/zz/{DIGEST}.html', '', None):
+            with self.subTest(name=name):
+                self.assertIsNone(hash_from_name(name))
+
+
+class ContentAddressedStorageTests(TempStorageMixin, SimpleTestCase):
+
+    def test_same_content_is_stored_once(self):
+        first = template_storage.save('templates/claim.html', ContentFile(BODY))
+        second = template_storage.save('templates/other.html', ContentFile(BODY))
+        self.assertEqual(first, second)
+        self.assertEqual(hash_from_name(first), DIGEST)
+        self.assertEqual(template_storage.listdir(f'templates/{DIGEST[:2]}')[1], [f'{DIGEST}.html'])
+        self.assertNotEqual(template_storage.save('templates/claim.html', ContentFile(b'<p></p>')), first)
+
+
+class TemplateVersionTests(TempStorageMixin, TestCase):
+
+    def setUp(self):
+        self.template = make_template(BODY.decode('utf-8'))
+
+    def test_file_hash(self):
+        self.assertEqual(self.template.content_hash, DIGEST)
+        self.assertEqual(file_hash(self.template.template_file), DIGEST)
+        self.assertEqual(self.template.get_file_version(), DIGEST)
+
+    def test_version_is_recorded_only_on_content_change(self):
+        self.template.name = "Ходатайство об отложении"
+        self.template.save()
+        self.assertEqual(list(self.template.versions.values_list('number', 'content_hash')), [(1, DIGEST)])
+        self.template.template_file.save('template.html', ContentFile(b'<p>v2</p>'), save=False)
+        self.template.save()
+        first, second = self.template.versions.order_by('number')
+        self.assertEqual(second.number, 2)
+        self.assertEqual(second.file.name, self.template.template_file.name)
+        # Файл первой версии не перезаписан
+        self.assertEqual(first.file.read(), BODY)
+
+    def test_version_is_immutable(self):
+        version = self.template.versions.get()
+        with self.assertRaises(ValidationError):
+            version.save()
+
+
+class DedupeTemplateFilesTests(TempStorageMixin, TestCase):
+
+    def legacy(self, name, body=BODY):
+        """Шаблон с файлом, загруженным до хранения по хэшу"""
+        path = os.path.join(settings.MEDIA_ROOT, 'templates', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(body)
+        return DocumentTemplate.objects.bulk_create([
+            DocumentTemplate(name=name, doc_type='claim', category='civil', description='',
+                             template_file=f'templates/{name}')
+        ])[0]
+
+    def dedupe(self, *args):
+        out = StringIO()
+        call_command('dedupe_template_files', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_legacy_files_are_moved_and_merged(self):
+        first, second = self.legacy('claim.html'), self.legacy('claim_copy.html')
+        missing, = DocumentTemplate.objects.bulk_create([
+            DocumentTemplate(name="Без файла", doc_type='claim', description='', template_file='templates/missing.html')
+        ])
+        self.assertIn("Шаблонов переведено на хранение по хэшу: 2, файлов без шаблона найдено: 2",
+                      self.dedupe())
+        name = hashed_name('templates/claim.html', DIGEST)
+        for template in (first, second):
+            template.refresh_from_db()
+            self.assertEqual((template.template_file.name, template.content_hash), (name, DIGEST))
+            self.assertEqual(list(template.versions.values_list('number', 'file')), [(1, name)])
+        missing.refresh_from_db()
+        self.assertEqual(missing.template_file.name, 'templates/missing.html')
+        # Прежние файлы остаются до --delete-orphans
+        self.assertIn("Шаблонов переведено на хранение по хэшу: 0, файлов без шаблона удалено: 2",
+                      self.dedupe('--delete-orphans'))
+        self.assertFalse(template_storage.exists('templates/claim.html'))
+        self.assertTrue(template_storage.exists(name))
+
+    def test_dry_run_changes_nothing(self):
+        template = self.legacy('claim.html')
+        output = self.dedupe('--dry-run', '--delete-orphans')
+        self.assertIn("Шаблонов переведено на хранение по хэшу: 1, файлов без шаблона найдено: 0", output)
+        template.refresh_from_db()
+        self.assertEqual((template.template_file.name, template.content_hash), ('templates/claim.html', ''))
+        self.assertFalse(TemplateVersion.objects.exists())
+        self.assertEqual(template_storage.listdir('templates'), ([], ['claim.html']))
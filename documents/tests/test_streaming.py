@@ -0,0 +1,105 @@
+# documents/tests/test_streaming.py
+import json
+from django.test import SimpleTestCase, TestCase, override_settings
+from documents.clients import aclose_async_client
+from documents.services import ChatStream
+from .mixins import TempStorageMixin
+from .stubserver import StubServer, chunked, reply
+
+GROUNDS = {'action': 'generate_grounds', 'decision_text': "Решение суда", 'case_details': "Детали дела"}
+
+
+def sse_lines(*texts):
+    """Строки потока chat/completions: фрагменты текста, finish_reason и [DONE]"""
+    chunks = [{'choices': [{'delta': {'content': text}, 'finish_reason': None}]} for text in texts]
+    chunks.append({'choices': [{'delta': {}, 'finish_reason': 'stop'}],
+                   'usage': {'prompt_tokens': 10, 'completion_tokens': len(texts)}})
+    return [f"data: {json.dumps(chunk, ensure_ascii=False)}" for chunk in chunks] + ["data: [DONE]"]
+
+
+def sse(*texts):
+    """Потоковый ответ stub-сервера, по фрагменту chunked на строку"""
+    return chunked(*(f"{line}\n\n".encode('utf-8') for line in sse_lines(*texts)))
+
+
+def events(content):
+    """События SSE ответа: список (event, data)"""
+    parsed = []
+    for block in content.decode('utf-8').strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        parsed.append((fields['event'], json.loads(fields['data'])))
+    return parsed
+
+
+class ChatStreamTests(SimpleTestCase):
+
+    def test_stream_is_assembled_into_completion(self):
+        stream = ChatStream()
+        texts = [stream.feed(line) for line in sse_lines("Основание", " первое")]
+        self.assertEqual([text for text in texts if text], ["Основание", " первое"])
+        self.assertTrue(stream.complete)
+        result = stream.result()
+        self.assertEqual(result['choices'][0]['message']['content'], "Основание первое")
+        self.assertEqual(result['usage']['completion_tokens'], 2)
+
+    def test_cut_stream_is_not_complete(self):
+        stream = ChatStream()
+        stream.feed('data: {"choices": [{"delta": {"content": "Осно"}, "finish_reason": null}]}')
+        self.assertFalse(stream.complete)
+
+
+class StreamingViewTests(TempStorageMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StubServer()
+        cls.addClassCleanup(cls.server.close)
+        overrides = override_settings(
+            DEEPSEEK_API_URL=cls.server.url, DEEPSEEK_MAX_RETRIES=0,
+            AI_LIMITER_ENABLED=False, AI_HISTORY_BUFFERED=False,
+        )
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+
+    def post(self, data, path='/api/ai/', stream=True):
+        headers = {'HTTP_ACCEPT': 'text/event-stream'} if stream else {}
+        return self.client.post(path, json.dumps(data), content_type='application/json', **headers)
+
+    def test_tokens_are_streamed_and_answer_cached(self):
+        self.server.respond(sse("Первое основание", "; второе"))
+        response = self.post(GROUNDS)
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        received = events(b''.join(response.streaming_content))
+        self.assertEqual(received[:2], [('token', {'text': "Первое основание"}), ('token', {'text': "; второе"})])
+        self.assertEqual(received[-1][0], 'done')
+        self.assertEqual(received[-1][1]['grounds'], "Первое основание; второе")
+        self.assertTrue(self.server.requests[0]['body']['stream'])
+
+        repeated = events(b''.join(self.post(GROUNDS).streaming_content))
+        self.assertEqual(repeated[0], ('token', {'text': "Первое основание; второе"}))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_error_before_first_token_is_plain_json(self):
+        self.server.respond(reply(400, body={'error': {'message': "Неверный запрос"}}))
+        response = self.post({**GROUNDS, 'decision_text': "Другое решение"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'error')
+
+    def test_without_event_stream_accept_answer_is_json(self):
+        self.server.respond(reply(body={'choices': [{'message': {'content': "Основание"}}]}))
+        response = self.post({**GROUNDS, 'case_details': "Без потока"}, stream=False)
+        self.assertEqual(response.json()['grounds'], "Основание")
+        self.assertNotIn('stream', self.server.requests[0]['body'])
+
+    async def test_async_path_streams_tokens(self):
+        self.server.respond(sse("Асинхронное", " основание"))
+        response = await self.async_client.post(
+            '/api/ai/async/', json.dumps({**GROUNDS, 'case_details': "ASGI"}),
+            content_type='application/json', headers={'Accept': 'text/event-stream'},
+        )
+        content = b''.join([part async for part in response.streaming_content])
+        await aclose_async_client()
+        received = events(content)
+        self.assertEqual([data['text'] for event, data in received if event == 'token'], ["Асинхронное", " основание"])
+        self.assertEqual(received[-1][1]['grounds'], "Асинхронное основание")
@@ -1,11 +1,17 @@
 # documents/utils.py
-from django.http import HttpResponse
+from .pdf import html_to_pdf
+
 
 def render_document_to_pdf(html_content, filename):
     """
-    Заглушка для генерации PDF (реальная реализация требует дополнительных библиотек)
+    Генерация PDF из HTML документа
+    :param html_content: str - HTML документа
+    :param filename: str - название документа (заголовок PDF)
+    :return: bytes - содержимое PDF-файла
     """
-    return HttpResponse(
-        "PDF generation is not implemented yet. Would generate PDF from:\n\n" + html_content,
-        content_type='text/plain'
-    )
\ No newline at end of file
+    return html_to_pdf(html_content, title=filename)
+
+
+def get_pdf_filename(template):
+    """Имя PDF-файла для скачивания документа по шаблону"""
+    return f"{template.doc_type}_{template.pk}.pdf"
@@ -1,78 +1,49 @@
 # documents/views.py
+import asyncio
+import hashlib
 import json
 import logging
+import math
 import os
+import time
+from collections import namedtuple
 import requests
+from asgiref.sync import sync_to_async
 from django.views import View
-from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
 from django.utils.decorators import method_decorator
+from django.urls import reverse
+from django.views.decorators.cache import cache_control, never_cache
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.views.generic import ListView, DetailView
 from django.shortcuts import get_object_or_404, render
-from django.template import Template, Context
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.contrib import messages
-from .models import DocumentTemplate
+from .breaker import CircuitOpenError
+from .caching import LRUCache
+from .catalogue import get_catalogue_version
+from .fieldhelp import field_help_version, get_template_field_help
+from .generated import get_document
+from .jobs import submit_job
+from .limiter import RateLimitExceeded, limiter_session
+from .metrics import metrics
+from .models import AIJob, DocumentTemplate
+from .pagination import InvalidCursor, KeysetPaginator
 from .forms import DynamicDocumentForm
-from .services import DeepSeekIntegration
-from .utils import render_document_to_pdf
+from .prompts import estimate_tokens, grounds_prompt, input_budget
+from .services import AsyncDeepSeekIntegration, DeepSeekIntegration, chat_completion, token_usage
+from .singleflight import SingleFlightTimeout
+from .bulk import BulkInputError, INPUT_FORMATS, OUTPUT_FORMATS, generate_zip, read_rows
+from .rendering import DOCUMENT_CONTEXTS, build_form_context, get_example, render_document
+from .search import SearchResults, search_templates
+from .specs import get_template_spec
+from .utils import get_pdf_filename, render_document_to_pdf
 
 logger = logging.getLogger(__name__)
 
-# Контекст для примеров документов
-DOCUMENT_CONTEXTS = {
-    'motion': {
-        'court_name': "Московский городской суд",
-        'applicant': {
-            'full_name': "Иванов Иван Иванович",
-            'address': "г. Москва, ул. Примерная, д. 1",
-            'phone': "+7 (999) 123-45-67",
-            'email': "ivanov@example.com"
-        },
-        'motion_type': "отложении судебного заседания",
-        'motion_reason': "Необходимость представления дополнительных доказательств",
-        'current_date': "20.11.2023",
-        'case_number': "А40-12345/2023",
-        'judge_name': "Петрова Мария Ивановна"
-    },
-    'appeal': {
-        'appellate_court': "Московский областной суд",
-        'appellant': {
-            'full_name': "Иванов Иван Иванович",
-            'address': "г. Москва, ул. Примерная, д. 1",
-            'phone': "+7 (999) 123-45-67",
-            'email': "ivanov@example.com"
-        },
-        'decision_date': "15.10.2023",
-        'case_number': "А40-123456/2023",
-        'grounds': ["Нарушение норм материального права", "Несоответствие выводов суда"],
-        'original_court': "Московский городской суд",
-        'original_judge': "Сидоров Алексей Петрович"
-    },
-    'claim': {
-        'court_name': "Московский городской суд",
-        'plaintiff': {
-            'full_name': "Иванов Иван Иванович",
-            'address': "г. Москва, ул. Примерная, д. 1",
-            'phone': "+7 (999) 123-45-67",
-            'email': "ivanov@example.com",
-            'inn': "771234567890"
-        },
-        'defendant': {
-            'full_name': "ООО 'Компания'",
-            'address': "г. Москва, ул. Тестовая, д. 2",
-            'inn': "770987654321"
-        },
-        'claim_amount': "115 000 руб.",
-        'claim_reason': "долга по договору займа",
-        'contract_date': "15.05.2023",
-        'contract_number': "123",
-        'payment_due_date': "15.08.2023"
-    }
-}
-
 class DocumentRenderingMixin:
     """Миксин для рендеринга документов"""
     
@@ -85,26 +56,7 @@ class DocumentRenderingMixin:
         :return: str - отрендеренный документ
         """
         try:
-            # Проверяем существование файла шаблона
-            if not os.path.exists(template.template_file.path):
-                raise FileNotFoundError(f"Файл шаблона не найден: {template.template_file.path}")
-            
-            # Загружаем содержимое шаблона
-            with open(template.template_file.path, 'r', encoding='utf-8') as f:
-                template_content = f.read()
-            
-            # Подготавливаем контекст
-            context = DOCUMENT_CONTEXTS.get(template.doc_type, {}).copy()
-            if context_data:
-                context.update(context_data)
-            
-            # Добавляем общие поля
-            context.update({
-                'current_date': "20.11.2023",  # Фиксированная дата для примера
-            })
-            
-            # Рендерим шаблон
-            rendered_doc = Template(template_content).render(Context(context))
+            rendered_doc = render_document(template, context_data)
             
             if format == 'pdf':
                 return render_document_to_pdf(rendered_doc, template.name)
@@ -118,6 +70,12 @@ class DocumentRenderingMixin:
         """Получение контекста для примера документа"""
         return DOCUMENT_CONTEXTS.get(doc_type, {})
 
+def _session_key(request):
+    """Ключ сессии запроса (сессия создается, если ее еще нет)"""
+    if not request.session.session_key:
+        request.session.save()
+    return request.session.session_key
+
 def document_preview(request, pk):
     """AJAX-представление для предпросмотра документа"""
     if request.method != 'POST':
@@ -164,28 +122,20 @@ class DocumentGenerationView(View, DocumentRenderingMixin):
         template = get_object_or_404(DocumentTemplate, pk=pk)
         form = DynamicDocumentForm(template=template)
         
-        # Рендерим пример документа
+        # Берем заранее отрендеренный пример документа
         try:
-            example_context = self.get_example_context(template.doc_type)
-            rendered_example = self.render_template(template, example_context)
+            rendered_example, example_context_json = get_example(template)
         except Exception as e:
             rendered_example = f"Ошибка генерации примера: {str(e)}"
+            example_context_json = json.dumps(self.get_example_context(template.doc_type), ensure_ascii=False)
             logger.error(f"Ошибка генерации примера: {str(e)}", exc_info=True)
         
-        # Обрабатываем dynamic_blocks (может быть строкой JSON или списком)
-        dynamic_blocks = template.dynamic_blocks
-        if isinstance(dynamic_blocks, str):
-            try:
-                dynamic_blocks = json.loads(dynamic_blocks)
-            except json.JSONDecodeError:
-                dynamic_blocks = []
-        
         context = {
             'template': template,
             'form': form,
             'rendered_example': rendered_example,
-            'example_context': json.dumps(example_context, ensure_ascii=False),
-            'dynamic_blocks': dynamic_blocks
+            'example_context': example_context_json,
+            'dynamic_blocks': get_template_spec(template).blocks
         }
         
         return render(request, 'documents/generate_form.html', context)
@@ -200,36 +150,18 @@ class DocumentGenerationView(View, DocumentRenderingMixin):
             return self.get(request, pk)
         
         try:
-            # Собираем данные из динамических блоков
-            dynamic_data = {}
-            dynamic_blocks = template.dynamic_blocks
-            if isinstance(dynamic_blocks, str):
-                try:
-                    dynamic_blocks = json.loads(dynamic_blocks)
-                except json.JSONDecodeError:
-                    dynamic_blocks = []
+            # Формируем контекст для рендеринга с данными динамических блоков
+            context = build_form_context(template, form.cleaned_data)
             
-            for block in dynamic_blocks:
-                block_data = {}
-                for field in block.get('fields', []):
-                    field_name = f"dynamic_{block['id']}_{field['name']}"
-                    block_data[field['name']] = form.cleaned_data.get(field_name)
-                dynamic_data[block['id']] = block_data
-            
-            # Формируем контекст для рендеринга
-            context = {
-                **form.cleaned_data,
-                'dynamic_blocks': dynamic_data
-            }
-            
-            # Генерируем документ
-            document_content = self.render_template(template, context)
+            # Генерируем документ (повторная отправка той же формы - из хранилища)
+            session_key = _session_key(request)
+            document_content = get_document(template, context, session_key)
             
             # Предлагаем варианты действий
             if 'download_pdf' in request.POST:
-                pdf_content = self.render_template(template, context, format='pdf')
+                pdf_content = get_document(template, context, session_key, format='pdf')
                 response = HttpResponse(pdf_content, content_type='application/pdf')
-                response['Content-Disposition'] = f'attachment; filename="{template.slug}.pdf"'
+                response['Content-Disposition'] = f'attachment; filename="{get_pdf_filename(template)}"'
                 return response
             
             # По умолчанию показываем HTML-версию
@@ -237,7 +169,7 @@ class DocumentGenerationView(View, DocumentRenderingMixin):
                 'template': template,
                 'document_content': document_content,
                 'form_data': context,
-                'dynamic_blocks': dynamic_blocks
+                'dynamic_blocks': get_template_spec(template).blocks
             })
             
         except Exception as e:
@@ -255,33 +187,57 @@ class TemplateDetailView(DetailView, DocumentRenderingMixin):
         context = super().get_context_data(**kwargs)
         template = self.object
         
-        # Обрабатываем dynamic_blocks (может быть строкой JSON или списком)
-        dynamic_blocks = template.dynamic_blocks
-        if isinstance(dynamic_blocks, str):
-            try:
-                dynamic_blocks = json.loads(dynamic_blocks)
-            except json.JSONDecodeError:
-                dynamic_blocks = []
-        
         # Добавляем динамические блоки
-        context['dynamic_blocks'] = dynamic_blocks
+        context['dynamic_blocks'] = get_template_spec(template).blocks
         
         # Добавляем форму для генерации документа
         context['form'] = DynamicDocumentForm(template=template)
         
-        # Генерируем пример документа
+        # Берем заранее отрендеренный пример документа
         try:
-            example_context = self.get_example_context(template.doc_type)
-            context['rendered_example'] = self.render_template(template, example_context)
-            context['example_context'] = json.dumps(example_context, ensure_ascii=False)
+            context['rendered_example'], context['example_context'] = get_example(template)
         except Exception as e:
             context['rendered_example'] = f"Ошибка генерации примера: {str(e)}"
             logger.error(f"Ошибка генерации примера для шаблона {template.id}: {str(e)}")
         
         return context
 
+class EventStreamResponse(StreamingHttpResponse):
+    """
+    Поток событий SSE (text/event-stream).
+    Django не закрывает асинхронный итератор ответа явно; если клиент ушел,
+    не дочитав поток, закрываем его сами, чтобы сразу освободить
+    соединение с DeepSeek API
+    """
+
+    def __init__(self, events):
+        super().__init__(events, content_type='text/event-stream; charset=utf-8')
+        self['Cache-Control'] = 'no-cache'
+        # Не буферизовать ответ на прокси (nginx)
+        self['X-Accel-Buffering'] = 'no'
+
+    async def __aiter__(self):
+        try:
+            async for part in super().__aiter__():
+                yield part
+        finally:
+            if self.is_async:
+                await self._iterator.aclose()
+
+
+class AICall(namedtuple('AICall', 'method kwargs respond error_message streamable action', defaults=(False, ''))):
+    """
+    Вызов DeepSeekIntegration, подготовленный обработчиком действия:
+    имя метода, аргументы, функция формирования ответа и сообщение об ошибке.
+    Один и тот же вызов выполняется синхронно или асинхронно; вызов со
+    streamable=True может отдавать ответ потоком (SSE). action — имя
+    действия запроса (для метрик).
+    """
+
+
 class AIDocumentView(View):
     """Представление для обработки AI-запросов для документов"""
+    integration = DeepSeekIntegration
     
     @method_decorator(csrf_exempt)
     def dispatch(self, *args, **kwargs):
@@ -289,6 +245,78 @@ class AIDocumentView(View):
 
     def post(self, request):
         """Обработка POST-запросов к AI-сервису"""
+        started = time.perf_counter()
+        call = self._prepare_call(request)
+        if isinstance(call, HttpResponse):
+            return call
+        response = self._execute(request, call)
+        self._observe(call, 'sync', response.status_code, started)
+        return response
+
+    def _execute(self, request, call):
+        """Выполняет подготовленный вызов: JSON-ответ или поток SSE"""
+        try:
+            with limiter_session(self._client_key(request)):
+                if self._wants_stream(request, call):
+                    tokens = getattr(self.integration, call.method)(**call.kwargs, stream=True)
+                    # Первый фрагмент ждем до ответа: ошибки API отдаются обычным JSON со статусом
+                    first = next(tokens, '')
+                    return EventStreamResponse(self._stream_events(call, first, tokens))
+                result = getattr(self.integration, call.method)(**call.kwargs)
+            return JsonResponse(call.respond(result))
+        except Exception as e:
+            return self._call_error_response(call, e)
+
+    def _stream_events(self, call, first, tokens):
+        """События SSE: token — очередной фрагмент, done — итоговый ответ, error — ошибка"""
+        parts = [first]
+        try:
+            if first:
+                yield self._sse('token', {'text': first})
+            for text in tokens:
+                parts.append(text)
+                yield self._sse('token', {'text': text})
+        except Exception as e:
+            logger.error(f"{call.error_message}: {e!r}", exc_info=e)
+            yield self._sse('error', {'status': 'error', 'message': call.error_message})
+            return
+        finally:
+            # Клиент мог уйти, не дочитав поток: освобождаем соединение с API
+            tokens.close()
+        yield self._sse('done', call.respond(chat_completion(''.join(parts))))
+
+    @staticmethod
+    def _observe(call, mode, status, started):
+        """Метрики выполненного действия AI"""
+        metrics.inc('ai_requests_total', action=call.action, mode=mode, status=status)
+        metrics.observe('ai_request_seconds', time.perf_counter() - started, action=call.action, mode=mode)
+
+    @staticmethod
+    def _client_key(request):
+        """Ключ квоты запросов к AI: пользователь, сессия или IP-адрес"""
+        if request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        if request.session.session_key:
+            return f"session:{request.session.session_key}"
+        return f"ip:{request.META.get('REMOTE_ADDR')}"
+
+    @staticmethod
+    def _wants_stream(request, call):
+        return call.streamable and 'text/event-stream' in request.headers.get('Accept', '')
+
+    @staticmethod
+    def _sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def get_handlers(self):
+        return {
+            'field_help': self._handle_field_help,
+            'optimize_appeal': self._handle_optimize_appeal,
+            'generate_grounds': self._handle_generate_grounds
+        }
+
+    def _prepare_call(self, request):
+        """Разбор и проверка запроса: AICall или JsonResponse с ошибкой"""
         logger.info("Получен запрос к AI-сервису")
         
         try:
@@ -302,15 +330,7 @@ class AIDocumentView(View):
                     status=400
                 )
 
-            handlers = {
-                'field_help': self._handle_field_help,
-                'generate_section': self._handle_generate_section,
-                'check_contradictions': self._handle_check_contradictions,
-                'analyze_document': self._handle_analyze_document,
-                'suggest_improvements': self._handle_suggest_improvements,
-                'optimize_appeal': self._handle_optimize_appeal,
-                'generate_grounds': self._handle_generate_grounds
-            }
+            handlers = self.get_handlers()
 
             if action not in handlers:
                 logger.error(f"Неизвестное действие: {action}")
@@ -319,7 +339,10 @@ class AIDocumentView(View):
                     status=400
                 )
 
-            return handlers[action](data)
+            call = handlers[action](data)._replace(action=action)
+            if data.get('background') in (True, 'true', '1'):
+                return self._submit_job(request, action, data)
+            return call
 
         except json.JSONDecodeError:
             logger.error("Ошибка декодирования JSON")
@@ -350,53 +373,97 @@ class AIDocumentView(View):
                 status=500
             )
 
+    def _submit_job(self, request, action, data):
+        """Ставит проверенное действие в очередь фоновых заданий: 202 и id задания"""
+        job = submit_job(
+            action,
+            {key: value for key, value in data.items() if key != 'background'},
+            self._client_key(request)
+        )
+        logger.info(f"Действие {action} поставлено в очередь: задание {job.pk}")
+        return JsonResponse(
+            {
+                'status': 'success',
+                'job': job.as_dict(),
+                'status_url': reverse('ai_job', kwargs={'job_id': job.pk})
+            },
+            status=202
+        )
+
+    def _call_error_response(self, call, error):
+        """Ответ при ошибке вызова API"""
+        if isinstance(error, (RateLimitExceeded, CircuitOpenError, SingleFlightTimeout)):
+            logger.warning(f"Запрос к API отклонен ({call.method}): {str(error)}")
+            response = JsonResponse(
+                {'status': 'error', 'message': str(error)},
+                status=429 if isinstance(error, RateLimitExceeded) else 503
+            )
+            if error.retry_after:
+                response['Retry-After'] = str(math.ceil(error.retry_after))
+            return response
+        if isinstance(error, requests.exceptions.HTTPError):
+            status_code = error.response.status_code
+            error_msg = self._get_api_error_message(error)
+            logger.error(f"Ошибка API ({call.method}): {error_msg}")
+            return JsonResponse(
+                {
+                    'status': 'error',
+                    'message': f'Ошибка API: {error_msg}',
+                    'api_status_code': status_code
+                },
+                status=502 if status_code >= 500 else 400
+            )
+        logger.error(f"{call.error_message}: {error!r}", exc_info=error)
+        return JsonResponse({
+            'status': 'error',
+            'message': call.error_message
+        }, status=500)
+
     def _handle_optimize_appeal(self, data):
         """Обработка оптимизации апелляционной жалобы"""
         self._validate_required_fields(data, ['text', 'context'])
-        
-        try:
-            result = DeepSeekIntegration.optimize_text(
-                data['text'],
-                data['context']
+        budget = input_budget(self._get_optional_template(data))
+
+        # Текст улучшается целиком, сокращать можно только контекст
+        text_tokens = estimate_tokens(data['text'])
+        if text_tokens > budget:
+            raise ValidationError(
+                f"Текст слишком длинный для оптимизации: около {text_tokens} токенов при лимите {budget}"
             )
-            
-            return JsonResponse({
+        
+        return AICall(
+            'optimize_text',
+            {'text': data['text'], 'context': data['context'], 'max_input_tokens': budget},
+            lambda result: {
                 'status': 'success',
-                'optimized_text': result['choices'][0]['message']['content']
-            })
-            
-        except Exception as e:
-            logger.error(f"Optimization error: {str(e)}", exc_info=True)
-            return JsonResponse({
-                'status': 'error',
-                'message': 'Ошибка оптимизации текста'
-            }, status=500)
+                'optimized_text': result['choices'][0]['message']['content'],
+                'usage': token_usage(result)
+            },
+            'Ошибка оптимизации текста',
+            streamable=True
+        )
 
     def _handle_generate_grounds(self, data):
         """Генерация оснований для апелляции"""
         self._validate_required_fields(data, ['decision_text', 'case_details'])
         
-        prompt = f"""Сгенерируйте юридические основания для апелляции на решение:
-{data['decision_text']}
-
-Детали дела:
-{data['case_details']}
-"""
-        try:
-            result = DeepSeekIntegration.generate_text(prompt)
-            grounds = self._extract_grounds_from_response(result)
-            
-            return JsonResponse({
+        # Длинные решение и детали дела сокращаются до бюджета токенов
+        prompt = grounds_prompt(
+            data['decision_text'],
+            data['case_details'],
+            input_budget(self._get_optional_template(data))
+        )
+        return AICall(
+            'generate_text',
+            {'prompt': prompt},
+            lambda result: {
                 'status': 'success',
-                'grounds': grounds
-            })
-            
-        except Exception as e:
-            logger.error(f"Grounds generation error: {str(e)}", exc_info=True)
-            return JsonResponse({
-                'status': 'error',
-                'message': 'Ошибка генерации оснований'
-            }, status=500)
+                'grounds': self._extract_grounds_from_response(result),
+                'usage': token_usage(result)
+            },
+            'Ошибка генерации оснований',
+            streamable=True
+        )
 
     def _extract_grounds_from_response(self, response):
         """Извлечение структурированных оснований из ответа AI"""
@@ -412,43 +479,19 @@ class AIDocumentView(View):
         template = self._get_template(data['template_id'])
         field_meta = self._get_field_metadata(template, data['field'])
         
-        try:
-            result = DeepSeekIntegration.get_field_help(
-                template=template,
-                field_meta=field_meta,
-                current_value=data.get('value', ''),
-                user_context=data.get('context', {})
-            )
-            
-            return JsonResponse({
+        return AICall(
+            'get_field_help',
+            # Справка зависит только от шаблона и описания поля: берется из индекса FieldHelp
+            {'template': template, 'field_meta': field_meta},
+            lambda result: {
                 'status': 'success',
                 'help_text': result.get('help_text', ''),
                 'examples': result.get('examples', []),
                 'common_mistakes': result.get('common_mistakes', []),
                 'legal_references': result.get('legal_references', [])
-            })
-            
-        except requests.exceptions.HTTPError as e:
-            status_code = e.response.status_code
-            error_msg = self._get_api_error_message(e)
-            logger.error(f"Ошибка API при запросе справки: {error_msg}")
-            return JsonResponse(
-                {
-                    'status': 'error',
-                    'message': f'Ошибка API: {error_msg}',
-                    'api_status_code': status_code
-                },
-                status=502 if status_code >= 500 else 400
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при запросе справки: {str(e)}", exc_info=True)
-            return JsonResponse(
-                {
-                    'status': 'error',
-                    'message': 'Не удалось получить справку по полю'
-                },
-                status=500
-            )
+            },
+            'Не удалось получить справку по полю'
+        )
 
     def _parse_request_data(self, request):
         """Парсинг данных запроса с обработкой ошибок"""
@@ -477,18 +520,15 @@ class AIDocumentView(View):
             logger.error(error_msg)
             raise ObjectDoesNotExist(error_msg)
 
+    def _get_optional_template(self, data):
+        """Шаблон документа, если запрос передал template_id"""
+        if not data.get('template_id'):
+            return None
+        return self._get_template(data['template_id'])
+
     def _get_field_metadata(self, template, field_name):
         """Получение метаданных поля с обработкой ошибок"""
-        if not hasattr(template, 'fields_schema'):
-            error_msg = "Шаблон не содержит схемы полей"
-            logger.error(error_msg)
-            raise ValidationError(error_msg)
-            
-        field_meta = next(
-            (f for f in template.fields_schema.get('fields', []) 
-             if f['name'] == field_name), 
-            None
-        )
+        field_meta = get_template_spec(template).field_map.get(field_name)
         
         if not field_meta:
             error_msg = f"Поле '{field_name}' не найдено в шаблоне"
@@ -505,7 +545,156 @@ class AIDocumentView(View):
         except:
             return str(http_error)
 
-class HomeView(ListView):
+class AsyncAIDocumentView(AIDocumentView):
+    """
+    Асинхронный вариант AIDocumentView для ASGI-сервера: пока ответ DeepSeek
+    не получен, воркер обслуживает другие запросы
+    """
+    integration = AsyncDeepSeekIntegration
+
+    async def post(self, request):
+        """Обработка POST-запросов к AI-сервису"""
+        started = time.perf_counter()
+        # Разбор запроса обращается к БД (шаблон) — выполняем в потоке
+        call = await sync_to_async(self._prepare_call)(request)
+        if isinstance(call, HttpResponse):
+            return call
+        response = await self._execute(request, call)
+        self._observe(call, 'async', response.status_code, started)
+        return response
+
+    async def _execute(self, request, call):
+        """Асинхронный вариант _execute"""
+        # request.user загружается из БД — в потоке
+        client_key = await sync_to_async(self._client_key)(request)
+        try:
+            with limiter_session(client_key):
+                if self._wants_stream(request, call):
+                    tokens = await getattr(self.integration, call.method)(**call.kwargs, stream=True)
+                    first = await anext(tokens, '')
+                    return EventStreamResponse(self._stream_events(call, first, tokens))
+                result = await getattr(self.integration, call.method)(**call.kwargs)
+            return JsonResponse(call.respond(result))
+        except Exception as e:
+            return self._call_error_response(call, e)
+
+    async def _stream_events(self, call, first, tokens):
+        """Асинхронный вариант событий SSE для ASGI-сервера"""
+        parts = [first]
+        try:
+            if first:
+                yield self._sse('token', {'text': first})
+            async for text in tokens:
+                parts.append(text)
+                yield self._sse('token', {'text': text})
+        except Exception as e:
+            logger.error(f"{call.error_message}: {e!r}", exc_info=e)
+            yield self._sse('error', {'status': 'error', 'message': call.error_message})
+            return
+        finally:
+            await tokens.aclose()
+        yield self._sse('done', call.respond(chat_completion(''.join(parts))))
+
+@never_cache
+@require_GET
+async def ai_job(request, job_id):
+    """
+    Состояние фонового задания AI. С ?wait=N ответ ждет завершения задания
+    до N секунд (не больше AI_JOB_LONG_POLL) — long polling без частых запросов
+    """
+    try:
+        wait = min(max(float(request.GET.get('wait', 0)), 0), settings.AI_JOB_LONG_POLL)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Неверное значение wait'}, status=400)
+
+    deadline = time.monotonic() + wait
+    while True:
+        job = await AIJob.objects.filter(pk=job_id).afirst()
+        if job is None:
+            return JsonResponse({'status': 'error', 'message': 'Задание не найдено'}, status=404)
+        if job.is_finished or time.monotonic() >= deadline:
+            return JsonResponse({'status': 'success', 'job': job.as_dict()})
+        await asyncio.sleep(settings.AI_JOB_POLL_INTERVAL)
+
+def _field_help_etag(request, pk):
+    template = DocumentTemplate.objects.filter(pk=pk, is_active=True).first()
+    if template is None:
+        return None
+    version = f"{field_help_version(template)}|{request.GET.get('fields', '')}"
+    return hashlib.sha256(version.encode('utf-8')).hexdigest()[:32]
+
+@require_GET
+@cache_control(public=True, max_age=settings.FIELD_HELP_CACHE_MAX_AGE)
+@condition(etag_func=_field_help_etag)
+def field_help(request, pk):
+    """
+    Справки по всем полям шаблона (или по ?fields=a,b) из индекса FieldHelp одним ответом.
+    ETag зависит от ревизии шаблона и версии справок: повторный запрос
+    страницы получает 304 без тела
+    """
+    template = get_object_or_404(DocumentTemplate, pk=pk, is_active=True)
+    names = request.GET.get('fields')
+    help_by_field, missing = get_template_field_help(
+        template, set(filter(None, names.split(','))) if names else None
+    )
+    return JsonResponse({
+        'status': 'success',
+        'template_id': template.pk,
+        'fields': help_by_field,
+        'missing': missing
+    })
+
+@never_cache
+@require_GET
+def prometheus_metrics(request):
+    """
+    Метрики всех воркеров в текстовом формате Prometheus.
+    Доступны только с адресов METRICS_ALLOWED_IPS (пустой список — всем)
+    """
+    allowed = settings.METRICS_ALLOWED_IPS
+    if allowed and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Готовые страницы каталога. Ключ включает версию каталога, общую для всех
+# воркеров: после сохранения или удаления шаблона старые страницы больше
+# не запрашиваются и вытесняются новыми
+page_cache = LRUCache(maxsize=getattr(settings, 'PAGE_CACHE_SIZE', 256))
+
+class CataloguePageCacheMixin:
+    """
+    Кэширование страницы, одинаковой для всех посетителей и зависящей только
+    от каталога шаблонов и параметров cache_params. Запросы с другими
+    параметрами GET рендерятся без кэша
+    """
+    cache_params = ()
+
+    def get_page_cache_key(self):
+        if set(self.request.GET) - set(self.cache_params):
+            return None
+        # Версия читается до выборки шаблонов: страница не старше версии,
+        # под которой сохраняется
+        version = get_catalogue_version().get()
+        if version is None:
+            return None
+        params = tuple((name, self.request.GET.get(name, '')) for name in self.cache_params)
+        return type(self).__name__, version, params
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_page_cache_key()
+        if key is None:
+            return super().get(request, *args, **kwargs)
+        content = page_cache.get(key)
+        metrics.inc('page_cache_total', view=key[0], result='miss' if content is None else 'hit')
+        if content is not None:
+            return HttpResponse(content)
+        response = super().get(request, *args, **kwargs)
+        response.render()
+        if response.status_code == 200:
+            page_cache.set(key, response.content)
+        return response
+
+class HomeView(CataloguePageCacheMixin, ListView):
     """Главная страница с популярными шаблонами"""
     model = DocumentTemplate
     template_name = "documents/home.html"
@@ -517,89 +706,66 @@ class HomeView(ListView):
         context['document_categories'] = DocumentTemplate.LEGAL_CATEGORIES
         return context
 
-def motion_template(request):
-    """View для шаблона ходатайства"""
-    template = get_object_or_404(DocumentTemplate, doc_type='motion')
-    
-    # Обрабатываем dynamic_blocks (может быть строкой JSON или списком)
-    dynamic_blocks = template.dynamic_blocks
-    if isinstance(dynamic_blocks, str):
-        try:
-            dynamic_blocks = json.loads(dynamic_blocks)
-        except json.JSONDecodeError:
-            dynamic_blocks = []
-    
+def _render_template_form(request, doc_type, page_template):
+    """Страница формы популярного шаблона указанного типа"""
+    template = get_object_or_404(DocumentTemplate, doc_type=doc_type)
     context = {
         'template': template,
         'form': DynamicDocumentForm(template=template),
-        'dynamic_blocks': dynamic_blocks
+        'dynamic_blocks': get_template_spec(template).blocks
     }
-    return render(request, 'documents/motion_form.html', context)
+    return render(request, page_template, context)
+
+def motion_template(request):
+    """View для шаблона ходатайства"""
+    return _render_template_form(request, 'motion', 'documents/motion_form.html')
 
 def appeal_template(request):
     """View для шаблона апелляционной жалобы"""
-    template = get_object_or_404(DocumentTemplate, doc_type='appeal')
-    
-    # Обрабатываем dynamic_blocks (может быть строкой JSON или списком)
-    dynamic_blocks = template.dynamic_blocks
-    if isinstance(dynamic_blocks, str):
-        try:
-            dynamic_blocks = json.loads(dynamic_blocks)
-        except json.JSONDecodeError:
-            dynamic_blocks = []
-    
-    context = {
-        'template': template,
-        'form': DynamicDocumentForm(template=template),
-        'dynamic_blocks': dynamic_blocks
-    }
-    return render(request, 'documents/appeal_form.html', context)
+    return _render_template_form(request, 'appeal', 'documents/appeal_form.html')
 
 def claim_template(request):
     """View для шаблона искового заявления"""
-    template = get_object_or_404(DocumentTemplate, doc_type='claim')
-    
-    # Обрабатываем dynamic_blocks (может быть строкой JSON или списком)
-    dynamic_blocks = template.dynamic_blocks
-    if isinstance(dynamic_blocks, str):
-        try:
-            dynamic_blocks = json.loads(dynamic_blocks)
-        except json.JSONDecodeError:
-            dynamic_blocks = []
-    
-    context = {
-        'template': template,
-        'form': DynamicDocumentForm(template=template),
-        'dynamic_blocks': dynamic_blocks
-    }
-    return render(request, 'documents/claim_form.html', context)
+    return _render_template_form(request, 'claim', 'documents/claim_form.html')
 
-class TemplateListView(ListView):
+class TemplateListView(CataloguePageCacheMixin, ListView):
     """Список шаблонов документов"""
     model = DocumentTemplate
     template_name = "documents/template_list.html"
     context_object_name = "templates"
     paginate_by = 12
+    cache_params = ('category', 'type', 'q', 'page', 'cursor')
 
     def get_queryset(self):
-        queryset = super().get_queryset().filter(is_active=True)
+        filters = {'is_active': True}
         
         # Фильтрация по категории
         category = self.request.GET.get('category')
         if category:
-            queryset = queryset.filter(category=category)
+            filters['category'] = category
         
         # Фильтрация по типу документа
         doc_type = self.request.GET.get('type')
         if doc_type:
-            queryset = queryset.filter(doc_type=doc_type)
+            filters['doc_type'] = doc_type
         
-        # Поиск
+        # Поиск по индексу (название, описание, категория, тип) с учетом словоформ
         search_query = self.request.GET.get('q')
         if search_query:
-            queryset = queryset.filter(name__icontains=search_query)
+            return search_templates(search_query, **filters)
         
-        return queryset.order_by('name')
+        return super().get_queryset().filter(**filters).order_by('name', 'pk')
+
+    def paginate_queryset(self, queryset, page_size):
+        # Результаты поиска и старые ссылки вида ?page=N - по номеру страницы,
+        # остальной каталог - по курсору: глубокие страницы не дольше первой
+        if isinstance(queryset, SearchResults) or self.page_kwarg in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+        try:
+            page = KeysetPaginator(queryset, page_size).page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Неверный курсор страницы")
+        return None, page, page.object_list, page.has_other_pages()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -611,7 +777,7 @@ class TemplateListView(ListView):
         })
         return context
 
-def download_document(request):
+def download_document(request, doc_id=None):
     """Скачивание готового документа (обрабатывает POST с данными документа)"""
     if request.method != 'POST':
         return JsonResponse(
@@ -620,18 +786,17 @@ def download_document(request):
         )
     
     try:
-        template_id = request.POST.get('template_id')
+        template_id = request.POST.get('template_id', doc_id)
         template = get_object_or_404(DocumentTemplate, pk=template_id)
         
-        # Рендерим документ в PDF
-        pdf_content = DocumentRenderingMixin().render_template(
-            template,
-            context_data=request.POST.dict(),
-            format='pdf'
-        )
+        # PDF из хранилища или после рендеринга. CSRF-токен маскируется заново
+        # при каждом запросе и в документ не входит: иначе хэш всегда новый
+        context = request.POST.dict()
+        context.pop('csrfmiddlewaretoken', None)
+        pdf_content = get_document(template, context, _session_key(request), format='pdf')
         
         response = HttpResponse(pdf_content, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{template.slug}.pdf"'
+        response['Content-Disposition'] = f'attachment; filename="{get_pdf_filename(template)}"'
         return response
         
     except Exception as e:
@@ -639,4 +804,41 @@ def download_document(request):
         return JsonResponse({
             'status': 'error',
             'message': f'Ошибка при создании PDF: {str(e)}'
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+def bulk_generate(request, pk):
+    """
+    Пакетная генерация документов из CSV/JSONL (POST multipart: rows, format)
+    Возвращает ZIP-поток с документами и manifest.json с ошибками по строкам
+    """
+    if request.method != 'POST':
+        return JsonResponse(
+            {'status': 'error', 'message': 'Метод не разрешен'}, 
+            status=405
+        )
+
+    template = get_object_or_404(DocumentTemplate, pk=pk)
+    upload = request.FILES.get('rows')
+    if not upload:
+        return JsonResponse(
+            {'status': 'error', 'message': 'Не передан файл с данными (rows)'},
+            status=400
+        )
+
+    output_format = request.POST.get('format', 'pdf')
+    input_format = request.POST.get('input_format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+    if output_format not in OUTPUT_FORMATS or input_format not in INPUT_FORMATS:
+        return JsonResponse(
+            {'status': 'error', 'message': 'Поддерживаются входные форматы csv/jsonl и выходные pdf/html'},
+            status=400
+        )
+
+    try:
+        chunks = generate_zip(template, read_rows(upload, input_format), output_format)
+    except (BulkInputError, FileNotFoundError) as e:
+        logger.error(f"Ошибка пакетной генерации по шаблону {pk}: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    response = StreamingHttpResponse(chunks, content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{template.doc_type}_{template.pk}_bulk.zip"'
+    return response
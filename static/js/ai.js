@@ -13,10 +13,13 @@ class AIDocumentAssistant {
             if (e.key === 'Enter') this.sendAIQuestion();
         });
 
-        // Контекстные подсказки
+        // Контекстные подсказки: справки по всем полям шаблона загружаются один раз,
+        // фокус на поле показывает их без запросов к серверу
+        this.fieldHelp = {};
+        this.loadFieldHelp();
         document.querySelectorAll('.form-control').forEach(field => {
             field.addEventListener('focus', () => {
-                this.fetchContextualAdvice(field.name);
+                this.showContextualAdvice(field.name);
             });
         });
     }
@@ -92,6 +95,95 @@ class AIDocumentAssistant {
         document.querySelector('.ai-loading')?.remove();
     }
 
+    // Потоковый AI-запрос (SSE): onToken получает фрагменты текста по мере генерации,
+    // результат - итоговый ответ сервера (тот же, что без потока)
+    async streamAIAction(payload, onToken, url = '/api/ai/') {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+                'X-CSRFToken': this.getCSRFToken()
+            },
+            body: JSON.stringify(payload)
+        });
+
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!contentType.startsWith('text/event-stream')) {
+            // Ошибка до начала потока или действие без потоковой передачи
+            const data = await response.json();
+            if (!response.ok || data.status !== 'success') {
+                throw new Error(data.message || 'Ошибка сервера');
+            }
+            return data;
+        }
+
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value;
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const raw of events) {
+                const event = this.parseSSEEvent(raw);
+                if (event.type === 'token') {
+                    onToken(event.data.text);
+                } else if (event.type === 'done') {
+                    reader.cancel();
+                    return event.data;
+                } else if (event.type === 'error') {
+                    throw new Error(event.data.message || 'Ошибка сервера');
+                }
+            }
+        }
+        throw new Error('Соединение с сервером прервано');
+    }
+
+    // Долгое AI-действие фоновым заданием: ставим в очередь и ждем результат long polling'ом
+    async runAIJob(payload, url = '/api/ai/') {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': this.getCSRFToken()
+            },
+            body: JSON.stringify({ ...payload, background: true })
+        });
+        const data = await response.json();
+        if (!response.ok || data.status !== 'success') {
+            throw new Error(data.message || 'Ошибка сервера');
+        }
+
+        let job = data.job;
+        while (['queued', 'running'].includes(job.state)) {
+            const poll = await fetch(`${data.status_url}?wait=25`);
+            const state = await poll.json();
+            if (!poll.ok) {
+                throw new Error(state.message || 'Ошибка сервера');
+            }
+            job = state.job;
+        }
+        if (job.state === 'expired') {
+            throw new Error('Задание не выполнено вовремя, повторите запрос');
+        }
+        if (job.result.status !== 'success') {
+            throw new Error(job.result.message || 'Ошибка сервера');
+        }
+        return job.result;
+    }
+
+    parseSSEEvent(raw) {
+        let type = 'message';
+        const data = [];
+        raw.split('\n').forEach(line => {
+            if (line.startsWith('event:')) type = line.slice(6).trim();
+            else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+        });
+        return { type, data: JSON.parse(data.join('\n') || '{}') };
+    }
+
     // Работа с динамическими блоками
     initDynamicBlocks() {
         // Инициализация всех контролов с зависимостями
@@ -191,33 +283,38 @@ class AIDocumentAssistant {
     }
 
     // Контекстные подсказки
-    async fetchContextualAdvice(fieldName) {
+    async loadFieldHelp() {
+        const url = document.getElementById('document-form')?.dataset.fieldHelpUrl;
+        if (!url) return;
+        
         try {
-            const response = await fetch(`/api/ai/field-help/?field=${fieldName}`, {
-                headers: {
-                    'X-CSRFToken': this.getCSRFToken()
-                }
-            });
-            
+            // Ответ кэшируется браузером и перепроверяется по ETag
+            const response = await fetch(url);
             const data = await response.json();
             
             if (data.status === 'success') {
-                const adviceContainer = document.getElementById('contextual-advice');
-                if (adviceContainer) {
-                    adviceContainer.innerHTML = `
-                        <div class="alert alert-info">
-                            <h6>${data.field_label} - советы AI:</h6>
-                            <p>${data.advice}</p>
-                            ${data.examples ? `<small>Примеры: ${data.examples.join(', ')}</small>` : ''}
-                        </div>
-                    `;
-                }
+                this.fieldHelp = data.fields;
             }
         } catch (error) {
-            console.error('Ошибка получения подсказки:', error);
+            console.error('Ошибка загрузки справок по полям:', error);
         }
     }
 
+    showContextualAdvice(fieldName) {
+        const help = this.fieldHelp[fieldName];
+        const adviceContainer = document.getElementById('contextual-advice');
+        if (!help || !adviceContainer) return;
+        
+        const escape = (text) => String(text).replace(/[&<>"']/g, (c) => `&#${c.charCodeAt(0)};`);
+        adviceContainer.innerHTML = `
+            <div class="alert alert-info">
+                <h6>${escape(help.label)} - советы AI:</h6>
+                <p>${escape(help.help_text)}</p>
+                ${help.examples.length ? `<small>Примеры: ${help.examples.map(escape).join(', ')}</small>` : ''}
+            </div>
+        `;
+    }
+
     // Вспомогательные методы
     getCSRFToken() {
         return document.querySelector('[name=csrfmiddlewaretoken]')?.value || '';